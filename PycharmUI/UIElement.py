@@ -4,6 +4,8 @@ from enum import Enum
 
 import pygame
 
+from PycharmUI.textCache import FONTS, TEXT
+
 
 class UIElement(abc.ABC):
 
@@ -15,7 +17,7 @@ class UIElement(abc.ABC):
 
     def __init__(self, pos, size):
         self.rect = pygame.Rect(pos, size)
-        self.base_font = pygame.font.Font(None, 32)
+        self.base_font = FONTS.get(None, 32)
         self.focused = False
         self.clickable = False
         self.draggable = False
@@ -33,6 +35,19 @@ class UIElement(abc.ABC):
     def handle_click(self):
         pass
 
+    def get_draw_rect(self, transform=None):
+        """
+        Get the region the UI element covers on the Surface it is drawn on.
+
+        :param transform:   (Optional) A FieldTransform from the element's coordinates to the Surface's pixels
+        :return:            The element's Rect in the Surface's pixels
+        """
+
+        if transform is None:
+            return self.rect
+
+        return transform.rect(self.rect)
+
     @abc.abstractmethod
     def handle_keypress(self, keypress_event):
         """
@@ -124,27 +139,32 @@ class CheckBox(UIElement):
         # Value parameters
         self.checked = False
 
-    def draw_self(self, surf):
+    def draw_self(self, surf, transform=None):
         """
         Draw the checkbox on the given Surface.
 
-        :param surf:    A pygame Surface on which to draw the checkbox
-        :return:
+        :param surf:        A pygame Surface on which to draw the checkbox
+        :param transform:   (Optional) A FieldTransform from the checkbox's coordinates to the Surface's pixels
+        :return:            The Rect of the Surface that was drawn over
         """
 
+        rect = self.get_draw_rect(transform)
+
         # Draw a rectangle for the checkbox and a black frame around it
         back_color = self.color_unfocused
         if self.focused:
             back_color = self.color_focused
-        pygame.draw.rect(surf, back_color, self.rect)
-        pygame.draw.rect(surf, self.border_color, self.rect, width=2)
+        pygame.draw.rect(surf, back_color, rect)
+        pygame.draw.rect(surf, self.border_color, rect, width=2)
 
         # Make a text label with an X for a checkmark
         if self.checked:
-            text_surface = self.base_font.render('X', True, self.text_color)
+            text_surface = TEXT.render(self.base_font, 'X', self.text_color)
 
             # Render the text on the screen on top of the text box
-            surf.blit(text_surface, (self.rect.x + 5, self.rect.y + 5))
+            surf.blit(text_surface, (rect.x + 5, rect.y + 5))
+
+        return rect.copy()
 
     def handle_click(self):
         self.focus()
@@ -236,33 +256,37 @@ class InputBox(UIElement):
         self.text = ''
         self.placeholder = 'Give me a placeholder'
 
-    def draw_self(self, surf):
+    def draw_self(self, surf, transform=None):
         """
         Draw the input box on the given Surface.
 
-        :param surf:    A pygame Surface on which to draw the input box
-        :return:
+        :param surf:        A pygame Surface on which to draw the input box
+        :param transform:   (Optional) A FieldTransform from the input box's coordinates to the Surface's pixels
+        :return:            The Rect of the Surface that was drawn over
         """
 
         # Make a text label with the input box's placeholder text
-        text_surface = self.base_font.render(self.placeholder, True, self.placeholder_color)
+        text_surface = TEXT.render(self.base_font, self.placeholder, self.placeholder_color)
 
         # If there is text in the input box, replace the placeholder text with it
         if len(self.text) > 0:
-            text_surface = self.base_font.render(self.text, True, self.text_color)
+            text_surface = TEXT.render(self.base_font, self.text, self.text_color)
 
         # Adjust the width of the text box so longer input will not visually overflow
         self.rect.w = max(100, text_surface.get_width() + 10)
+        rect = self.get_draw_rect(transform)
 
         # Draw a rectangle for the input box and a black frame around it
         back_color = self.color_unfocused
         if self.focused:
             back_color = self.color_focused
-        pygame.draw.rect(surf, back_color, self.rect)
-        pygame.draw.rect(surf, self.border_color, self.rect, width=2)
+        pygame.draw.rect(surf, back_color, rect)
+        pygame.draw.rect(surf, self.border_color, rect, width=2)
 
         # Render the text on the screen on top of the input box
-        surf.blit(text_surface, (self.rect.x + 5, self.rect.y + 5))
+        text_rect = surf.blit(text_surface, (rect.x + 5, rect.y + 5))
+
+        return rect.union(text_rect)
 
     def handle_click(self):
         self.focus()
@@ -0,0 +1,137 @@
+import itertools
+from collections import defaultdict
+
+
+class SpatialGrid:
+    """
+    SpatialGrid class
+
+    Uniform grid over the field used to find the UI elements under a point without checking every element. Each element
+    is bucketed into the cells its rect overlaps, and only the elements in the cell under the point are tested.
+
+    Elements are kept in a z order made of a layer and the order in which they were inserted or raised, so hit results
+    can be returned topmost first. Call update() after an element moves or is resized.
+    """
+
+    DEFAULT_CELL_SIZE = 100
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        """
+        :param cell_size:   (Optional) Width and height of a grid cell, in the same units as the element rects
+        """
+
+        self.cell_size = cell_size
+
+        self._cells = defaultdict(set)
+
+        # Element to (rect as last bucketed, cells it is bucketed in, z order key)
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, element):
+        return element in self._entries
+
+    def _cells_for(self, rect):
+        """
+        :param rect:    A (left, top, width, height) rect
+        :return:        A list of the (column, row) cells the rect overlaps
+        """
+
+        left, top, width, height = rect
+        first_column, first_row = left // self.cell_size, top // self.cell_size
+        last_column = max(first_column, (left + width - 1) // self.cell_size)
+        last_row = max(first_row, (top + height - 1) // self.cell_size)
+
+        return [(column, row) for column in range(first_column, last_column + 1)
+                for row in range(first_row, last_row + 1)]
+
+    def insert(self, element, layer=0):
+        """
+        Add an element on top of the others in its layer.
+
+        :param element:     A UIElement
+        :param layer:       (Optional) Elements in higher layers are always above elements in lower layers
+        """
+
+        if element in self._entries:
+            self.remove(element)
+
+        rect = tuple(element.rect)
+        cells = self._cells_for(rect)
+        for cell in cells:
+            self._cells[cell].add(element)
+
+        self._entries[element] = (rect, cells, (layer, next(self._counter)))
+
+    def update(self, element, layer=0):
+        """
+        Re-bucket an element whose rect may have changed, inserting it if it isn't in the grid yet.
+
+        :param element:     A UIElement
+        :param layer:       (Optional) Layer to insert the element in if it isn't in the grid yet
+        """
+
+        entry = self._entries.get(element)
+        if entry is None:
+            self.insert(element, layer)
+            return
+
+        old_rect, old_cells, z = entry
+        rect = tuple(element.rect)
+        if rect == old_rect:
+            return
+
+        cells = self._cells_for(rect)
+        if cells != old_cells:
+            for cell in old_cells:
+                self._discard(cell, element)
+            for cell in cells:
+                self._cells[cell].add(element)
+
+        self._entries[element] = (rect, cells, z)
+
+    def remove(self, element):
+        """
+        :param element:     A UIElement. Elements that aren't in the grid are ignored.
+        """
+
+        entry = self._entries.pop(element, None)
+        if entry is None:
+            return
+
+        for cell in entry[1]:
+            self._discard(cell, element)
+
+    def _discard(self, cell, element):
+        elements = self._cells[cell]
+        elements.discard(element)
+        if not elements:
+            del self._cells[cell]
+
+    def raise_to_top(self, element):
+        """
+        Move an element above the others in its layer.
+
+        :param element:     A UIElement in the grid
+        """
+
+        rect, cells, (layer, _) = self._entries[element]
+        self._entries[element] = (rect, cells, (layer, next(self._counter)))
+
+    def hit(self, point):
+        """
+        Find the elements under a point.
+
+        :param point:   (x, y) in the same units as the element rects
+        :return:        A list of the elements whose rect contains the point, topmost first
+        """
+
+        cell = (int(point[0] // self.cell_size), int(point[1] // self.cell_size))
+
+        hits = [element for element in self._cells.get(cell, ()) if element.rect.collidepoint(point)]
+        hits.sort(key=lambda element: self._entries[element][2], reverse=True)
+
+        return hits
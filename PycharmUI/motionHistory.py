@@ -0,0 +1,115 @@
+from collections import deque
+
+
+class MotionHistory:
+    """
+    MotionHistory class
+
+    Keeps the last few reported positions of each Robot along with the times they were captured, so Robots can be drawn
+    where they were at any moment rather than only where they were last reported.
+
+    Between two reports a Robot's position is interpolated. Past the newest report it is extrapolated from the Robot's
+    most recent velocity, but never further than max_extrapolation_ms, so a Robot that stops being reported coasts to a
+    halt instead of flying off. The velocity is measured over at least min_velocity_ms, so reports that arrive back to
+    back, e.g. a burst from a server that doesn't stamp capture times, don't turn a little noise into a large jump. Drawing Robots delay_ms in the past trades latency for interpolated motion that never
+    overshoots: with a delay of about one camera frame interval, positions are almost always interpolated.
+    """
+
+    def __init__(self, max_samples=8, delay_ms=0, max_extrapolation_ms=100, min_velocity_ms=50):
+        """
+        :param max_samples:             (Optional) Number of reports kept per Robot
+        :param delay_ms:                (Optional) Milliseconds in the past that positions are given for
+        :param max_extrapolation_ms:    (Optional) Milliseconds past the newest report that positions are extrapolated
+                                        for. 0 holds Robots at their newest reported position.
+        :param min_velocity_ms:         (Optional) Shortest time in milliseconds the extrapolation velocity is measured
+                                        over, about one camera frame interval
+        """
+
+        self.max_samples = max_samples
+        self.delay_ms = delay_ms
+        self.max_extrapolation_ms = max_extrapolation_ms
+        self.min_velocity_ms = min_velocity_ms
+
+        # Name to a deque of (capture time, x, y), oldest first
+        self._samples = {}
+
+    def __len__(self):
+        return len(self._samples)
+
+    def __contains__(self, name):
+        return name in self._samples
+
+    def add(self, name, capture_time, pos):
+        """
+        Record a reported position. Reports captured before the newest one already recorded are ignored.
+
+        :param name:            Name of the Robot
+        :param capture_time:    Time in milliseconds the position was captured
+        :param pos:             (x, y) position
+        """
+
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.max_samples)
+        elif capture_time < samples[-1][0]:
+            return
+        elif capture_time == samples[-1][0]:
+            samples.pop()
+
+        samples.append((capture_time, pos[0], pos[1]))
+
+    def remove(self, name):
+        """
+        :param name:    Name of the Robot to forget. Names without any reports are ignored.
+        """
+
+        self._samples.pop(name, None)
+
+    def position(self, name, now):
+        """
+        Get where a Robot was delay_ms before a given time.
+
+        :param name:    Name of the Robot
+        :param now:     Current time in milliseconds
+        :return:        (x, y) position, or None if the Robot has no reports
+        """
+
+        samples = self._samples.get(name)
+        if not samples:
+            return None
+
+        t = now - self.delay_ms
+
+        # Past the newest report, extrapolate from the newest report and the newest one at least min_velocity_ms older,
+        # or the oldest one kept. Reports closer together than that are treated as min_velocity_ms apart.
+        newest_time, newest_x, newest_y = samples[-1]
+        if t >= newest_time:
+            if len(samples) < 2:
+                return newest_x, newest_y
+
+            for i in range(len(samples) - 2, -1, -1):
+                previous_time, previous_x, previous_y = samples[i]
+                if newest_time - previous_time >= self.min_velocity_ms:
+                    break
+
+            interval = max(newest_time - previous_time, self.min_velocity_ms, 1e-9)
+            dt = min(t - newest_time, self.max_extrapolation_ms) / interval
+
+            return newest_x + (newest_x - previous_x) * dt, newest_y + (newest_y - previous_y) * dt
+
+        # Before the oldest report, hold the oldest position
+        oldest_time, oldest_x, oldest_y = samples[0]
+        if t <= oldest_time:
+            return oldest_x, oldest_y
+
+        # Otherwise interpolate between the reports either side, searching from the newest since t is usually recent
+        later_time, later_x, later_y = newest_time, newest_x, newest_y
+        for i in range(len(samples) - 2, -1, -1):
+            earlier_time, earlier_x, earlier_y = samples[i]
+            if earlier_time <= t:
+                f = (t - earlier_time) / (later_time - earlier_time)
+                return earlier_x + (later_x - earlier_x) * f, earlier_y + (later_y - earlier_y) * f
+
+            later_time, later_x, later_y = earlier_time, earlier_x, earlier_y
+
+        return oldest_x, oldest_y
@@ -1,5 +1,6 @@
 from PycharmUI.UIElement import UIElement
-import pygame
+from PycharmUI.spriteCache import SPRITES
+from PycharmUI.textCache import TEXT
 
 
 class Robot(UIElement):
@@ -9,7 +10,14 @@ class Robot(UIElement):
         self.bot_type = bot_type
         self.name = name
 
-        self.image = pygame.transform.scale(pygame.image.load('assets/' + str(self.name) + '.png'), (50, 50))
+        # Opacity from 0 to 255, lowered while a robot that is no longer reported fades out
+        self.alpha = 255
+
+        # Sprites are shared between robots through the process-wide cache, so no disk I/O happens here
+        self.image = SPRITES.get(self.name, (50, 50))
+
+        # The sprite at the size the robot was last drawn at, so the cache is only consulted when the window is resized
+        self._drawn_image = self.image
 
     def handle_click(self):
         pass
@@ -17,15 +25,20 @@ class Robot(UIElement):
     def handle_keypress(self, keypress_event):
         pass
 
-    def draw_self(self, surf):
+    def draw_self(self, surf, transform=None):
         """
         Draw the Robot on the given Surface.
 
-        :param surf:    A pygame Surface on which to draw the Robot
-        :return:
+        :param surf:        A pygame Surface on which to draw the Robot
+        :param transform:   (Optional) A FieldTransform from the Robot's coordinates to the Surface's pixels
+        :return:            The Rect of the Surface that was drawn over
         """
 
-        text_surface = self.base_font.render(self.name, True, self.text_color)
+        rect = self.get_draw_rect(transform)
+        if self._drawn_image.get_size() != rect.size:
+            self._drawn_image = SPRITES.get(self.name, rect.size)
+
+        text_surface = TEXT.render(self.base_font, self.name, self.text_color)
 
         # Draw a rectangle for the input box and a black frame around it
         #back_color = self.color_unfocused
@@ -34,7 +47,18 @@ class Robot(UIElement):
         #pygame.draw.rect(surf, back_color, self.rect)
         #pygame.draw.rect(surf, self.border_color, self.rect, width=2)
 
-        surf.blit(self.image, self.rect)
+        image = self._drawn_image
+
+        # The sprite and label are shared, so fade copies of them rather than the originals
+        if self.alpha < 255:
+            image = image.copy()
+            image.set_alpha(self.alpha)
+            text_surface = text_surface.copy()
+            text_surface.set_alpha(self.alpha)
+
+        image_rect = surf.blit(image, rect)
 
         # Render the text on the screen on top of the input box
-        surf.blit(text_surface, (self.rect.x + 5, self.rect.y + 5))
+        text_rect = surf.blit(text_surface, (rect.x + 5, rect.y + 5))
+
+        return image_rect.union(text_rect)
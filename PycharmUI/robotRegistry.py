@@ -0,0 +1,137 @@
+from PycharmUI.robot import Robot
+
+
+class RobotRegistry:
+    """
+    RobotRegistry class
+
+    Keeps the Robots reported by the camera server keyed by their name, so a reported position is matched to its Robot
+    in constant time. Each Robot's last-seen time is tracked, and Robots that stop being reported are faded out and
+    evicted. Robots are drawn in their own render order, separate from the interactive UI widgets.
+    """
+
+    # What happens to a Robot that hasn't been reported for stale_ms
+    POLICY_EVICT = 'evict'      # Remove it immediately
+    POLICY_FADE = 'fade'        # Fade it out over fade_ms, then remove it
+
+    def __init__(self, stale_ms=2000, policy=POLICY_FADE, fade_ms=1000, robot_size=(50, 50), bot_type='receiver'):
+        """
+        :param stale_ms:    (Optional) Milliseconds a Robot may go unreported before it is faded or evicted. None keeps
+                            every Robot forever.
+        :param policy:      (Optional) POLICY_EVICT or POLICY_FADE
+        :param fade_ms:     (Optional) Milliseconds a stale Robot takes to fade out when using POLICY_FADE
+        :param robot_size:  (Optional) (width, height) of newly created Robots
+        :param bot_type:    (Optional) Type given to newly created Robots
+        """
+
+        self.stale_ms = stale_ms
+        self.policy = policy
+        self.fade_ms = fade_ms
+        self.robot_size = robot_size
+        self.bot_type = bot_type
+
+        self._robots = {}
+        self._last_seen = {}
+
+        # Render order, bottom first
+        self._order = []
+
+    def __len__(self):
+        return len(self._robots)
+
+    def __iter__(self):
+        """
+        Iterate over the Robots in render order, bottom first.
+        """
+
+        return iter(self._order)
+
+    def __contains__(self, name):
+        return name in self._robots
+
+    def get(self, name):
+        """
+        :param name:    Name of the Robot
+        :return:        The Robot, or None if it isn't registered
+        """
+
+        return self._robots.get(name)
+
+    def update(self, name, pos, now):
+        """
+        Record that a Robot was reported at a position, creating it if this is the first time it was seen.
+
+        :param name:    Name of the Robot
+        :param pos:     (x, y) position of the Robot's top left corner
+        :param now:     Current time in milliseconds
+        :return:        The Robot
+        """
+
+        bot = self._robots.get(name)
+        if bot is None:
+            bot = self._robots[name] = Robot(pos, self.robot_size, self.bot_type, name)
+            self._order.append(bot)
+        else:
+            bot.rect.x, bot.rect.y = pos
+
+        bot.alpha = 255
+        self._last_seen[name] = now
+
+        return bot
+
+    def remove(self, name):
+        """
+        :param name:    Name of the Robot to remove. Names that aren't registered are ignored.
+        """
+
+        bot = self._robots.pop(name, None)
+        if bot is not None:
+            del self._last_seen[name]
+            self._order.remove(bot)
+
+    def raise_to_top(self, name):
+        """
+        Move a Robot to the top of the render order.
+
+        :param name:    Name of the Robot
+        """
+
+        bot = self._robots[name]
+        self._order.remove(bot)
+        self._order.append(bot)
+
+    def last_seen(self, name):
+        """
+        :param name:    Name of the Robot
+        :return:        Time in milliseconds the Robot was last reported
+        """
+
+        return self._last_seen[name]
+
+    def expire(self, now):
+        """
+        Fade or evict Robots that haven't been reported recently, according to the policy.
+
+        :param now:     Current time in milliseconds
+        :return:        A list of the evicted Robots
+        """
+
+        if self.stale_ms is None:
+            return []
+
+        evicted = []
+        for name, last_seen in self._last_seen.items():
+            age = now - last_seen - self.stale_ms
+            if age < 0:
+                continue
+
+            if self.policy == self.POLICY_FADE and age < self.fade_ms:
+                self._robots[name].alpha = round(255 * (1 - age / self.fade_ms))
+            else:
+                evicted.append(name)
+
+        evicted_robots = [self._robots[name] for name in evicted]
+        for name in evicted:
+            self.remove(name)
+
+        return evicted_robots
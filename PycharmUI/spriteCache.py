@@ -0,0 +1,122 @@
+import os
+import threading
+
+import pygame
+
+
+class SpriteCache:
+    """
+    SpriteCache class
+
+    Process-wide cache of sprite Surfaces keyed by (asset name, size). Images are read from disk once, either by the
+    background preloader started at startup or on first use, and every scaled copy is converted to the display's pixel
+    format so it blits quickly. Unknown assets get a placeholder sprite instead of raising.
+    """
+
+    _PLACEHOLDER_FILL = pygame.Color(230, 230, 230)
+    _PLACEHOLDER_BORDER = pygame.Color('black')
+
+    def __init__(self, asset_dir):
+        """
+        :param asset_dir:   Folder containing the <name>.png sprite images
+        """
+
+        self.asset_dir = asset_dir
+
+        # Images as loaded from disk, keyed by asset name. None marks an asset that doesn't exist.
+        self._images = {}
+        self._images_lock = threading.Lock()
+
+        # Scaled, display-format sprites keyed by (asset name, size). Only used from the render thread.
+        self._sprites = {}
+
+        self._preloader = None
+
+    def preload(self):
+        """
+        Start loading every image in the asset folder on a background thread, so the first frame a pattern appears in
+        doesn't wait on the disk.
+        """
+
+        if self._preloader is not None:
+            return
+
+        self._preloader = threading.Thread(target=self._preload_all, name='SpritePreloader', daemon=True)
+        self._preloader.start()
+
+    def _preload_all(self):
+        try:
+            file_names = sorted(os.listdir(self.asset_dir))
+        except FileNotFoundError:
+            return
+
+        for file_name in file_names:
+            name, extension = os.path.splitext(file_name)
+            if extension.lower() == '.png':
+                self._load(name)
+
+    def _load(self, name):
+        """
+        Get the image for an asset as loaded from disk, loading it if that hasn't happened yet.
+
+        :param name:    Name of the asset, without the folder or extension
+        :return:        The loaded Surface, or None if there is no such asset
+        """
+
+        with self._images_lock:
+            if name in self._images:
+                return self._images[name]
+
+        path = os.path.join(self.asset_dir, str(name) + '.png')
+        try:
+            image = pygame.image.load(path)
+        except (FileNotFoundError, pygame.error):
+            image = None
+
+        with self._images_lock:
+            return self._images.setdefault(name, image)
+
+    def get(self, name, size):
+        """
+        Get a sprite scaled to the given size.
+
+        :param name:    Name of the asset, without the folder or extension
+        :param size:    (width, height) of the sprite in pixels
+        :return:        A Surface of the given size, converted to the display format when a display is set
+        """
+
+        key = (name, tuple(size))
+
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            image = self._load(name)
+            if image is None:
+                sprite = self._placeholder(key[1])
+            else:
+                sprite = pygame.transform.scale(image, key[1])
+
+            # Conversion needs a display mode to have been set
+            if pygame.display.get_surface() is not None:
+                sprite = sprite.convert_alpha()
+
+            self._sprites[key] = sprite
+
+        return sprite
+
+    def _placeholder(self, size):
+        """
+        :param size:    (width, height) of the sprite in pixels
+        :return:        A Surface standing in for a missing asset
+        """
+
+        sprite = pygame.Surface(size, pygame.SRCALPHA)
+        radius = min(size) // 2
+
+        pygame.draw.circle(sprite, self._PLACEHOLDER_FILL, (size[0] // 2, size[1] // 2), radius)
+        pygame.draw.circle(sprite, self._PLACEHOLDER_BORDER, (size[0] // 2, size[1] // 2), radius, width=2)
+
+        return sprite
+
+
+# Sprite cache shared by every Robot in the process
+SPRITES = SpriteCache('assets')
@@ -0,0 +1,169 @@
+import json
+import os
+from collections import OrderedDict
+
+import pygame
+
+
+class FontRegistry:
+    """
+    FontRegistry class
+
+    Shares Font objects between UI elements, so each (font, size) pair is only loaded once per process.
+
+    Finding an installed font by name makes pygame scan every font on the system the first time, which can take seconds.
+    The files system fonts resolve to are saved to cache_path, so later runs load them directly without scanning. Delete
+    the cache to resolve them again, e.g. after installing a font that was missing.
+    """
+
+    def __init__(self, cache_path=None):
+        """
+        :param cache_path:  (Optional) Path of the JSON file of resolved system font files. None doesn't persist them.
+        """
+
+        self.cache_path = cache_path
+
+        self._fonts = {}
+        self._paths = None
+
+    def get(self, name=None, size=32):
+        """
+        Get a font loaded from a file.
+
+        :param name:    Path of the font file, or None for pygame's default font
+        :param size:    Height of the font in pixels
+        :return:        A shared pygame Font
+        """
+
+        key = ('file', name, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = pygame.font.Font(name, size)
+
+        return font
+
+    def get_sys(self, name, size):
+        """
+        Get a font installed on the system.
+
+        :param name:    Name of the system font
+        :param size:    Height of the font in pixels
+        :return:        A shared pygame Font
+        """
+
+        key = ('sys', name, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._fonts[key] = pygame.font.Font(self.resolve_sys(name), size)
+
+        return font
+
+    def resolve_sys(self, name):
+        """
+        Find the file of an installed font, from the cache when possible.
+
+        :param name:    Name of the system font
+        :return:        Path of the font file, or None for pygame's default font if it isn't installed
+        """
+
+        if self._paths is None:
+            self._paths = self._load_paths()
+
+        if name in self._paths:
+            path = self._paths[name]
+            if path is None or os.path.exists(path):
+                return path
+
+        path = self._paths[name] = pygame.font.match_font(name)
+        self._save_paths()
+
+        return path
+
+    def _load_paths(self):
+        if self.cache_path is None:
+            return {}
+
+        try:
+            with open(self.cache_path) as cache_file:
+                paths = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        return paths if isinstance(paths, dict) else {}
+
+    def _save_paths(self):
+        if self.cache_path is None:
+            return
+
+        # The cache only saves time, so failing to write it isn't an error
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            with open(self.cache_path, 'w') as cache_file:
+                json.dump(self._paths, cache_file, indent=2)
+        except OSError:
+            pass
+
+
+class TextCache:
+    """
+    TextCache class
+
+    Bounded LRU cache of rendered text Surfaces keyed by (font, text, color, antialias). Labels that don't change between
+    frames are rendered once instead of every frame.
+    """
+
+    DEFAULT_MAX_SIZE = 512
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param max_size:    (Optional) Number of rendered Surfaces to keep before the least recently used is dropped
+        """
+
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        """
+        Render text the same way Font.render() does, reusing a previously rendered Surface when possible.
+        The returned Surface is shared and must not be drawn on.
+
+        :param font:        A pygame Font
+        :param text:        The string to render
+        :param color:       A color name, tuple or pygame Color
+        :param antialias:   (Optional) Whether to antialias the text
+        :return:            A Surface with the rendered text
+        """
+
+        # Colors are mutable, so key on their value
+        if isinstance(color, pygame.Color):
+            color = tuple(color)
+
+        key = (font, text, color, antialias)
+
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self._surfaces[key] = font.render(text, antialias, color)
+
+        if len(self._surfaces) > self.max_size:
+            self._surfaces.popitem(last=False)
+
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+
+# Folder of files computed on one run and reused by the next to start faster
+CACHE_FOLDER = '.cache'
+
+# Font registry and text cache shared by every UI element in the process
+FONTS = FontRegistry(os.path.join(CACHE_FOLDER, 'fonts.json'))
+TEXT = TextCache()
@@ -0,0 +1,133 @@
+"""
+Compare the per-frame decode cost of the JSON, framed binary and delta encodings used by CameraClient.
+
+Run from the repository root:
+
+    python benchmarks/decodeBenchmark.py [--robots 3 30 300] [--frames 20000] [--moving 0.2]
+
+The delta encoding's size and decode cost depend on how many robots move between frames, so it is measured over a
+stream of frames in which a --moving fraction of the robots move each frame, averaged over whole keyframe intervals.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cameraProtocol
+
+
+def make_snapshot(num_robots):
+    """
+    Build a snapshot of random robot positions in the same shape the camera server sends.
+
+    :param num_robots:  Number of patterns in the snapshot
+    :return:            A (pattern names, snapshot dict) tuple
+    """
+
+    names = ['P' + str(i) for i in range(num_robots)]
+    return names, {name: [random.uniform(0, 90), random.uniform(0, 46)] for name in names}
+
+
+def make_stream(snapshot, num_snapshots, moving):
+    """
+    Build a stream of snapshots in which some robots move each frame.
+
+    :param snapshot:        The first snapshot
+    :param num_snapshots:   Number of snapshots in the stream
+    :param moving:          Fraction of the robots that move each frame
+    :return:                A list of snapshot dicts
+    """
+
+    stream = [snapshot]
+    num_moving = round(moving * len(snapshot))
+    for _ in range(num_snapshots - 1):
+        snapshot = dict(snapshot)
+        for name in random.sample(list(snapshot), num_moving):
+            x, y = snapshot[name]
+            snapshot[name] = [x + random.uniform(-0.5, 0.5), y + random.uniform(-0.5, 0.5)]
+        stream.append(snapshot)
+
+    return stream
+
+
+def bench(num_robots, num_frames, moving):
+    names, snapshot = make_snapshot(num_robots)
+    pattern_ids = {name: i for i, name in enumerate(names)}
+
+    json_message = json.dumps(snapshot).encode()
+    binary_message = cameraProtocol.encode_points(snapshot, pattern_ids, 0)
+
+    # Two keyframe intervals, so the stream starts over on a keyframe when decoded round and round
+    encoder = cameraProtocol.DeltaEncoder(pattern_ids)
+    stream = make_stream(snapshot, 2 * encoder.keyframe_interval, moving)
+    delta_messages = [encoder.encode(points, sequence, 0.0) for sequence, points in enumerate(stream)]
+    delta_bytes = sum(len(message) for message in delta_messages) / len(delta_messages)
+
+    # Current path: one recv'd packet, decoded to text and parsed
+    def decode_json():
+        return json.loads(json_message.decode())
+
+    # Framed path, including the incremental decoder's buffering
+    decoder = cameraProtocol.FrameDecoder()
+
+    def decode_binary():
+        for _, _, payload in decoder.feed(binary_message):
+            cameraProtocol.decode_points(payload, names)
+
+    # Framed path of the delta encoding, rebuilding the full snapshot from each message in turn
+    delta_decoder = cameraProtocol.DeltaDecoder(names)
+    delta_index = 0
+
+    def decode_delta():
+        nonlocal delta_index
+        message = delta_messages[delta_index]
+        delta_index = (delta_index + 1) % len(delta_messages)
+        for msg_type, sequence, payload in decoder.feed(message):
+            delta_decoder.decode(msg_type, sequence, payload)
+
+    json_time = min(timeit.repeat(decode_json, number=num_frames, repeat=5)) / num_frames
+    binary_time = min(timeit.repeat(decode_binary, number=num_frames, repeat=5)) / num_frames
+    delta_time = min(timeit.repeat(decode_delta, number=num_frames, repeat=5)) / num_frames
+
+    return {
+        'robots': num_robots,
+        'json_bytes': len(json_message),
+        'binary_bytes': len(binary_message),
+        'delta_bytes': delta_bytes,
+        'json_us_per_frame': json_time * 1e6,
+        'binary_us_per_frame': binary_time * 1e6,
+        'delta_us_per_frame': delta_time * 1e6,
+        'speedup': json_time / binary_time,
+        'delta_speedup': json_time / delta_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--robots', type=int, nargs='+', default=[3, 30, 300])
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--moving', type=float, default=0.2, help='Fraction of robots that move each frame')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    results = [bench(num_robots, args.frames, args.moving) for num_robots in args.robots]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'robots':>8} {'json B':>8} {'bin B':>8} {'delta B':>8} {'json us':>10} {'bin us':>10} {'delta us':>10} "
+          f"{'speedup':>8} {'delta x':>8}")
+    for r in results:
+        print(f"{r['robots']:>8} {r['json_bytes']:>8} {r['binary_bytes']:>8} {r['delta_bytes']:>8.0f} "
+              f"{r['json_us_per_frame']:>10.2f} {r['binary_us_per_frame']:>10.2f} {r['delta_us_per_frame']:>10.2f} "
+              f"{r['speedup']:>8.2f} {r['delta_speedup']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Measure the cost of ScanGUI's per-frame render pipeline without a display.
+
+Each configuration runs ScanGUI.render_frame() and the renderer's display update for a number of frames, feeding it a
+scripted stream of robot snapshots at the camera's frame rate and a scripted mouse drag of the cursor. Simulated time
+advances by one display frame per frame, so the robots and the input are the same on every run. Configurations cover
+every combination of robot count, window size and recording on or off.
+
+Run from the repository root:
+
+    python benchmarks/renderBenchmark.py [--robots 3 30 300] [--sizes 1000x500 1920x1080] [--frames 600]
+                                         [--output results.json] [--baseline previous.json]
+
+Frame times are reported as percentiles in milliseconds, and throughput in frames per second. Allocations are measured
+in a separate pass with tracemalloc, since tracing slows every allocation down: the Python memory allocated and not yet
+freed at the peak of each frame, the net number of memory blocks each frame leaves allocated, and the garbage
+collections each frame triggers. Memory allocated by SDL for surfaces is not traced.
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import cameraProtocol
+from cameraSimulator import TRAJECTORY_CIRCLE, TRAJECTORIES, SimulatedRobot
+from fieldRenderer import DirtyRectRenderer
+from frameRecorder import VideoRecorder
+from scanGUI import ScanGUI
+
+
+DEFAULT_ROBOTS = (3, 30, 300)
+DEFAULT_SIZES = ('1000x500', '1920x1080', '640x320')
+
+
+class ScriptedSession:
+    """
+    ScriptedSession class
+
+    The snapshots and input events of one benchmark run, generated frame by frame from simulated time.
+    """
+
+    def __init__(self, num_robots, trajectory, camera_fps, display_fps):
+        """
+        :param num_robots:  Number of robots in each snapshot
+        :param trajectory:  One of cameraSimulator.TRAJECTORIES
+        :param camera_fps:  Snapshots per second
+        :param display_fps: Frames per second of simulated time
+        """
+
+        rng = random.Random(0)
+        patterns = cameraProtocol.DEFAULT_PATTERNS
+        names = [patterns[i] if i < len(patterns) else 'P' + str(i) for i in range(num_robots)]
+        self.robots = [SimulatedRobot(name, trajectory, i, num_robots, rng) for i, name in enumerate(names)]
+
+        self.camera_fps = camera_fps
+        self.display_fps = display_fps
+        self._sequence = 0
+
+    def snapshot(self, frame):
+        """
+        :param frame:   Index of the frame
+        :return:        A cameraProtocol.Snapshot if one arrives during the frame, otherwise None
+        """
+
+        t = frame / self.display_fps
+        if int(t * self.camera_fps) < self._sequence:
+            return None
+
+        snapshot = cameraProtocol.Snapshot(self._sequence, t, {robot.name: robot.position(t) for robot in self.robots})
+        self._sequence += 1
+
+        return snapshot
+
+    @staticmethod
+    def events(frame, gui):
+        """
+        Drag the cursor around in a circle, grabbing it anew every two seconds.
+
+        :param frame:   Index of the frame
+        :param gui:     The ScanGUI, whose cursor and transform the events target
+        :return:        A list of pygame events
+        """
+
+        angle = frame / 30
+        center = gui.transform.point((ScanGUI.SCREEN_WIDTH / 2 + 200 * math.cos(angle),
+                                      ScanGUI.SCREEN_HEIGHT / 2 + 100 * math.sin(angle)))
+        pos = (round(center[0]), round(center[1]))
+
+        if frame % 120 == 0:
+            return [pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=pos),
+                    pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1,
+                                       pos=gui.transform.rect(gui.cursor).center)]
+
+        return [pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(1, 0, 0))]
+
+
+def run_frames(gui, session, num_frames, first_frame, recorder, record_interval):
+    """
+    Run frames of the render pipeline.
+
+    :param gui:             The ScanGUI to render
+    :param session:         The ScriptedSession to take snapshots and events from
+    :param num_frames:      Number of frames to run
+    :param first_frame:     Index of the first frame
+    :param recorder:        A Recorder to submit frames to, or None to not record
+    :param record_interval: Submit every this many frames to the recorder
+    :return:                A list of the wall-clock duration of each frame in seconds
+    """
+
+    frame_times = []
+    for frame in range(first_frame, first_frame + num_frames):
+        events = session.events(frame, gui)
+        snapshot = session.snapshot(frame)
+        now = frame / session.display_fps
+
+        start = time.perf_counter()
+
+        mat = gui.render_frame(events, snapshot, now)
+        gui.renderer.end_frame()
+
+        if recorder is not None and frame % record_interval == 0:
+            recorder.submit(mat, now)
+
+        frame_times.append(time.perf_counter() - start)
+
+    return frame_times
+
+
+def count_collections():
+    """
+    :return:    Number of garbage collections run so far, over all generations
+    """
+
+    return sum(generation['collections'] for generation in gc.get_stats())
+
+
+def bench(num_robots, size, record, num_frames, warmup_frames, alloc_frames, trajectory, camera_fps, record_fps):
+    """
+    Benchmark one configuration.
+
+    :return:    A dict of the configuration and its results
+    """
+
+    gui = ScanGUI(test=True, session_name='benchmark')
+    gui.telemetry = None
+
+    gui.screen = pygame.display.set_mode(size)
+    gui.renderer = DirtyRectRenderer(gui.screen)
+    # Measured without the connection status, which a connected session doesn't show
+    gui.status_text = None
+    gui.render_field()
+
+    session = ScriptedSession(num_robots, trajectory, camera_fps, ScanGUI.SIM_FPS)
+    record_interval = max(1, round(ScanGUI.SIM_FPS / record_fps))
+
+    with tempfile.TemporaryDirectory(prefix='renderBenchmark_') as folder:
+        recorder = None
+        if record:
+            recorder = VideoRecorder(os.path.join(folder, 'benchmark.mp4'), record_fps,
+                                     queue_size=ScanGUI.RECORD_QUEUE_SIZE, policy=ScanGUI.RECORD_QUEUE_POLICY)
+
+        # Let every robot appear and the caches fill before measuring
+        run_frames(gui, session, warmup_frames, 0, recorder, record_interval)
+
+        gc.collect()
+        wall_start = time.perf_counter()
+        frame_times = run_frames(gui, session, num_frames, warmup_frames, recorder, record_interval)
+        wall_time = time.perf_counter() - wall_start
+
+        # Allocation pass, one frame at a time so the peak can be reset between frames
+        tracemalloc.start()
+        collections_start = count_collections()
+        blocks_start = sys.getallocatedblocks()
+
+        peaks = []
+        for frame in range(warmup_frames + num_frames, warmup_frames + num_frames + alloc_frames):
+            tracemalloc.reset_peak()
+            frame_start = tracemalloc.get_traced_memory()[0]
+            run_frames(gui, session, 1, frame, recorder, record_interval)
+            peaks.append(tracemalloc.get_traced_memory()[1] - frame_start)
+
+        blocks_per_frame = (sys.getallocatedblocks() - blocks_start) / alloc_frames
+        collections = count_collections() - collections_start
+        tracemalloc.stop()
+
+        recorder_stats = None
+        if recorder is not None:
+            recorder.close()
+            recorder_stats = recorder.get_stats()
+
+    frame_ms = sorted(t * 1000 for t in frame_times)
+    quantiles = statistics.quantiles(frame_ms, n=100, method='inclusive')
+
+    return {
+        'robots': num_robots,
+        'size': list(size),
+        'record': record,
+        'frames': num_frames,
+        'frame_ms': {
+            'p50': quantiles[49],
+            'p95': quantiles[94],
+            'p99': quantiles[98],
+            'mean': statistics.fmean(frame_ms),
+            'max': frame_ms[-1],
+        },
+        'fps': num_frames / wall_time,
+        'alloc_peak_bytes_per_frame': statistics.fmean(peaks),
+        'alloc_net_blocks_per_frame': blocks_per_frame,
+        'gc_collections_per_frame': collections / alloc_frames,
+        'recorder': recorder_stats,
+    }
+
+
+def config_key(result):
+    return result['robots'], tuple(result['size']), result['record']
+
+
+def compare(results, baseline):
+    """
+    Print how each configuration changed relative to a baseline run.
+
+    :param results:     Results of this run
+    :param baseline:    Results of a previous run, as written by --output
+    """
+
+    previous = {config_key(result): result for result in baseline}
+
+    print()
+    print(f"{'robots':>7} {'size':>10} {'record':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'fps':>8}")
+    for result in results:
+        before = previous.get(config_key(result))
+        if before is None:
+            continue
+
+        changes = [result['frame_ms'][p] / before['frame_ms'][p] - 1 for p in ('p50', 'p95', 'p99')]
+        changes.append(result['fps'] / before['fps'] - 1)
+        size = 'x'.join(str(n) for n in result['size'])
+        print(f"{result['robots']:>7} {size:>10} {str(result['record']):>7} " +
+              ' '.join(f"{change:>+8.1%}" for change in changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--robots', type=int, nargs='+', default=list(DEFAULT_ROBOTS))
+    parser.add_argument('--sizes', nargs='+', default=list(DEFAULT_SIZES), help='WIDTHxHEIGHT window sizes')
+    parser.add_argument('--record', choices=['off', 'on', 'both'], default='both',
+                        help='Run with recording off, on, or both')
+    parser.add_argument('--frames', type=int, default=600, help='Measured frames per configuration')
+    parser.add_argument('--warmup', type=int, default=60, help='Unmeasured frames before measuring')
+    parser.add_argument('--alloc-frames', type=int, default=120, help='Frames in the allocation pass')
+    parser.add_argument('--trajectory', choices=TRAJECTORIES, default=TRAJECTORY_CIRCLE)
+    parser.add_argument('--camera-fps', type=float, default=15, help='Snapshots per second of simulated time')
+    parser.add_argument('--record-fps', type=float, default=30, help='Recorded frames per second of simulated time')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results previously written with --output')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    sizes = [tuple(int(n) for n in size.lower().split('x')) for size in args.sizes]
+    records = {'off': [False], 'on': [True], 'both': [False, True]}[args.record]
+
+    results = []
+    for num_robots in args.robots:
+        for size in sizes:
+            for record in records:
+                results.append(bench(num_robots, size, record, args.frames, args.warmup, args.alloc_frames,
+                                     args.trajectory, args.camera_fps, args.record_fps))
+
+    # The font, text and sprite caches outlive each configuration, so pygame is only shut down once they are done with
+    pygame.quit()
+
+    report = {
+        'python': sys.version.split()[0],
+        'pygame': pygame.version.ver,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'robots':>7} {'size':>10} {'record':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'fps':>8} "
+              f"{'peak B':>9} {'blocks':>7} {'gc':>6}")
+        for r in results:
+            size = 'x'.join(str(n) for n in r['size'])
+            print(f"{r['robots']:>7} {size:>10} {str(r['record']):>7} {r['frame_ms']['p50']:>8.2f} "
+                  f"{r['frame_ms']['p95']:>8.2f} {r['frame_ms']['p99']:>8.2f} {r['fps']:>8.1f} "
+                  f"{r['alloc_peak_bytes_per_frame']:>9.0f} {r['alloc_net_blocks_per_frame']:>7.1f} "
+                  f"{r['gc_collections_per_frame']:>6.2f}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline)['results'])
+
+
+if __name__ == '__main__':
+    main()
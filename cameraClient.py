@@ -1,4 +1,8 @@
-import ast, socket, json
+import ast, errno, ipaddress, json, random, select, socket, threading, time
+from collections import deque
+
+import cameraProtocol
+from traceBuffer import TRACE
 
 
 class CameraClient:
@@ -12,54 +16,502 @@ class CameraClient:
     # Default packet length. Must be the same in the client and server.
     DEFAULT_PACKET_SIZE = 2048
 
-    def __init__(self, test, use_ip):
+    # Encodings this client can decode, most preferred first
+    SUPPORTED_ENCODINGS = (cameraProtocol.ENCODING_DELTA, cameraProtocol.ENCODING_BINARY, cameraProtocol.ENCODING_JSON)
+
+    # Acknowledgement modes this client can use, most preferred first
+    SUPPORTED_ACK_MODES = (cameraProtocol.ACK_CUMULATIVE, cameraProtocol.ACK_NONE, cameraProtocol.ACK_LOCKSTEP)
+
+    # Number of recent snapshots used to estimate the offset between the server's clock and this one
+    CLOCK_SAMPLES = 64
+
+    # Connection states
+    STATE_DISCONNECTED = 'disconnected'     # Waiting for the next connection attempt
+    STATE_RESOLVING = 'resolving'           # Looking up the server's hostname on a background thread
+    STATE_CONNECTING = 'connecting'         # Waiting for the TCP connection to be accepted
+    STATE_HANDSHAKE = 'handshake'           # Waiting for the server's config
+    STATE_CONNECTED = 'connected'
+
+    # Seconds before a connection attempt or handshake is given up on, and before a connected server that has sent
+    # nothing is considered dead
+    CONNECT_TIMEOUT = 2.0
+    HANDSHAKE_TIMEOUT = 2.0
+    RECEIVE_TIMEOUT = 3.0
+
+    # Failed attempts are retried after BACKOFF_BASE seconds, doubling with every further failure up to BACKOFF_MAX. Each
+    # delay is shortened by a random fraction of up to BACKOFF_JITTER, so clients don't retry in lock-step. The first
+    # attempt after losing a connection is made immediately.
+    BACKOFF_BASE = 0.1
+    BACKOFF_MAX = 5.0
+    BACKOFF_JITTER = 0.5
+
+    def __init__(self, test, use_ip, encodings=SUPPORTED_ENCODINGS, ack_modes=SUPPORTED_ACK_MODES, timestamps=True,
+                 host=None, port=None):
         """
         Configure the client for the overhead camera.
+
+        :param test:            Boolean indicator of whether to connect to a server at localhost
+        :param use_ip:          Use the IP address of the server instead of its hostname
+        :param encodings:       (Optional) Encodings to accept from the server, most preferred first
+        :param ack_modes:       (Optional) Acknowledgement modes to accept from the server, most preferred first. Only
+                                used with framed encodings.
+        :param timestamps:      (Optional) Ask servers that support it to stamp snapshots with their capture time
+        :param host:            (Optional) Hostname or address of the server, overriding test and use_ip
+        :param port:            (Optional) Port of the server
         """
 
         # Configure the TCP connection settings
         self._host = self._DEFAULT_HOST
-        if test:
+        if host is not None:
+            self._host = host
+        elif test:
             self._host = self._TEST_HOST
         elif use_ip:
             self._host = self._ALTERNATE_HOST
 
-        self._port = self._PORT
+        self._port = self._PORT if port is None else port
+
+        # Options negotiated with servers on connect
+        self._encodings = encodings
+        self._ack_modes = ack_modes
+        self._request_timestamps = timestamps
+
+        # Seconds spent decoding the most recent snapshot, for profiling
+        self.decode_time = 0.0
+
+        # Connection state machine, advanced by poll_connect()
+        self.state = self.STATE_DISCONNECTED
+        self.config = None
+        self.failed_attempts = 0
+        self.last_error = None
+        self._conn = None
+        self._address = None
+        self._resolved = None
+        self._next_attempt = 0
+        self._deadline = None
+        self._handshake_buffer = b''
+
+        self._reset_session()
+
+    def _reset_session(self):
+        """
+        Forget everything negotiated with the server, ready for a new connection.
+        """
 
         self._packet_size = self.DEFAULT_PACKET_SIZE
 
-        # Open a TCP socket to make the connection
-        self._conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Wire format, negotiated with the server on connect. Servers that don't negotiate only speak JSON.
+        self.encoding = cameraProtocol.ENCODING_JSON
+        self._pattern_names = []
+        self._decoder = cameraProtocol.FrameDecoder()
+        self._pending_frames = deque()
+
+        # State rebuilt from the DELTA encoding's messages, if it was negotiated
+        self._delta = None
+
+        # Bytes received along with the config, which belong to the first message
+        self._leftover = b''
+
+        # Acknowledgement mode, negotiated with the server on connect. Servers that don't negotiate are lock-step.
+        self.ack_mode = cameraProtocol.ACK_LOCKSTEP
+        self._ack_interval = 1
+        self._frames_since_ack = 0
+
+        # Capture timestamps, negotiated with the server on connect. Snapshots from servers that don't stamp them are
+        # numbered here and treated as captured when they were received.
+        self.timestamps = False
+        self._sequence = 0
+        self._clock_offsets = deque(maxlen=self.CLOCK_SAMPLES)
 
     def connect(self):
         """
-        Establish the TCP connection between this client and the server.
-        :return:        Passes a ConnectionRefusedError if the server refuses the connection
+        Establish the TCP connection between this client and the server, waiting until it is established or the attempt
+        fails.
+
+        :return:        The config dict received from the server
+        :raises:        The error the attempt failed with, e.g. ConnectionRefusedError if the server refuses the
+                        connection
+        """
+
+        self._next_attempt = 0
+        while True:
+            state = self.poll_connect()
+
+            if state == self.STATE_CONNECTED:
+                return self.config
+            if state == self.STATE_DISCONNECTED:
+                raise self.last_error
+
+            time.sleep(0.001)
+
+    def poll_connect(self, now=None):
+        """
+        Advance the connection state machine without blocking: start an attempt once its backoff has passed, and check
+        on an attempt in progress. Call regularly, e.g. once a frame, until the state is STATE_CONNECTED.
+
+        :param now:     (Optional) Current time.monotonic()
+        :return:        The connection state
         """
 
-        config_dict = None
+        if now is None:
+            now = time.monotonic()
+
+        try:
+            if self.state == self.STATE_DISCONNECTED and now >= self._next_attempt:
+                self._start_attempt(now)
+
+            if self.state == self.STATE_RESOLVING:
+                self._poll_resolve(now)
+
+            if self.state == self.STATE_CONNECTING:
+                self._poll_connecting(now)
+
+            if self.state == self.STATE_HANDSHAKE:
+                self._poll_handshake(now)
+
+        except (OSError, ValueError, KeyError) as e:
+            self._fail(e, now)
+
+        return self.state
+
+    def _start_attempt(self, now):
+        self._reset_session()
 
+        # Addresses are connected to straight away, hostnames are looked up without blocking the caller first
         try:
-            self._conn.connect((self._host, self._port))
+            ipaddress.ip_address(self._host)
+            self._address = self._host
+        except ValueError:
+            if self._address is None:
+                self._resolved = None
+                threading.Thread(target=self._resolve, name='CameraClientResolver', daemon=True).start()
+                self.state = self.STATE_RESOLVING
+                self._deadline = now + self.CONNECT_TIMEOUT
+                return
+
+        self._open(now)
+
+    def _resolve(self):
+        try:
+            self._resolved = socket.getaddrinfo(self._host, self._port, socket.AF_INET, socket.SOCK_STREAM)[0][4][0]
+        except OSError as e:
+            self._resolved = e
+
+    def _poll_resolve(self, now):
+        resolved = self._resolved
+        if resolved is None:
+            if now >= self._deadline:
+                raise socket.timeout('Timed out looking up ' + self._host)
+            return
+
+        if isinstance(resolved, Exception):
+            raise resolved
+
+        # The address is kept for reconnecting after a lost connection, so that doesn't wait on another lookup
+        self._address = resolved
+        self._open(now)
+
+    def _open(self, now):
+        self._conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._conn.setblocking(False)
+
+        result = self._conn.connect_ex((self._address, self._port))
+        if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            raise OSError(result, 'Could not connect to ' + self._host + ': ' + errno.errorcode.get(result, ''))
+
+        self.state = self.STATE_CONNECTING
+        self._deadline = now + self.CONNECT_TIMEOUT
+
+    def _poll_connecting(self, now):
+        # A failed connect makes the socket writable on most platforms, but exceptional on Windows
+        _, writable, failed = select.select([], [self._conn], [self._conn], 0)
+        if not writable and not failed:
+            if now >= self._deadline:
+                raise socket.timeout('Timed out connecting to ' + self._host)
+            return
+
+        result = self._conn.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if result in (errno.ECONNREFUSED, getattr(errno, 'WSAECONNREFUSED', None)):
+            raise ConnectionRefusedError(result, 'Connection refused by ' + self._host + ':' + str(self._port))
+        if result or failed:
+            raise OSError(result, 'Could not connect to ' + self._host + ': ' + errno.errorcode.get(result, ''))
+
+        self.state = self.STATE_HANDSHAKE
+        self._deadline = now + self.HANDSHAKE_TIMEOUT
+        self._handshake_buffer = b''
+
+    def _poll_handshake(self, now):
+        readable, _, _ = select.select([self._conn], [], [], 0)
+        if readable:
+            data = self._conn.recv(self.DEFAULT_PACKET_SIZE)
+            if not data:
+                raise ConnectionResetError('Connection closed by server during handshake')
+            self._handshake_buffer += data
+
+        # The config may arrive in pieces, or together with the first message
+        try:
+            config_dict, end = json.JSONDecoder().raw_decode(self._handshake_buffer.decode())
+        except (UnicodeDecodeError, ValueError):
+            if now >= self._deadline:
+                raise socket.timeout('Timed out waiting for the config from ' + self._host)
+            return
+
+        self._leftover = self._handshake_buffer.decode()[end:].encode()
+        self._packet_size = config_dict['PACKET_SIZE']
+
+        # Receiving blocks from here on, but a server that goes quiet for too long is treated as gone
+        self._conn.settimeout(self.RECEIVE_TIMEOUT)
+        self._negotiate(config_dict)
+
+        self.config = config_dict
+        self.state = self.STATE_CONNECTED
+        self.failed_attempts = 0
+        self.last_error = None
+
+    def _fail(self, error, now):
+        """
+        Give up on the current attempt and schedule the next one.
+        """
+
+        self._close_socket()
+
+        # The hostname is looked up again by the next attempt, in case the address it was resolved to has gone stale
+        self._address = None
+
+        self.failed_attempts += 1
+        self.last_error = error
+
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (self.failed_attempts - 1))
+        delay *= 1 - random.uniform(0, self.BACKOFF_JITTER)
+
+        self.state = self.STATE_DISCONNECTED
+        self._next_attempt = now + delay
+        TRACE.info('Connection attempt %s to %s failed, retrying in %.2f s: %s', self.failed_attempts, self._host,
+                   delay, error)
+
+    def disconnect(self, error=None):
+        """
+        Drop the connection, e.g. after receiving failed, so poll_connect() reconnects straight away. Must not be called
+        while another thread is receiving.
+
+        :param error:   (Optional) The error that ended the connection, kept in last_error
+        """
+
+        self._close_socket()
+
+        self.state = self.STATE_DISCONNECTED
+        self.last_error = error
+        self.failed_attempts = 0
+        self._next_attempt = 0
+        TRACE.warning('Disconnected from %s: %s', self._host, error)
+
+    def _close_socket(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _negotiate(self, config_dict):
+        """
+        Pick the wire format from the options advertised in the server's config and tell the server which one was
+        picked. Servers that don't advertise any options are left alone.
 
-            # Receive and decode the config settings from the server
-            config_json = self._conn.recv(self.DEFAULT_PACKET_SIZE).decode()
+        :param config_dict:     The config dict received from the server
+        """
+
+        offered = config_dict.get('ENCODINGS')
+        if not offered:
+            return
+
+        self.encoding = next((encoding for encoding in self._encodings if encoding in offered), None)
+        if self.encoding is None:
+            raise ConnectionError('Server offered no supported encoding: ' + str(offered))
+
+        self._pattern_names = config_dict.get('PATTERNS', [])
+        reply = {'ENCODING': self.encoding}
+
+        if self.encoding == cameraProtocol.ENCODING_DELTA:
+            self._delta = cameraProtocol.DeltaDecoder(
+                self._pattern_names, config_dict.get('DELTA_SCALE', cameraProtocol.DEFAULT_DELTA_SCALE))
+
+        if self._request_timestamps and config_dict.get('TIMESTAMPS'):
+            self.timestamps = True
+            reply['TIMESTAMPS'] = True
+
+        # Streaming needs message boundaries, so it is only negotiated for framed encodings
+        offered = config_dict.get('ACK_MODES')
+        if offered and self.encoding != cameraProtocol.ENCODING_JSON:
+            self.ack_mode = next((mode for mode in self._ack_modes if mode in offered), cameraProtocol.ACK_LOCKSTEP)
+            reply['ACK_MODE'] = self.ack_mode
+
+            # Acknowledge every half window so the server never stalls waiting for an ACK in flight
+            window = config_dict.get('ACK_WINDOW', cameraProtocol.DEFAULT_ACK_WINDOW)
+            self._ack_interval = max(1, window // 2)
+
+        self._conn.sendall(cameraProtocol.encode_config(reply))
+
+    def _acknowledge(self, sequence):
+        """
+        Acknowledge a received message according to the negotiated acknowledgement mode.
+
+        :param sequence:    Sequence number of the newest received message
+        """
+
+        if self.ack_mode == cameraProtocol.ACK_LOCKSTEP:
+            self._conn.send('OK'.encode())
+
+        elif self.ack_mode == cameraProtocol.ACK_CUMULATIVE:
+            self._frames_since_ack += 1
+            if self._frames_since_ack >= self._ack_interval:
+                self._conn.sendall(cameraProtocol.encode_frame(cameraProtocol.MSG_ACK, sequence))
+                self._frames_since_ack = 0
+
+    def _receive_frame(self):
+        """
+        Receive the next framed message from the server, reading from the socket only when no complete message is
+        already buffered.
+
+        :return:        A (message type, sequence, payload) tuple
+        """
+
+        while not self._pending_frames:
+            data = self._leftover or self._conn.recv(self._packet_size)
+            self._leftover = b''
+            if not data:
+                raise ConnectionResetError('Connection closed by server')
+
+            self._pending_frames.extend(self._decoder.feed(data))
+
+        return self._pending_frames.popleft()
+
+    def _to_local_time(self, capture_time, receive_time):
+        """
+        Convert a capture time on the server's clock to this machine's clock.
+
+        The clocks' offset is estimated as the smallest difference between receive and capture times among recent
+        snapshots, i.e. from the snapshot that was delayed least. Converted times are therefore early by at most that
+        snapshot's latency, and follow the server's clock drifting.
+
+        :param capture_time:    Capture time of a snapshot in seconds on the server's clock
+        :param receive_time:    Time the snapshot was received in seconds on this machine's clock
+        :return:                The capture time in seconds on this machine's clock
+        """
+
+        self._clock_offsets.append(receive_time - capture_time)
+
+        return capture_time + min(self._clock_offsets)
+
+    def receive_snapshot(self):
+        """
+        Receive a snapshot of robot coordinate points along with its sequence number and the time its camera frame was
+        captured.
+
+        :return:        A cameraProtocol.Snapshot. Its capture_time is in seconds on this machine's clock, comparable
+                        to time.time(). Servers that don't stamp snapshots give the time the snapshot was received.
+        """
+
+        if self.encoding != cameraProtocol.ENCODING_JSON:
+            return self._snapshot_from_frame(self._receive_frame())
+
+        return self._snapshot_from_json(self._receive_json())
+
+    def receive_ready(self):
+        """
+        Receive the snapshots the server has already sent, reading from the socket at most once. Only blocks if the
+        socket has nothing to read, so call it once the socket is readable or buffered() is True, e.g. when multiplexing
+        several clients with a selector.
+
+        :return:        A list of cameraProtocol.Snapshot, oldest first. May be empty if only part of a message was read.
+        """
+
+        if self.encoding == cameraProtocol.ENCODING_JSON:
+            return [self._snapshot_from_json(self._receive_json())]
+
+        if not self._pending_frames:
+            data = self._leftover or self._conn.recv(self._packet_size)
+            self._leftover = b''
+            if not data:
+                raise ConnectionResetError('Connection closed by server')
+
+            self._pending_frames.extend(self._decoder.feed(data))
+
+        snapshots = []
+        while self._pending_frames:
+            snapshots.append(self._snapshot_from_frame(self._pending_frames.popleft()))
+
+        return snapshots
+
+    def buffered(self):
+        """
+        :return:        True if bytes already received from the server are waiting to be decoded, in which case the
+                        socket may not become readable again until they are
+        """
+
+        return bool(self._leftover or self._pending_frames)
+
+    def fileno(self):
+        """
+        :return:        File descriptor of the connection's socket, so the client can be registered with a selector
+        """
+
+        return self._conn.fileno()
+
+    def _snapshot_from_frame(self, frame):
+        """
+        Acknowledge and decode a framed message.
 
-            config_dict = json.loads(config_json)
-            self._packet_size = config_dict['PACKET_SIZE']
+        :param frame:   A (message type, sequence, payload) tuple received from the server
+        :return:        A cameraProtocol.Snapshot
+        """
+
+        msg_type, sequence, payload = frame
+        receive_time = time.time()
+        self._acknowledge(sequence)
+
+        decode_start = time.perf_counter()
+        capture_time = None
+        if self._delta is not None:
+            gaps = self._delta.gaps
+            capture_time, points = self._delta.decode(msg_type, sequence, payload)
+            if self._delta.gaps != gaps:
+                TRACE.warning('Snapshot %s from %s follows a gap, positions may be stale until the next keyframe',
+                              sequence, self._host)
+        elif msg_type == cameraProtocol.MSG_SNAPSHOT:
+            capture_time, points = cameraProtocol.decode_snapshot(payload, self._pattern_names)
+        else:
+            points = cameraProtocol.decode_points(payload, self._pattern_names)
+        self.decode_time = time.perf_counter() - decode_start
+
+        return self._make_snapshot(sequence, capture_time, receive_time, points)
+
+    def _snapshot_from_json(self, points):
+        """
+        :param points:  A decoded JSON message received from the server
+        :return:        A cameraProtocol.Snapshot
+        """
+
+        receive_time = time.time()
+        capture_time = None
+
+        if self.timestamps:
+            sequence = points['SEQ']
+            capture_time = points['TIME']
+            points = points['POINTS']
+        else:
+            sequence = self._sequence
 
-        except socket.gaierror as e:
-            print(f"DNS resolution failed for {self._host}. Error: {e}")
-            print("Please ensure the hostname is correct or try using an IP address.")
-            return False
-        except ConnectionRefusedError:
-            print(f"Connection refused to {self._host}:{self._port}")
-            return False
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            return False
+        return self._make_snapshot(sequence, capture_time, receive_time, points)
 
-        return config_dict
+    def _make_snapshot(self, sequence, capture_time, receive_time, points):
+        self._sequence = sequence + 1
+
+        if capture_time is None:
+            capture_time = receive_time
+        else:
+            capture_time = self._to_local_time(capture_time, receive_time)
+
+        TRACE.debug('Received snapshot %s from %s: %s', sequence, self._host, points)
+
+        return cameraProtocol.Snapshot(sequence, capture_time, points)
 
     def receive_points(self):
         """
@@ -67,11 +519,21 @@ class CameraClient:
         The units of the coordinates are feet as per the original design of this application.
         If the units are changed in the server application, the same units will be used here.
 
-        :return:        A list of (x, y) tuples of robot coordinates
+        :return:        A dict of pattern name to [x, y] robot coordinates
+        """
+
+        return self.receive_snapshot().points
+
+    def _receive_json(self):
+        """
+        Receive and acknowledge a JSON message from the server.
+
+        :return:        The decoded message
         """
 
         # Receive the first message in a TCP transmission from the server
-        data = self._conn.recv(self._packet_size).decode()
+        data = (self._leftover or self._conn.recv(self._packet_size)).decode()
+        self._leftover = b''
 
         '''# Decode and receive each message in the transmission until an End of Transmission message is sent
         points = []
@@ -98,8 +560,10 @@ class CameraClient:
         # Send a final OK to let the server know the EOT was received
         '''
         self._conn.send('OK'.encode())
+
+        decode_start = time.perf_counter()
         points = json.loads(data)
-        print(points)
+        self.decode_time = time.perf_counter() - decode_start
 
         return points
 
@@ -109,4 +573,5 @@ class CameraClient:
         This method should always be called if connect() has previously been called to close the TCP sockets in the
         client and server.
         """
-        self._conn.close()
+        self._close_socket()
+        self.state = self.STATE_DISCONNECTED
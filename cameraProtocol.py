@@ -0,0 +1,375 @@
+"""
+Wire format shared by the camera server and CameraClient.
+
+The server advertises the encodings it supports in the config dict sent on connect, and the client replies with the
+one it picked. Servers that do not advertise any encodings are sent nothing and keep using plain JSON messages.
+
+Framed messages start with a fixed little-endian header followed by a payload of the given length:
+
+    magic (2 bytes, b'SS') | version (uint8) | message type (uint8) | sequence (uint32) | payload length (uint32)
+
+A POINTS payload is a packed array of records, one per detected pattern:
+
+    pattern id (uint16) | x (float32) | y (float32)
+
+Pattern ids index into the PATTERNS list from the server's config dict.
+
+Servers that set TIMESTAMPS in their config dict and are sent TIMESTAMPS back in the reply stamp every snapshot with
+the time its camera frame was captured, in seconds on the server's clock. Framed encodings then send SNAPSHOT messages
+instead of POINTS messages, whose payload is the capture time followed by the same point records:
+
+    capture time (float64) | point records...
+
+and the JSON encoding sends {"SEQ": sequence, "TIME": capture time, "POINTS": {pattern name: [x, y], ...}} instead of
+the bare dict of points.
+
+The DELTA encoding is framed like BINARY, but only sends the robots that moved since the previous message, with
+coordinates quantized to int16 steps of 1 / DELTA_SCALE coordinate units (centimetres for coordinates in feet). Every
+KEYFRAME_INTERVAL messages, and first, a KEYFRAME message carries every robot; DELTA messages in between carry the
+robots that moved, appeared or disappeared since the previous message. Both are always stamped with the capture time:
+
+    capture time (float64) | quantized records...
+
+where each record is
+
+    pattern id (uint16) | x (int16) | y (int16)
+
+and a DELTA record with x and y both -32768 means the pattern is no longer detected. Each message builds on the one with
+the previous sequence number, so a gap in the sequence numbers leaves the client's state unreliable until the next
+KEYFRAME. Servers offering DELTA advertise DELTA_SCALE and KEYFRAME_INTERVAL in their config dict.
+
+Framed encodings may also negotiate an acknowledgement mode through ACK_MODES:
+
+    LOCKSTEP    The client sends 'OK' after every message and the server waits for it before sending the next one.
+                This is the only mode servers that don't negotiate know about.
+    CUMULATIVE  The server streams messages without waiting, keeping at most ACK_WINDOW of them unacknowledged. The
+                client sends an ACK message carrying the newest sequence number it received every half window.
+    NONE        The server streams messages without waiting and the client never acknowledges them.
+"""
+
+import json
+import struct
+from collections import namedtuple
+
+
+# Encodings that may be negotiated in the config dict
+ENCODING_JSON = 'JSON'
+ENCODING_BINARY = 'BINARY'
+ENCODING_DELTA = 'DELTA'
+
+MAGIC = b'SS'
+VERSION = 1
+
+HEADER = struct.Struct('<2sBBII')
+POINT_RECORD = struct.Struct('<Hff')
+CAPTURE_TIME = struct.Struct('<d')
+QUANTIZED_RECORD = struct.Struct('<Hhh')
+
+# Quantization of the DELTA encoding: steps per coordinate unit, and the coordinate marking a removed pattern. Coordinates
+# outside the int16 range are clamped to it.
+DEFAULT_DELTA_SCALE = 30.48
+DEFAULT_KEYFRAME_INTERVAL = 30
+DELTA_REMOVED = -32768
+QUANTIZED_MAX = 32767
+
+# Acknowledgement modes that may be negotiated in the config dict
+ACK_LOCKSTEP = 'LOCKSTEP'
+ACK_CUMULATIVE = 'CUMULATIVE'
+ACK_NONE = 'NONE'
+
+DEFAULT_ACK_WINDOW = 8
+
+# Patterns the overhead camera server detects, for servers that don't advertise PATTERNS in their config dict
+DEFAULT_PATTERNS = ('X', 'Y', 'STAIR')
+
+# Message types
+MSG_POINTS = 1
+MSG_ACK = 2
+MSG_SNAPSHOT = 3
+MSG_KEYFRAME = 4
+MSG_DELTA = 5
+
+# A decoded snapshot. capture_time is in seconds on the client's clock, see CameraClient.receive_snapshot().
+Snapshot = namedtuple('Snapshot', ['sequence', 'capture_time', 'points'])
+
+
+def encode_frame(msg_type, sequence, payload=b''):
+    """
+    Wrap a payload in a framed message.
+
+    :param msg_type:        One of the MSG_* message types
+    :param sequence:        Sequence number of the message, wrapped to 32 bits
+    :param payload:         Bytes of the message body
+    :return:                The framed message as bytes
+    """
+
+    return HEADER.pack(MAGIC, VERSION, msg_type, sequence & 0xFFFFFFFF, len(payload)) + payload
+
+
+def encode_points(points, pattern_ids, sequence):
+    """
+    Encode a snapshot of robot positions as a POINTS message. Patterns without a position are left out.
+
+    :param points:          A dict of pattern name to [x, y] field coordinates
+    :param pattern_ids:     A dict of pattern name to the pattern's index in the advertised PATTERNS list
+    :param sequence:        Sequence number of the snapshot
+    :return:                The framed message as bytes
+    """
+
+    payload = bytearray()
+    for name, point in points.items():
+        if point is None or len(point) != 2:
+            continue
+        payload += POINT_RECORD.pack(pattern_ids[name], point[0], point[1])
+
+    return encode_frame(MSG_POINTS, sequence, bytes(payload))
+
+
+def encode_snapshot(points, pattern_ids, sequence, capture_time):
+    """
+    Encode a snapshot of robot positions and the time it was captured as a SNAPSHOT message.
+
+    :param points:          A dict of pattern name to [x, y] field coordinates
+    :param pattern_ids:     A dict of pattern name to the pattern's index in the advertised PATTERNS list
+    :param sequence:        Sequence number of the snapshot
+    :param capture_time:    Time the camera frame was captured, in seconds on the server's clock
+    :return:                The framed message as bytes
+    """
+
+    frame = encode_points(points, pattern_ids, sequence)
+    payload = CAPTURE_TIME.pack(capture_time) + frame[HEADER.size:]
+
+    return encode_frame(MSG_SNAPSHOT, sequence, payload)
+
+
+def decode_snapshot(payload, pattern_names):
+    """
+    Decode the payload of a SNAPSHOT message.
+
+    :param payload:         Bytes of the message body
+    :param pattern_names:   The advertised PATTERNS list
+    :return:                A (capture time, points) tuple, see decode_points()
+    """
+
+    if len(payload) < CAPTURE_TIME.size:
+        raise ValueError('SNAPSHOT payload of ' + str(len(payload)) + ' bytes is too short for a capture time')
+
+    capture_time, = CAPTURE_TIME.unpack_from(payload)
+
+    return capture_time, decode_points(payload[CAPTURE_TIME.size:], pattern_names)
+
+
+def decode_points(payload, pattern_names):
+    """
+    Decode the payload of a POINTS message into the same dict that the JSON encoding produces.
+
+    :param payload:         Bytes of the message body
+    :param pattern_names:   The advertised PATTERNS list. Ids outside of it are named by their number.
+    :return:                A dict of pattern name to [x, y] field coordinates
+    """
+
+    if len(payload) % POINT_RECORD.size:
+        raise ValueError('POINTS payload of ' + str(len(payload)) + ' bytes is not a whole number of records')
+
+    points = {}
+    num_names = len(pattern_names)
+    for pattern_id, x, y in POINT_RECORD.iter_unpack(payload):
+        name = pattern_names[pattern_id] if pattern_id < num_names else str(pattern_id)
+        points[name] = [x, y]
+
+    return points
+
+
+class DeltaEncoder:
+    """
+    DeltaEncoder class
+
+    Encodes one session's snapshots in the DELTA encoding, remembering what the client was last sent. Every message
+    encoded is assumed to be sent, in order; a message that is dropped instead shows up as a gap on the client.
+    """
+
+    def __init__(self, pattern_ids, scale=DEFAULT_DELTA_SCALE, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        """
+        :param pattern_ids:         A dict of pattern name to the pattern's index in the advertised PATTERNS list
+        :param scale:               (Optional) Quantization steps per coordinate unit, as advertised in DELTA_SCALE
+        :param keyframe_interval:   (Optional) Messages from one KEYFRAME to the next, as advertised in
+                                    KEYFRAME_INTERVAL
+        """
+
+        self.pattern_ids = pattern_ids
+        self.scale = scale
+        self.keyframe_interval = keyframe_interval
+
+        # Quantized position of each pattern as of the last message, keyed by pattern id
+        self._sent = {}
+        self._since_keyframe = None
+
+    def encode(self, points, sequence, capture_time):
+        """
+        Encode a snapshot as a KEYFRAME message if one is due, otherwise as a DELTA message.
+
+        :param points:          A dict of pattern name to [x, y] field coordinates
+        :param sequence:        Sequence number of the snapshot
+        :param capture_time:    Time the camera frame was captured, in seconds on the server's clock
+        :return:                The framed message as bytes
+        """
+
+        scale = self.scale
+        current = {}
+        for name, point in points.items():
+            if point is None or len(point) != 2:
+                continue
+            current[self.pattern_ids[name]] = (
+                max(-QUANTIZED_MAX, min(QUANTIZED_MAX, round(point[0] * scale))),
+                max(-QUANTIZED_MAX, min(QUANTIZED_MAX, round(point[1] * scale))),
+            )
+
+        payload = bytearray(CAPTURE_TIME.pack(capture_time))
+
+        if self._since_keyframe is None or self._since_keyframe + 1 >= self.keyframe_interval:
+            msg_type = MSG_KEYFRAME
+            self._since_keyframe = 0
+            for pattern_id, (x, y) in current.items():
+                payload += QUANTIZED_RECORD.pack(pattern_id, x, y)
+
+        else:
+            msg_type = MSG_DELTA
+            self._since_keyframe += 1
+            sent = self._sent
+            for pattern_id, position in current.items():
+                if sent.get(pattern_id) != position:
+                    payload += QUANTIZED_RECORD.pack(pattern_id, *position)
+            for pattern_id in sent.keys() - current.keys():
+                payload += QUANTIZED_RECORD.pack(pattern_id, DELTA_REMOVED, DELTA_REMOVED)
+
+        self._sent = current
+
+        return encode_frame(msg_type, sequence, bytes(payload))
+
+
+class DeltaDecoder:
+    """
+    DeltaDecoder class
+
+    Rebuilds the full snapshot from a session's KEYFRAME and DELTA messages, and detects messages that never arrived by
+    their sequence numbers. After a gap the robots in each DELTA are still placed where it says, but robots that moved
+    or disappeared in the missing messages keep their old state until the next KEYFRAME.
+    """
+
+    def __init__(self, pattern_names, scale=DEFAULT_DELTA_SCALE):
+        """
+        :param pattern_names:   The advertised PATTERNS list. Ids outside of it are named by their number.
+        :param scale:           (Optional) Quantization steps per coordinate unit, as advertised in DELTA_SCALE
+        """
+
+        self.pattern_names = pattern_names
+        self.scale = scale
+
+        self._points = {}
+        self._last_sequence = None
+
+        # Number of gaps detected, and whether the state is complete, i.e. there was no gap since the last KEYFRAME
+        self.gaps = 0
+        self.synchronized = False
+
+    def decode(self, msg_type, sequence, payload):
+        """
+        Apply a KEYFRAME or DELTA message.
+
+        :param msg_type:    MSG_KEYFRAME or MSG_DELTA
+        :param sequence:    Sequence number of the message
+        :param payload:     Bytes of the message body
+        :return:            A (capture time, points) tuple of the full snapshot, see decode_points(). The points dict
+                            is new for every message.
+        """
+
+        if len(payload) < CAPTURE_TIME.size or (len(payload) - CAPTURE_TIME.size) % QUANTIZED_RECORD.size:
+            raise ValueError('Quantized payload of ' + str(len(payload)) + ' bytes is not a capture time followed by '
+                             'whole records')
+
+        if msg_type == MSG_KEYFRAME:
+            points = {}
+            self.synchronized = True
+        elif msg_type == MSG_DELTA:
+            points = dict(self._points)
+            if self._last_sequence is None or (sequence - self._last_sequence) & 0xFFFFFFFF != 1:
+                self.gaps += 1
+                self.synchronized = False
+        else:
+            raise ValueError('Unexpected message type ' + str(msg_type) + ' in the DELTA encoding')
+
+        self._last_sequence = sequence
+
+        capture_time, = CAPTURE_TIME.unpack_from(payload)
+
+        names = self.pattern_names
+        num_names = len(names)
+        step = 1 / self.scale
+        for pattern_id, x, y in QUANTIZED_RECORD.iter_unpack(memoryview(payload)[CAPTURE_TIME.size:]):
+            name = names[pattern_id] if pattern_id < num_names else str(pattern_id)
+            if x == DELTA_REMOVED and y == DELTA_REMOVED:
+                points.pop(name, None)
+            else:
+                points[name] = [x * step, y * step]
+
+        self._points = points
+
+        return capture_time, points
+
+
+class FrameDecoder:
+    """
+    FrameDecoder class
+
+    Incremental decoder for framed messages. Bytes may be fed in whatever pieces TCP delivers them: partial messages are
+    kept until the rest arrives, and a single read containing several messages yields all of them.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add received bytes to the decoder.
+
+        :param data:    Bytes received from the socket
+        :return:        A list of (message type, sequence, payload) tuples for every message completed by the data
+        """
+
+        self._buffer += data
+
+        frames = []
+        offset = 0
+        available = len(self._buffer)
+
+        while available - offset >= HEADER.size:
+            magic, version, msg_type, sequence, length = HEADER.unpack_from(self._buffer, offset)
+
+            if magic != MAGIC:
+                raise ValueError('Lost frame synchronization, bad magic ' + repr(magic))
+            if version != VERSION:
+                raise ValueError('Unsupported frame version ' + str(version))
+
+            end = offset + HEADER.size + length
+            if end > available:
+                break
+
+            frames.append((msg_type, sequence, bytes(self._buffer[offset + HEADER.size:end])))
+            offset = end
+
+        # Keep only the unfinished message, if any
+        if offset:
+            del self._buffer[:offset]
+
+        return frames
+
+
+def encode_config(config):
+    """
+    Encode a config dict for the handshake.
+
+    :param config:  A JSON serializable dict
+    :return:        The encoded bytes
+    """
+
+    return json.dumps(config).encode()
@@ -0,0 +1,124 @@
+import threading
+
+
+class SnapshotBuffer:
+    """
+    SnapshotBuffer class
+
+    Lock-protected double buffer holding the newest robot position snapshot received from the camera server.
+
+    The writer places each snapshot in the back slot and then swaps the slots under the lock, so the lock is only ever
+    held for a pointer swap. Readers never wait on the lock: if it is momentarily held, the previously read snapshot is
+    returned instead. Snapshots that are replaced before a reader sees them are counted as dropped rather than queued.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = [None, None]
+        self._front = 0
+
+        # Sequence number of the snapshot in the front slot and of the last snapshot handed to a reader
+        self._sequence = 0
+        self._read_sequence = 0
+        self._last_read = None
+
+        self.dropped = 0
+
+    def publish(self, snapshot):
+        """
+        Make a snapshot the newest one available to readers. Only one thread may publish to a buffer.
+
+        :param snapshot:    A cameraProtocol.Snapshot
+        """
+
+        # Only the writer touches the back slot, so it can be filled without holding the lock
+        back = 1 - self._front
+        self._slots[back] = snapshot
+
+        with self._lock:
+            # The snapshot being replaced was never read, so it is stale now
+            if self._sequence != self._read_sequence:
+                self.dropped += 1
+
+            self._front = back
+            self._sequence += 1
+
+    def read(self):
+        """
+        Get the newest snapshot without blocking.
+
+        :return:        A (sequence, snapshot) tuple. The sequence number only changes when a new snapshot is published.
+                        The snapshot is None until the first one is published.
+        """
+
+        if not self._lock.acquire(blocking=False):
+            return self._read_sequence, self._last_read
+
+        try:
+            self._read_sequence = self._sequence
+            self._last_read = self._slots[self._front]
+        finally:
+            self._lock.release()
+
+        return self._read_sequence, self._last_read
+
+
+class CameraReceiver(threading.Thread):
+    """
+    CameraReceiver class
+
+    Background thread that owns the camera client's socket once it is connected. It receives snapshots as fast as the
+    server sends them and publishes each one into a SnapshotBuffer, so the render loop never waits on the network.
+    """
+
+    def __init__(self, cam_client):
+        """
+        Create a receiver for a connected camera client. Call start() to begin receiving.
+
+        :param cam_client:  A CameraClient on which connect() has already succeeded
+        """
+
+        super().__init__(name='CameraReceiver', daemon=True)
+
+        self.cam_client = cam_client
+        self.buffer = SnapshotBuffer()
+        self.error = None
+
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                snapshot = self.cam_client.receive_snapshot()
+            except Exception as e:
+                # Errors raised after stop() are caused by the socket being closed underneath the receive
+                if not self._stop_event.is_set():
+                    self.error = e
+                return
+
+            self.buffer.publish(snapshot)
+
+    def latest(self):
+        """
+        Get the newest snapshot received from the server without blocking.
+
+        :return:        A (sequence, snapshot) tuple, see SnapshotBuffer.read()
+        """
+
+        return self.buffer.read()
+
+    def raise_error(self):
+        """
+        Re-raise an error that stopped the receiver in the calling thread, so connection failures are handled by the
+        render loop the same way they were when receiving was done inline.
+        """
+
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        """
+        Ask the receiver to stop. The camera client should be closed afterwards to unblock a pending receive.
+        """
+
+        self._stop_event.set()
@@ -0,0 +1,404 @@
+"""
+Relay that shares one connection to the camera server between many sideline displays.
+
+The relay connects to the camera server once, as a CameraClient, and serves any number of displays as a camera server
+speaking the same protocol, so the camera server only ever has one session to serve however many displays there are.
+Run it on a machine on the camera's network:
+
+    python cameraRelay.py [--upstream HOST[:PORT] ...] [--port 5001]
+
+and point each display at it with python main.py --camera RELAY_HOST:5001. Giving several upstream cameras relays their
+merged snapshots, see multiCameraClient.
+
+Displays are served on one asyncio event loop. Each display has a slot holding only the newest snapshot it hasn't been
+sent yet: a display that is slow to read or acknowledge has older snapshots replaced rather than queued, so it never
+holds up the camera or the other displays.
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import threading
+
+import cameraProtocol
+from cameraClient import CameraClient
+from multiCameraClient import MERGE_LATEST, MERGE_RULES, MultiCameraClient, parse_source
+from traceBuffer import TRACE
+
+
+class Subscriber:
+    """
+    Subscriber class
+
+    Latest-only slot of snapshots waiting to be sent to one display.
+    """
+
+    def __init__(self, address):
+        """
+        :param address:     Address of the display, for reporting
+        """
+
+        self.address = address
+
+        self._snapshot = None
+        self._ready = asyncio.Event()
+
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, snapshot):
+        """
+        Make a snapshot the next one sent to the display, replacing one that hasn't been sent yet.
+
+        :param snapshot:    A cameraProtocol.Snapshot
+        """
+
+        if self._snapshot is not None:
+            self.dropped += 1
+
+        self._snapshot = snapshot
+        self._ready.set()
+
+    async def take(self):
+        """
+        :return:    The newest snapshot not yet sent, waiting for one if there is none
+        """
+
+        await self._ready.wait()
+        self._ready.clear()
+
+        snapshot = self._snapshot
+        self._snapshot = None
+
+        return snapshot
+
+
+class CameraRelay:
+    """
+    CameraRelay class
+
+    Receives snapshots from an upstream camera client and relays each one to every connected display.
+    """
+
+    PACKET_SIZE = 2048
+
+    # Seconds between upstream connection attempts while the upstream camera is disconnected
+    UPSTREAM_POLL_INTERVAL = 0.01
+
+    def __init__(self, upstream, host='0.0.0.0', port=5001,
+                 encodings=(cameraProtocol.ENCODING_DELTA, cameraProtocol.ENCODING_BINARY, cameraProtocol.ENCODING_JSON),
+                 ack_modes=(cameraProtocol.ACK_CUMULATIVE, cameraProtocol.ACK_NONE, cameraProtocol.ACK_LOCKSTEP),
+                 ack_window=cameraProtocol.DEFAULT_ACK_WINDOW, patterns=None,
+                 fallback_patterns=cameraProtocol.DEFAULT_PATTERNS,
+                 keyframe_interval=cameraProtocol.DEFAULT_KEYFRAME_INTERVAL):
+        """
+        :param upstream:            A CameraClient or MultiCameraClient to receive snapshots from. Connected by the
+                                    relay.
+        :param host:                (Optional) Address to listen on
+        :param port:                (Optional) Port to listen on
+        :param encodings:           (Optional) Encodings to offer displays
+        :param ack_modes:           (Optional) Acknowledgement modes to offer displays with framed encodings
+        :param ack_window:          (Optional) Most unacknowledged snapshots per display when streaming with CUMULATIVE
+                                    acks
+        :param patterns:            (Optional) Pattern names to advertise to displays. Defaults to the names advertised
+                                    by the upstream camera. Robots with other names are only relayed to displays using
+                                    JSON, and displays are only offered JSON if there are no pattern names at all.
+        :param fallback_patterns:   (Optional) Pattern names to advertise when the upstream camera doesn't advertise any,
+                                    e.g. the camera server from before encodings were negotiated
+        :param keyframe_interval:   (Optional) Messages from one keyframe to the next with the DELTA encoding
+        """
+
+        self.upstream = upstream
+        self.host = host
+        self.port = port
+        self.encodings = tuple(encodings)
+        self.ack_modes = tuple(ack_modes)
+        self.ack_window = ack_window
+        self.patterns = patterns
+        self.fallback_patterns = fallback_patterns
+        self.keyframe_interval = keyframe_interval
+
+        # Config of the upstream camera, which displays wait for before their handshake
+        self.upstream_config = None
+
+        self._subscribers = set()
+        self._loop = None
+        self._config_ready = None
+        self._stopping = None
+        self._thread = None
+        self._listening = threading.Event()
+
+        # Counters over all sessions, for reporting
+        self.connections = 0
+        self.received = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        """
+        Start listening and relaying on a background thread.
+
+        :return:    self
+        """
+
+        self._thread = threading.Thread(target=self.serve_forever, name='CameraRelay', daemon=True)
+        self._thread.start()
+        self._listening.wait()
+
+        return self
+
+    def serve_forever(self):
+        """
+        Listen and relay on the calling thread until stop() is called.
+        """
+
+        asyncio.run(self.serve())
+
+    def stop(self):
+        """
+        Stop relaying, end every display's session and close the upstream connection.
+        """
+
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join()
+
+    async def serve(self):
+        """
+        Listen and relay until stop() is called.
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._config_ready = asyncio.Event()
+        self._stopping = asyncio.Event()
+
+        server = await asyncio.start_server(self._serve_subscriber, self.host, self.port)
+        self._listening.set()
+
+        relay = asyncio.ensure_future(self._relay_upstream())
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+            relay.cancel()
+
+            # Closing the connection ends a receive in progress on the executor
+            self.upstream.close()
+
+            for task in [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]:
+                task.cancel()
+            await server.wait_closed()
+
+    async def _relay_upstream(self):
+        """
+        Keep the upstream camera connected and offer each snapshot it sends to every display.
+        """
+
+        connected = False
+        while True:
+            if not connected:
+                if self.upstream.poll_connect() != CameraClient.STATE_CONNECTED:
+                    await asyncio.sleep(self.UPSTREAM_POLL_INTERVAL)
+                    continue
+
+                connected = True
+                self.upstream_config = self.upstream.config
+                self._config_ready.set()
+                TRACE.info('Relaying camera with config %s', self.upstream_config)
+
+            # Receiving blocks, so it is done on the default executor's thread
+            try:
+                snapshot = await self._loop.run_in_executor(None, self.upstream.receive_snapshot)
+            except (OSError, ValueError, KeyError) as e:
+                self.upstream.disconnect(e)
+                connected = False
+                continue
+
+            self.received += 1
+            for subscriber in self._subscribers:
+                subscriber.offer(snapshot)
+
+    def _config(self):
+        """
+        :return:    The config dict sent to displays on connect, based on the upstream camera's
+        """
+
+        patterns = self.patterns
+        if patterns is None:
+            patterns = self.upstream_config.get('PATTERNS') or self.fallback_patterns
+
+        # Framed messages can only name advertised patterns, so without any they would carry no robots at all
+        encodings = list(self.encodings)
+        if not patterns:
+            encodings = [encoding for encoding in encodings if encoding == cameraProtocol.ENCODING_JSON]
+
+        config = dict(self.upstream_config)
+        config.update({
+            'PACKET_SIZE': self.PACKET_SIZE,
+            'ENCODINGS': encodings,
+            'PATTERNS': list(patterns),
+            'ACK_MODES': list(self.ack_modes),
+            'ACK_WINDOW': self.ack_window,
+            'TIMESTAMPS': True,
+            'DELTA_SCALE': cameraProtocol.DEFAULT_DELTA_SCALE,
+            'KEYFRAME_INTERVAL': self.keyframe_interval,
+        })
+
+        return config
+
+    async def _serve_subscriber(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.connections += 1
+        print('Display connected from ' + str(address))
+
+        subscriber = Subscriber(address)
+        try:
+            # Displays can only be told the patterns once the upstream camera has told the relay. A display that
+            # gives up waiting reconnects later.
+            await self._config_ready.wait()
+
+            config = self._config()
+            writer.write(cameraProtocol.encode_config(config))
+            await writer.drain()
+
+            reply = json.loads((await reader.read(self.PACKET_SIZE)).decode())
+            encoding = reply['ENCODING']
+            ack_mode = reply.get('ACK_MODE', cameraProtocol.ACK_LOCKSTEP)
+            timestamps = reply.get('TIMESTAMPS', False)
+
+            if encoding not in config['ENCODINGS']:
+                raise ValueError('Display picked unsupported encoding ' + str(encoding))
+
+            pattern_ids = {name: i for i, name in enumerate(config['PATTERNS'])}
+
+            # Each display is sent deltas from what it was sent last, so snapshots replaced in its slot leave no gap
+            delta = None
+            if encoding == cameraProtocol.ENCODING_DELTA:
+                delta = cameraProtocol.DeltaEncoder(pattern_ids, config['DELTA_SCALE'], self.keyframe_interval)
+
+            self._subscribers.add(subscriber)
+            await self._send_snapshots(reader, writer, subscriber, encoding, ack_mode, timestamps, pattern_ids, delta)
+
+        except (OSError, ValueError, KeyError, asyncio.IncompleteReadError) as e:
+            print('Display session ended: ' + str(e))
+
+        # Sessions are cancelled when the relay stops, which isn't an error of the session
+        except asyncio.CancelledError:
+            pass
+
+        finally:
+            self._subscribers.discard(subscriber)
+            self.sent += subscriber.sent
+            self.dropped += subscriber.dropped
+            writer.close()
+
+    async def _send_snapshots(self, reader, writer, subscriber, encoding, ack_mode, timestamps, pattern_ids, delta):
+        """
+        Send the display the newest snapshot whenever it can take one, acknowledged according to the negotiated mode.
+        """
+
+        decoder = cameraProtocol.FrameDecoder()
+        sequence = 0
+        acknowledged = 0
+
+        while True:
+            # Streaming displays are only waited on once they have fallen a whole window behind. The snapshot is taken
+            # afterwards, so the display is sent the newest one.
+            if ack_mode == cameraProtocol.ACK_CUMULATIVE:
+                while sequence - acknowledged >= self.ack_window:
+                    data = await reader.read(self.PACKET_SIZE)
+                    if not data:
+                        return
+                    for msg_type, acked_sequence, _ in decoder.feed(data):
+                        if msg_type == cameraProtocol.MSG_ACK:
+                            acknowledged = max(acknowledged, acked_sequence + 1)
+
+            snapshot = await subscriber.take()
+
+            writer.write(self._encode(snapshot, sequence, encoding, timestamps, pattern_ids, delta))
+            await writer.drain()
+
+            sequence += 1
+            subscriber.sent += 1
+
+            if ack_mode == cameraProtocol.ACK_LOCKSTEP:
+                if await reader.readexactly(2) != b'OK':
+                    return
+
+    @staticmethod
+    def _encode(snapshot, sequence, encoding, timestamps, pattern_ids, delta):
+        """
+        :return:    The message carrying a snapshot in a display's negotiated format
+        """
+
+        if encoding == cameraProtocol.ENCODING_JSON:
+            if timestamps:
+                return json.dumps({'SEQ': sequence, 'TIME': snapshot.capture_time, 'POINTS': snapshot.points}).encode()
+            return json.dumps(snapshot.points).encode()
+
+        # Framed messages can only name the advertised patterns
+        points = {name: pos for name, pos in snapshot.points.items() if name in pattern_ids}
+
+        if delta is not None:
+            return delta.encode(points, sequence, snapshot.capture_time)
+        if timestamps:
+            return cameraProtocol.encode_snapshot(points, pattern_ids, sequence, snapshot.capture_time)
+        return cameraProtocol.encode_points(points, pattern_ids, sequence)
+
+    def get_stats(self):
+        """
+        :return:    A dict of the displays connected so far and now, and the snapshots received from the camera, sent to
+                    displays and replaced before a display could take them
+        """
+
+        subscribers = list(self._subscribers)
+
+        return {
+            'connections': self.connections,
+            'displays': len(subscribers),
+            'received': self.received,
+            'sent': self.sent + sum(subscriber.sent for subscriber in subscribers),
+            'dropped': self.dropped + sum(subscriber.dropped for subscriber in subscribers),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Share one camera server connection between many sideline displays.')
+    parser.add_argument('--upstream', action='append', type=parse_source, metavar='HOST[:PORT[:CONFIDENCE]]',
+                        help='Camera server to relay. Repeat to relay the merged snapshots of several cameras. '
+                             'Defaults to the overhead camera.')
+    parser.add_argument('--test', action='store_true', help='Relay the camera server at localhost')
+    parser.add_argument('--merge', choices=MERGE_RULES, default=MERGE_LATEST,
+                        help='How a robot seen by several upstream cameras is placed')
+    parser.add_argument('--host', default='0.0.0.0', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=5001, help='Port to listen on')
+    parser.add_argument('--patterns', nargs='+', metavar='NAME',
+                        help='Pattern names to advertise to displays instead of the camera server\'s. Defaults to the '
+                             'names the camera server advertises, or ' + ' '.join(cameraProtocol.DEFAULT_PATTERNS) +
+                             ' if it advertises none.')
+    args = parser.parse_args()
+
+    if args.upstream and len(args.upstream) > 1:
+        upstream = MultiCameraClient(args.upstream, args.merge)
+    elif args.upstream:
+        upstream = CameraClient(False, False, host=args.upstream[0].host, port=args.upstream[0].port)
+    else:
+        upstream = CameraClient(args.test, use_ip=True)
+
+    relay = CameraRelay(upstream, args.host, args.port, patterns=args.patterns)
+
+    print('Relaying to displays on ' + args.host + ':' + str(args.port))
+    try:
+        relay.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(relay.get_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,473 @@
+"""
+Stand-in for the overhead camera server, for running ScanGUI and stressing CameraClient without the camera hardware.
+
+The simulator speaks the same handshake and point protocol as the camera server: a config dict with PACKET_SIZE, the
+optional negotiation of encodings, acknowledgement modes and timestamps from cameraProtocol, and then one snapshot of
+every simulated robot per frame. Network trouble can be injected: a fixed latency with random jitter on every snapshot,
+messages split into small separately sent pieces, and connections dropped after a while.
+
+Set TEST = True in main.py and run, for example:
+
+    python cameraSimulator.py --robots 30 --fps 15 --trajectory random --latency 0.05 --jitter 0.02
+
+Clients that disconnect, or are disconnected, may reconnect; every connection gets its own session.
+"""
+
+import argparse
+import json
+import math
+import queue
+import random
+import socket
+import threading
+import time
+
+import cameraProtocol
+
+
+# Field dimensions in feet, the same as ScanGUI.FIELD_LENGTH and ScanGUI.FIELD_WIDTH
+FIELD_LENGTH = 90
+FIELD_WIDTH = 46
+
+# Robot trajectories
+TRAJECTORY_CIRCLE = 'circle'    # Concentric circles around the center of the field
+TRAJECTORY_LINE = 'line'        # Back and forth along the length of the field, each robot in its own lane
+TRAJECTORY_RANDOM = 'random'    # A random walk that bounces off the edges of the field
+TRAJECTORY_STILL = 'still'      # Standing still, spread over the field
+TRAJECTORIES = (TRAJECTORY_CIRCLE, TRAJECTORY_LINE, TRAJECTORY_RANDOM, TRAJECTORY_STILL)
+
+# Offered encodings. LEGACY offers nothing, like servers from before encodings were negotiated.
+ENCODING_LEGACY = 'LEGACY'
+
+
+class SimulatedRobot:
+    """
+    SimulatedRobot class
+
+    A robot moving along one of the simulated trajectories, in feet on a FIELD_LENGTH x FIELD_WIDTH field with y
+    pointing up the field.
+    """
+
+    SPEED = 10      # Feet per second
+
+    def __init__(self, name, trajectory, index, count, rng):
+        """
+        :param name:        Pattern name the robot is reported under
+        :param trajectory:  One of TRAJECTORIES
+        :param index:       Index of the robot among the simulated robots, used to spread them out
+        :param count:       Number of simulated robots
+        :param rng:         random.Random used for the robot's random choices
+        """
+
+        if trajectory not in TRAJECTORIES:
+            raise ValueError('Unknown trajectory ' + repr(trajectory))
+
+        self.name = name
+        self.trajectory = trajectory
+        self.index = index
+        self.count = count
+        self._rng = rng
+
+        # State of the random walk
+        self._x = rng.uniform(0, FIELD_LENGTH)
+        self._y = rng.uniform(0, FIELD_WIDTH)
+        self._heading = rng.uniform(0, 2 * math.pi)
+        self._last_time = None
+
+    def position(self, t):
+        """
+        :param t:   Seconds since the simulation started. Must not decrease between calls.
+        :return:    [x, y] position in feet
+        """
+
+        fraction = (self.index + 1) / (self.count + 1)
+
+        if self.trajectory == TRAJECTORY_CIRCLE:
+            radius = fraction * (FIELD_WIDTH / 2 - 2)
+            angle = self.SPEED * t / max(radius, 1) + 2 * math.pi * self.index / self.count
+            return [FIELD_LENGTH / 2 + radius * math.cos(angle), FIELD_WIDTH / 2 + radius * math.sin(angle)]
+
+        if self.trajectory == TRAJECTORY_LINE:
+            # Triangle wave between the end zones, phase shifted per robot
+            span = FIELD_LENGTH - 10
+            distance = (self.SPEED * t + fraction * span) % (2 * span)
+            return [5 + (distance if distance < span else 2 * span - distance), fraction * FIELD_WIDTH]
+
+        if self.trajectory == TRAJECTORY_STILL:
+            return [fraction * FIELD_LENGTH, (self.index % 2 + 1) * FIELD_WIDTH / 3]
+
+        if self._last_time is not None:
+            dt = t - self._last_time
+            self._heading += self._rng.gauss(0, 1) * math.sqrt(dt)
+            self._x += self.SPEED * dt * math.cos(self._heading)
+            self._y += self.SPEED * dt * math.sin(self._heading)
+
+            # Bounce off the edges
+            if not 0 <= self._x <= FIELD_LENGTH:
+                self._x = min(max(self._x, 0), FIELD_LENGTH)
+                self._heading = math.pi - self._heading
+            if not 0 <= self._y <= FIELD_WIDTH:
+                self._y = min(max(self._y, 0), FIELD_WIDTH)
+                self._heading = -self._heading
+
+        self._last_time = t
+
+        return [self._x, self._y]
+
+
+class CameraSimulator:
+    """
+    CameraSimulator class
+
+    TCP server that stands in for the overhead camera server. Each connected client is served on its own thread: a
+    capture thread takes a snapshot of the simulated robots every frame and puts it on a delay line, and the session
+    thread sends each snapshot once its simulated latency has passed, acknowledged according to the negotiated mode.
+    """
+
+    PACKET_SIZE = 2048
+
+    def __init__(self, host='localhost', port=5000, num_robots=3, trajectory=TRAJECTORY_CIRCLE, fps=15,
+                 encodings=(cameraProtocol.ENCODING_DELTA, cameraProtocol.ENCODING_BINARY, cameraProtocol.ENCODING_JSON),
+                 ack_modes=(cameraProtocol.ACK_CUMULATIVE, cameraProtocol.ACK_NONE, cameraProtocol.ACK_LOCKSTEP),
+                 ack_window=cameraProtocol.DEFAULT_ACK_WINDOW, timestamps=True, latency=0, jitter=0, split=0,
+                 split_delay=0.001, disconnect_after=None, seed=None,
+                 keyframe_interval=cameraProtocol.DEFAULT_KEYFRAME_INTERVAL):
+        """
+        :param host:                (Optional) Address to listen on
+        :param port:                (Optional) Port to listen on
+        :param num_robots:          (Optional) Number of simulated robots
+        :param trajectory:          (Optional) One of TRAJECTORIES
+        :param fps:                 (Optional) Snapshots per second
+        :param encodings:           (Optional) Encodings to offer, or an empty sequence to offer nothing and speak
+                                    plain JSON like servers from before encodings were negotiated
+        :param ack_modes:           (Optional) Acknowledgement modes to offer with framed encodings
+        :param ack_window:          (Optional) Most unacknowledged messages when streaming with CUMULATIVE acks
+        :param timestamps:          (Optional) Offer to stamp snapshots with their capture time
+        :param latency:             (Optional) Seconds each snapshot is held back before it is sent
+        :param jitter:              (Optional) Largest random number of seconds added to the latency of a snapshot.
+                                    Snapshots are never reordered, as they would not be over TCP.
+        :param split:               (Optional) Send messages in pieces of at most this many bytes. 0 sends each
+                                    message whole.
+        :param split_delay:         (Optional) Seconds to wait between the pieces of a split message, so they arrive
+                                    in separate reads
+        :param disconnect_after:    (Optional) Seconds after which each connection is dropped. None keeps
+                                    connections open.
+        :param seed:                (Optional) Seed for the robots' random trajectories and the jitter
+        :param keyframe_interval:   (Optional) Messages from one keyframe to the next with the DELTA encoding
+        """
+
+        self.host = host
+        self.port = port
+        self.num_robots = num_robots
+        self.trajectory = trajectory
+        self.fps = fps
+        self.encodings = tuple(encodings)
+        self.ack_modes = tuple(ack_modes)
+        self.ack_window = ack_window
+        self.timestamps = timestamps
+        self.latency = latency
+        self.jitter = jitter
+        self.split = split
+        self.split_delay = split_delay
+        self.disconnect_after = disconnect_after
+        self.seed = seed
+        self.keyframe_interval = keyframe_interval
+
+        # Simulated robots beyond the patterns the real server detects are named P<index>
+        patterns = cameraProtocol.DEFAULT_PATTERNS
+        self.patterns = [patterns[i] if i < len(patterns) else 'P' + str(i) for i in range(num_robots)]
+
+        self._server = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        # Counters over all sessions, for reporting
+        self._count_lock = threading.Lock()
+        self.connections = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        """
+        Start listening and serve clients on a background thread.
+
+        :return:    self
+        """
+
+        self._listen()
+        self._thread = threading.Thread(target=self._accept_clients, name='CameraSimulator', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def serve_forever(self):
+        """
+        Listen and serve clients on the calling thread until stop() is called.
+        """
+
+        self._listen()
+        self._accept_clients()
+
+    def stop(self):
+        """
+        Stop accepting clients and end every session.
+        """
+
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _listen(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen()
+
+        # Wake up regularly to notice stop()
+        self._server.settimeout(0.5)
+
+    def _accept_clients(self):
+        while not self._stop_event.is_set():
+            try:
+                conn, address = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+
+            with self._count_lock:
+                self.connections += 1
+            print('Client connected from ' + str(address))
+
+            threading.Thread(target=self._serve_client, args=(conn,), name='CameraSimulatorSession',
+                             daemon=True).start()
+
+    def _config(self):
+        """
+        :return:    The config dict sent to clients on connect
+        """
+
+        config = {'PACKET_SIZE': self.PACKET_SIZE, 'FPS': self.fps}
+
+        if self.encodings:
+            config['ENCODINGS'] = list(self.encodings)
+            config['PATTERNS'] = self.patterns
+            config['ACK_MODES'] = list(self.ack_modes)
+            config['ACK_WINDOW'] = self.ack_window
+            if self.timestamps:
+                config['TIMESTAMPS'] = True
+            if cameraProtocol.ENCODING_DELTA in self.encodings:
+                config['DELTA_SCALE'] = cameraProtocol.DEFAULT_DELTA_SCALE
+                config['KEYFRAME_INTERVAL'] = self.keyframe_interval
+
+        return config
+
+    def _serve_client(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        session_end = threading.Event()
+        try:
+            conn.sendall(cameraProtocol.encode_config(self._config()))
+
+            # Clients reply with their choices only when there was something to choose from
+            encoding = cameraProtocol.ENCODING_JSON
+            ack_mode = cameraProtocol.ACK_LOCKSTEP
+            timestamps = False
+            if self.encodings:
+                reply = json.loads(conn.recv(self.PACKET_SIZE).decode())
+                encoding = reply['ENCODING']
+                ack_mode = reply.get('ACK_MODE', cameraProtocol.ACK_LOCKSTEP)
+                timestamps = reply.get('TIMESTAMPS', False)
+
+            # Snapshots wait on the delay line until their latency has passed. A camera that can't send keeps
+            # capturing, so the oldest waiting snapshot is dropped when the line is full.
+            delay_line = queue.Queue(maxsize=max(2, math.ceil(self.fps * (self.latency + self.jitter + 1))))
+            capture = threading.Thread(target=self._capture, args=(delay_line, session_end),
+                                       name='CameraSimulatorCapture', daemon=True)
+            capture.start()
+
+            self._send_snapshots(conn, delay_line, session_end, encoding, ack_mode, timestamps)
+
+        except (OSError, ValueError) as e:
+            print('Client session ended: ' + str(e))
+
+        finally:
+            session_end.set()
+            conn.close()
+
+    def _capture(self, delay_line, session_end):
+        """
+        Take a snapshot of the simulated robots every frame and queue it to be sent. Snapshots are only encoded once
+        they are sent, so ones dropped from the delay line leave no gap in the messages the client receives.
+        """
+
+        rng = random.Random(self.seed)
+        robots = [SimulatedRobot(name, self.trajectory, i, self.num_robots, rng) for i, name in enumerate(self.patterns)]
+
+        start = time.time()
+        send_time = start
+        frame = 0
+
+        while not session_end.is_set():
+            # The first snapshot is a frame after connecting, so it never arrives in the same read as the config
+            frame += 1
+            capture_time = start + frame / self.fps
+            delay = capture_time - time.time()
+            if delay > 0:
+                session_end.wait(delay)
+
+            points = {robot.name: robot.position(capture_time - start) for robot in robots}
+
+            # TCP delivers in order, so a snapshot is never sent before the one captured ahead of it
+            send_time = max(send_time, capture_time + self.latency + rng.uniform(0, self.jitter))
+
+            try:
+                delay_line.put_nowait((send_time, capture_time, points))
+            except queue.Full:
+                try:
+                    delay_line.get_nowait()
+                except queue.Empty:
+                    pass
+                delay_line.put_nowait((send_time, capture_time, points))
+                with self._count_lock:
+                    self.dropped += 1
+
+    def _send_snapshots(self, conn, delay_line, session_end, encoding, ack_mode, timestamps):
+        """
+        Send queued snapshots once they are due, until the session ends.
+        """
+
+        pattern_ids = {name: i for i, name in enumerate(self.patterns)}
+        delta = None
+        if encoding == cameraProtocol.ENCODING_DELTA:
+            delta = cameraProtocol.DeltaEncoder(pattern_ids, cameraProtocol.DEFAULT_DELTA_SCALE, self.keyframe_interval)
+
+        decoder = cameraProtocol.FrameDecoder()
+        sequence = 0
+        acknowledged = 0
+
+        disconnect_time = None
+        if self.disconnect_after is not None:
+            disconnect_time = time.time() + self.disconnect_after
+
+        while not self._stop_event.is_set():
+            try:
+                send_time, capture_time, points = delay_line.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            delay = send_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            if disconnect_time is not None and time.time() >= disconnect_time:
+                print('Dropping client connection')
+                return
+
+            # Streaming servers only wait once the client has fallen a whole window behind
+            if ack_mode == cameraProtocol.ACK_CUMULATIVE:
+                while sequence - acknowledged >= self.ack_window:
+                    data = conn.recv(self.PACKET_SIZE)
+                    if not data:
+                        return
+                    for msg_type, acked_sequence, payload in decoder.feed(data):
+                        if msg_type == cameraProtocol.MSG_ACK:
+                            acknowledged = max(acknowledged, acked_sequence + 1)
+
+            self._send_message(conn, self._encode(points, sequence, capture_time, encoding, timestamps, pattern_ids,
+                                                  delta))
+            sequence += 1
+            with self._count_lock:
+                self.sent += 1
+
+            if ack_mode == cameraProtocol.ACK_LOCKSTEP:
+                if conn.recv(self.PACKET_SIZE) != b'OK':
+                    return
+
+    @staticmethod
+    def _encode(points, sequence, capture_time, encoding, timestamps, pattern_ids, delta):
+        """
+        :return:    The message carrying a snapshot in the client's negotiated format
+        """
+
+        if delta is not None:
+            return delta.encode(points, sequence, capture_time)
+        if encoding == cameraProtocol.ENCODING_BINARY and timestamps:
+            return cameraProtocol.encode_snapshot(points, pattern_ids, sequence, capture_time)
+        if encoding == cameraProtocol.ENCODING_BINARY:
+            return cameraProtocol.encode_points(points, pattern_ids, sequence)
+        if timestamps:
+            return json.dumps({'SEQ': sequence, 'TIME': capture_time, 'POINTS': points}).encode()
+        return json.dumps(points).encode()
+
+    def _send_message(self, conn, message):
+        if not self.split:
+            conn.sendall(message)
+            return
+
+        for offset in range(0, len(message), self.split):
+            if offset:
+                time.sleep(self.split_delay)
+            conn.sendall(message[offset:offset + self.split])
+
+    def get_stats(self):
+        """
+        :return:    A dict of the number of connections accepted and snapshots sent and dropped over all sessions
+        """
+
+        with self._count_lock:
+            return {'connections': self.connections, 'sent': self.sent, 'dropped': self.dropped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in for the overhead camera server.')
+    parser.add_argument('--host', default='localhost', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on')
+    parser.add_argument('--robots', type=int, default=3, help='Number of simulated robots')
+    parser.add_argument('--trajectory', choices=TRAJECTORIES, default=TRAJECTORY_CIRCLE, help='How the robots move')
+    parser.add_argument('--fps', type=float, default=15, help='Snapshots per second')
+    parser.add_argument('--encoding', nargs='+',
+                        default=[cameraProtocol.ENCODING_DELTA, cameraProtocol.ENCODING_BINARY,
+                                 cameraProtocol.ENCODING_JSON],
+                        choices=[cameraProtocol.ENCODING_DELTA, cameraProtocol.ENCODING_BINARY,
+                                 cameraProtocol.ENCODING_JSON, ENCODING_LEGACY],
+                        help='Encodings to offer. LEGACY offers nothing and sends plain lock-step JSON.')
+    parser.add_argument('--ack', nargs='+',
+                        default=[cameraProtocol.ACK_CUMULATIVE, cameraProtocol.ACK_NONE, cameraProtocol.ACK_LOCKSTEP],
+                        choices=[cameraProtocol.ACK_CUMULATIVE, cameraProtocol.ACK_NONE, cameraProtocol.ACK_LOCKSTEP],
+                        help='Acknowledgement modes to offer with framed encodings')
+    parser.add_argument('--ack-window', type=int, default=cameraProtocol.DEFAULT_ACK_WINDOW,
+                        help='Most unacknowledged snapshots when streaming')
+    parser.add_argument('--no-timestamps', action='store_true', help='Do not offer capture timestamps')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds each snapshot is held back')
+    parser.add_argument('--jitter', type=float, default=0, help='Largest random extra latency in seconds')
+    parser.add_argument('--split', type=int, default=0, help='Send messages in pieces of at most this many bytes')
+    parser.add_argument('--disconnect-after', type=float, default=None,
+                        help='Drop each connection after this many seconds')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for random trajectories and jitter')
+    parser.add_argument('--keyframe-interval', type=int, default=cameraProtocol.DEFAULT_KEYFRAME_INTERVAL,
+                        help='Messages from one keyframe to the next with the DELTA encoding')
+    args = parser.parse_args()
+
+    encodings = [] if ENCODING_LEGACY in args.encoding else args.encoding
+
+    simulator = CameraSimulator(args.host, args.port, args.robots, args.trajectory, args.fps, encodings, args.ack,
+                                args.ack_window, not args.no_timestamps, args.latency, args.jitter, args.split,
+                                disconnect_after=args.disconnect_after, seed=args.seed,
+                                keyframe_interval=args.keyframe_interval)
+
+    print('Simulating ' + str(args.robots) + ' robots at ' + str(args.fps) + ' fps on ' + args.host + ':' +
+          str(args.port))
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        print(simulator.get_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import pygame
+
+
+class DirtyRectRenderer:
+    """
+    DirtyRectRenderer class
+
+    Draws frames straight onto the display and only pushes the regions that changed. Each frame, the regions drawn over
+    during the previous frame are restored from the static field, the dynamic elements are drawn again, and only the
+    union of old and new regions is updated on the display.
+
+    The static field is expected to be pre-rendered at the window's resolution, so nothing is scaled per frame. The whole
+    frame is redrawn and flipped when the field is replaced or the window changes size.
+    """
+
+    def __init__(self, screen):
+        """
+        :param screen:      The display Surface
+        """
+
+        self.screen = screen
+
+        self._field = None
+        self._screen_size = None
+        self._full_redraw = True
+
+        # Regions of the screen drawn over during the previous and the current frame
+        self._previous_rects = []
+        self._drawn_rects = []
+
+    def invalidate(self):
+        """
+        Force the next frame to be redrawn and pushed to the display in full, e.g. after the window was exposed.
+        """
+
+        self._full_redraw = True
+
+    def begin_frame(self, field):
+        """
+        Start drawing a frame by restoring the regions drawn over last frame from the static field.
+
+        :param field:   The static field background Surface, the same size as the window
+        :return:        The Surface to draw this frame's dynamic elements on
+        """
+
+        if field is not self._field or self.screen.get_size() != self._screen_size:
+            self._full_redraw = True
+
+        if self._full_redraw:
+            self._field = field
+            self._screen_size = self.screen.get_size()
+            self.screen.blit(field, (0, 0))
+        else:
+            for rect in self._previous_rects:
+                self.screen.blit(field, rect, rect)
+
+        self._drawn_rects = []
+
+        return self.screen
+
+    def add(self, rect):
+        """
+        Register a region of the screen that was drawn over this frame.
+
+        :param rect:    The Rect returned by the draw call, or None if nothing was drawn
+        """
+
+        if rect:
+            self._drawn_rects.append(pygame.Rect(rect).clip(self.screen.get_rect()))
+
+    def end_frame(self):
+        """
+        Push the frame to the display, updating only the changed regions when possible.
+        """
+
+        if self._full_redraw:
+            pygame.display.flip()
+            self._full_redraw = False
+        else:
+            pygame.display.update(self._merge_rects(self._previous_rects + self._drawn_rects))
+
+        self._previous_rects = self._drawn_rects
+
+    @staticmethod
+    def _merge_rects(rects):
+        """
+        Combine overlapping rects so overlapping regions are only pushed once.
+
+        :param rects:   A list of Rects
+        :return:        A list of non-overlapping Rects covering the same regions
+        """
+
+        merged = []
+        for rect in rects:
+            if not rect:
+                continue
+
+            # Keep absorbing merged rects until the grown rect doesn't touch any of them
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect = rect.union(merged.pop(index))
+                index = rect.collidelist(merged)
+
+            merged.append(rect)
+
+        return merged
@@ -0,0 +1,137 @@
+import numpy
+import pygame
+
+
+class FieldTransform:
+    """
+    FieldTransform class
+
+    Maps the logical field coordinates that the GUI lays elements out in onto pixels of the window, so the field and
+    its elements can be drawn at the window's actual resolution. Instances are cached and only rebuilt when the window
+    is resized.
+
+    Positions reported by the camera server are in field coordinates, with y pointing up the field. The affine maps from
+    field to logical coordinates and from field to window pixels, and their inverses, are composed once here and applied
+    to whole arrays of points with NumPy, so transforming every tracked object costs about the same as transforming one.
+    """
+
+    def __init__(self, logical_size, screen_size, field_size=None):
+        """
+        :param logical_size:    (width, height) of the logical field
+        :param screen_size:     (width, height) of the window in pixels
+        :param field_size:      (Optional) (length, width) of the field in field units, e.g. feet. Defaults to field
+                                coordinates being the same as logical coordinates.
+        """
+
+        self.logical_size = tuple(logical_size)
+        self.screen_size = tuple(screen_size)
+
+        self.scale_x = self.screen_size[0] / self.logical_size[0]
+        self.scale_y = self.screen_size[1] / self.logical_size[1]
+
+        # 2x3 affine matrices, applied to a point p as matrix[:, :2] @ p + matrix[:, 2]
+        if field_size is None:
+            self.field_size = self.logical_size
+            field_to_logical = numpy.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        else:
+            self.field_size = tuple(field_size)
+            field_to_logical = numpy.array([
+                [self.logical_size[0] / self.field_size[0], 0.0, 0.0],
+                [0.0, -self.logical_size[1] / self.field_size[1], self.logical_size[1]],
+            ])
+
+        logical_to_screen = numpy.array([[self.scale_x, 0.0, 0.0], [0.0, self.scale_y, 0.0]])
+
+        self._field_to_logical = field_to_logical
+        self._field_to_screen = self._compose(logical_to_screen, field_to_logical)
+        self._screen_to_field = self._invert(self._field_to_screen)
+
+    @staticmethod
+    def _compose(outer, inner):
+        """
+        :return:    The affine matrix applying inner and then outer
+        """
+
+        return numpy.hstack((outer[:, :2] @ inner[:, :2], (outer[:, :2] @ inner[:, 2] + outer[:, 2])[:, None]))
+
+    @staticmethod
+    def _invert(matrix):
+        """
+        :return:    The affine matrix undoing matrix
+        """
+
+        linear = numpy.linalg.inv(matrix[:, :2])
+        return numpy.hstack((linear, (-linear @ matrix[:, 2])[:, None]))
+
+    @staticmethod
+    def _apply(matrix, points):
+        """
+        :param matrix:  A 2x3 affine matrix
+        :param points:  An (x, y) point or a sequence of them, as anything numpy.asarray accepts
+        :return:        An array of the same shape holding the transformed points
+        """
+
+        return numpy.asarray(points, dtype=numpy.float64) @ matrix[:, :2].T + matrix[:, 2]
+
+    def field_to_logical(self, points):
+        """
+        :param points:  An (x, y) point or an N x 2 array of points in field coordinates
+        :return:        The points in logical coordinates, as an array of the same shape
+        """
+
+        return self._apply(self._field_to_logical, points)
+
+    def field_to_screen(self, points):
+        """
+        :param points:  An (x, y) point or an N x 2 array of points in field coordinates
+        :return:        The points in window pixels, as an array of the same shape
+        """
+
+        return self._apply(self._field_to_screen, points)
+
+    def screen_to_field(self, points):
+        """
+        :param points:  An (x, y) point or an N x 2 array of points in window pixels, e.g. mouse positions
+        :return:        The points in field coordinates, as an array of the same shape
+        """
+
+        return self._apply(self._screen_to_field, points)
+
+    def point(self, point):
+        """
+        :param point:   (x, y) in logical coordinates
+        :return:        (x, y) in window pixels
+        """
+
+        return point[0] * self.scale_x, point[1] * self.scale_y
+
+    def rect(self, rect):
+        """
+        :param rect:    A Rect in logical coordinates
+        :return:        The Rect covering the same region in window pixels
+        """
+
+        left = round(rect[0] * self.scale_x)
+        top = round(rect[1] * self.scale_y)
+        right = round((rect[0] + rect[2]) * self.scale_x)
+        bottom = round((rect[1] + rect[3]) * self.scale_y)
+
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def length(self, length):
+        """
+        Scale a length, such as a line width, keeping it at least one pixel long.
+
+        :param length:  A length in logical units
+        :return:        The length in whole window pixels
+        """
+
+        return max(1, round(length * min(self.scale_x, self.scale_y)))
+
+    def to_logical(self, point):
+        """
+        :param point:   (x, y) in window pixels, e.g. a mouse position
+        :return:        (x, y) in logical coordinates
+        """
+
+        return point[0] / self.scale_x, point[1] / self.scale_y
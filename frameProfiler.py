@@ -0,0 +1,155 @@
+import csv
+import json
+import math
+import time
+
+
+class FrameProfiler:
+    """
+    FrameProfiler class
+
+    Times the phases of each frame of the render loop into a fixed-size ring buffer, so the most recent frames can be
+    summarized on screen while the session runs and exported when it ends.
+
+    Each frame is a row with one column per phase. mark() adds the time since the previous mark to a phase's column, so
+    timing a phase costs one perf_counter() call and a list store. Columns that aren't timed phases, such as how old the
+    newest snapshot was, are set with record().
+    """
+
+    def __init__(self, phases, capacity=3600):
+        """
+        :param phases:      Names of the columns of each frame, in order
+        :param capacity:    Number of most recent frames kept
+        """
+
+        self.phases = tuple(phases)
+        self.capacity = capacity
+
+        self._columns = {phase: i for i, phase in enumerate(self.phases)}
+        self._zeros = [0.0] * len(self.phases)
+        self._rows = [list(self._zeros) for _ in range(capacity)]
+        self._frame_starts = [0.0] * capacity
+
+        # Index of the row of the current frame, and number of frames profiled so far
+        self._index = 0
+        self._count = 0
+
+        self._row = self._rows[0]
+        self._last_mark = time.perf_counter()
+
+    def begin_frame(self):
+        """
+        Start timing a new frame, overwriting the oldest one if the buffer is full.
+        """
+
+        self._index = self._count % self.capacity
+        self._count += 1
+
+        self._row = self._rows[self._index]
+        self._row[:] = self._zeros
+
+        self._last_mark = time.perf_counter()
+        self._frame_starts[self._index] = time.time()
+
+    def mark(self, phase):
+        """
+        End a phase of the current frame, which started at the previous mark or at the start of the frame.
+
+        :param phase:   Name of the phase
+        """
+
+        now = time.perf_counter()
+        self._row[self._columns[phase]] += now - self._last_mark
+        self._last_mark = now
+
+    def record(self, column, value):
+        """
+        Set a column of the current frame that isn't a timed phase.
+
+        :param column:  Name of the column
+        :param value:   Value in seconds
+        """
+
+        self._row[self._columns[column]] = value
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def frames_profiled(self):
+        """
+        Number of frames profiled so far, including those overwritten in the buffer since.
+        """
+
+        return self._count
+
+    def frames(self, num_frames=None):
+        """
+        :param num_frames:  (Optional) Number of most recent frames. Defaults to every frame in the buffer.
+        :return:            A list of (frame number, start time, row) tuples, oldest first. The current frame is
+                            included.
+        """
+
+        num_frames = len(self) if num_frames is None else min(num_frames, len(self))
+
+        frames = []
+        for frame in range(self._count - num_frames, self._count):
+            index = frame % self.capacity
+            frames.append((frame, self._frame_starts[index], self._rows[index]))
+
+        return frames
+
+    def summary(self, num_frames=None):
+        """
+        Summarize the most recent frames, leaving out the frame in progress.
+
+        :param num_frames:  (Optional) Number of most recent finished frames. Defaults to every one in the buffer.
+        :return:            A dict of column name to a dict of the mean, 95th percentile and maximum in milliseconds
+        """
+
+        rows = [row for _, _, row in self.frames(None if num_frames is None else num_frames + 1)[:-1]]
+
+        summary = {}
+        for column, phase in enumerate(self.phases):
+            values = sorted(row[column] * 1000 for row in rows)
+            if not values:
+                summary[phase] = {'mean': 0.0, 'p95': 0.0, 'max': 0.0}
+                continue
+
+            summary[phase] = {
+                'mean': sum(values) / len(values),
+                'p95': values[min(len(values) - 1, math.ceil(0.95 * len(values)) - 1)],
+                'max': values[-1],
+            }
+
+        return summary
+
+    def export_csv(self, path):
+        """
+        Write every frame in the buffer to a CSV file, one row per frame with times in milliseconds.
+
+        :param path:    Path of the file to write
+        """
+
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(('frame', 'time') + self.phases)
+            for frame, start, row in self.frames():
+                writer.writerow([frame, format(start, '.6f')] + [format(value * 1000, '.3f') for value in row])
+
+    def export_json(self, path):
+        """
+        Write the summary of every frame in the buffer and the frames themselves to a JSON file, with times in
+        milliseconds.
+
+        :param path:    Path of the file to write
+        """
+
+        with open(path, 'w') as json_file:
+            json.dump({
+                'phases': list(self.phases),
+                'frames_profiled': self.frames_profiled,
+                'summary': self.summary(),
+                'frames': [{'frame': frame, 'time': start, 'ms': [value * 1000 for value in row]}
+                           for frame, start, row in self.frames()],
+            }, json_file)
@@ -0,0 +1,291 @@
+import abc
+import os
+import queue
+import threading
+
+import pygame
+
+from traceBuffer import TRACE
+
+
+class Recorder(abc.ABC):
+    """
+    Recorder class
+
+    Records frames off the render path. submit() only copies the frame's pixels and hands them to writer threads over a
+    bounded queue; encoding and writing happen on the writer threads. When the queue is full, the configured policy
+    decides whether a frame is dropped or the render loop waits.
+
+    Subclasses decide how pixels are captured and what is done with them.
+    """
+
+    # What submit() does when the queue is full
+    DROP_OLDEST = 'drop-oldest'     # Drop the oldest queued frame to make room for the new one
+    DROP_NEWEST = 'drop-newest'     # Drop the new frame
+    BLOCK = 'block'                 # Wait for a writer to make room
+
+    def __init__(self, queue_size=16, policy=DROP_OLDEST, num_writers=1):
+        """
+        :param queue_size:      (Optional) Number of frames that may be waiting to be written
+        :param policy:          (Optional) DROP_OLDEST, DROP_NEWEST or BLOCK
+        :param num_writers:     (Optional) Number of writer threads
+        """
+
+        self.policy = policy
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writers = [threading.Thread(target=self._write_frames, name=type(self).__name__ + str(i), daemon=True)
+                         for i in range(num_writers)]
+
+        self._count_lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        for writer in self._writers:
+            writer.start()
+
+    def submit(self, surface, timestamp):
+        """
+        Queue a copy of a frame to be recorded.
+
+        :param surface:     The Surface to record. Its pixels are copied, so it may be drawn on as soon as this returns.
+        :param timestamp:   Time the frame was captured, in seconds
+        :return:            False if the frame was dropped because the queue was full
+        """
+
+        frame = (timestamp, self._capture(surface))
+        self.submitted += 1
+
+        if self.policy == self.BLOCK:
+            self._queue.put(frame)
+            return True
+
+        try:
+            self._queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            pass
+
+        if self.policy == self.DROP_NEWEST:
+            self._count_dropped()
+            return False
+
+        # Make room by dropping the oldest queued frame. A writer may take it first, in which case nothing is dropped.
+        try:
+            self._queue.get_nowait()
+            self._count_dropped()
+        except queue.Empty:
+            pass
+
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            self._count_dropped()
+            return False
+
+        return True
+
+    @abc.abstractmethod
+    def _capture(self, surface):
+        """
+        Copy the pixels of a frame on the render thread.
+
+        :param surface:     The Surface to record
+        :return:            A copy of the frame that _write() can use after the Surface has been drawn on
+        """
+
+        pass
+
+    @abc.abstractmethod
+    def _write(self, timestamp, pixels):
+        """
+        Encode and write a captured frame on a writer thread.
+
+        :param timestamp:   Time the frame was captured, in seconds
+        :param pixels:      The copy returned by _capture()
+        """
+
+        pass
+
+    def _finish(self):
+        """
+        Called on a writer thread once every queued frame has been written.
+        """
+
+        pass
+
+    def _count_dropped(self):
+        with self._count_lock:
+            self.dropped += 1
+
+    def _write_frames(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+
+            timestamp, pixels = frame
+            # Any failure only loses this frame, since a writer that stopped would leave submit() and close() waiting on a
+            # queue nobody empties
+            try:
+                self._write(timestamp, pixels)
+            except Exception as e:
+                TRACE.error('Failed to record frame %s: %r', timestamp, e)
+                with self._count_lock:
+                    self.failed += 1
+                continue
+
+            with self._count_lock:
+                self.written += 1
+
+    def get_stats(self):
+        """
+        :return:    A dict of the number of frames submitted, written, dropped, failed and still queued
+        """
+
+        with self._count_lock:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'queued': self._queue.qsize(),
+            }
+
+    def close(self):
+        """
+        Write the frames that are still queued and stop the writer threads.
+        """
+
+        for _ in self._writers:
+            self._queue.put(None)
+        for writer in self._writers:
+            writer.join()
+
+        self._finish()
+
+
+class FrameRecorder(Recorder):
+    """
+    FrameRecorder class
+
+    Saves each recorded frame as an image file named after its timestamp, for makeVideo() to compile later.
+    """
+
+    def __init__(self, folder, extension='.jpg', **kwargs):
+        """
+        :param folder:          Folder to save frames in. It must already exist.
+        :param extension:       (Optional) File extension, which determines the image format
+        :param kwargs:          Queue options, see Recorder
+        """
+
+        super().__init__(**kwargs)
+
+        self.folder = folder
+        self.extension = extension
+
+        self.start()
+
+    def _capture(self, surface):
+        return surface.get_size(), pygame.image.tobytes(surface, 'RGB')
+
+    def _write(self, timestamp, pixels):
+        size, data = pixels
+        surface = pygame.image.frombytes(data, size, 'RGB')
+        pygame.image.save(surface, os.path.join(self.folder, str(timestamp) + self.extension))
+
+
+class VideoRecorder(Recorder):
+    """
+    VideoRecorder class
+
+    Encodes recorded frames straight into a video file with OpenCV, so there are no intermediate image files and the
+    video is ready as soon as recording stops.
+
+    Frames are read from the Surface through a pixel view and copied once, already in the BGR row-major layout that
+    OpenCV expects. The video has a constant frame rate: frames are repeated or skipped according to their timestamps so
+    playback runs in real time even when frames were captured late. Frames are resized to the size of the first frame if
+    the window is resized while recording.
+    """
+
+    FOURCC = 'mp4v'
+
+    def __init__(self, file_name, frame_rate, **kwargs):
+        """
+        :param file_name:       Path of the video file to write
+        :param frame_rate:      Frame rate of the video
+        :param kwargs:          Queue options, see Recorder. Only a single writer is used, since frames must be
+                                written in order.
+        """
+
+        import numpy
+
+        kwargs['num_writers'] = 1
+        super().__init__(**kwargs)
+
+        # OpenCV is slow to import and only needed to encode, so it is imported on the writer thread by the first write
+        # instead of delaying the first frame
+        self._cv2 = None
+        self._numpy = numpy
+
+        self.file_name = file_name
+        self.frame_rate = frame_rate
+
+        # Opened once the size of the first frame is known
+        self._video = None
+        self._size = None
+        self._start_time = None
+        self._num_video_frames = 0
+        self._last_frame = None
+
+        self.start()
+
+    def _capture(self, surface):
+        # pixels3d is a view of the Surface indexed [x][y]; a single copy turns it into [y][x] BGR and releases the view
+        view = pygame.surfarray.pixels3d(surface)
+        frame = self._numpy.ascontiguousarray(view.transpose(1, 0, 2)[:, :, ::-1])
+        del view
+
+        return frame
+
+    def _write(self, timestamp, pixels):
+        if self._cv2 is None:
+            import cv2
+            self._cv2 = cv2
+        cv2 = self._cv2
+
+        # Only kept once it has opened, so every frame fails until one opens it rather than being counted as written
+        if self._video is None:
+            height, width = pixels.shape[:2]
+            video = cv2.VideoWriter(self.file_name, cv2.VideoWriter_fourcc(*self.FOURCC), self.frame_rate,
+                                    (width, height))
+            if not video.isOpened():
+                raise OSError('Could not open video file ' + self.file_name)
+
+            self._video = video
+            self._size = (width, height)
+            self._start_time = timestamp
+
+        if (pixels.shape[1], pixels.shape[0]) != self._size:
+            pixels = cv2.resize(pixels, self._size, interpolation=cv2.INTER_AREA)
+
+        # Repeat the previous frame to cover any time the recording fell behind, then write the frame itself unless
+        # it is early
+        target_frames = round((timestamp - self._start_time) * self.frame_rate) + 1
+        while self._last_frame is not None and self._num_video_frames < target_frames - 1:
+            self._video.write(self._last_frame)
+            self._num_video_frames += 1
+
+        if self._num_video_frames < target_frames:
+            self._video.write(pixels)
+            self._num_video_frames += 1
+
+        self._last_frame = pixels
+
+    def _finish(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
@@ -1,68 +1,183 @@
-import cv2
+# Imported first so the startup profile covers every other import
+from startupProfile import STARTUP
+
+import argparse
 import datetime
 import os
 import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from multiCameraClient import MERGE_RULES, parse_source
 from scanGUI import ScanGUI
+from traceBuffer import TRACE, INFO
+
+STARTUP.mark('imports')
 
-# If set to True, will attempt to connect to localhost instead of external camera system
+# If set to True, will attempt to connect to localhost instead of external camera system, e.g. python cameraSimulator.py
 TEST = False
 SAVE_FRAME_RATE = 0     # Frame rate to save animated frames for later viewing. Will not save if set to 0 or negative.
 
+# Overhead cameras to merge the snapshots of, e.g. [CameraSource('overheadcam1'), CameraSource('overheadcam2', 5000)].
+# Leave empty to connect to the single default camera.
+CAMERAS = []
+
+# Lowest level of events kept in the in-memory trace, which is dumped with F4 or when the application crashes. DEBUG
+# keeps every received snapshot and transformed point.
+TRACE_LEVEL = INFO
+
+
+def makeVideo(file_name, image_folder, frame_rate, num_workers=None, read_ahead=None, executor=None,
+              delete_if_empty=False):
+    """
+    Compile a folder of recorded frames into a video.
 
-def makeVideo(file_name, image_folder, frame_rate):
+    Frames are decoded by a pool of threads while the calling thread encodes, so decoding overlaps encoding. Up to
+    read_ahead frames are decoded ahead of the encoder and written in their original order.
+
+    :param file_name:       Path of the video to write, without the .mp4 extension
+    :param image_folder:    Folder of .jpg frames, named so that they sort in recording order
+    :param frame_rate:      Frame rate of the video
+    :param num_workers:     (Optional) Number of decoding threads. 1 decodes serially on the calling thread.
+    :param read_ahead:      (Optional) Number of frames decoded ahead of the encoder. Defaults to twice num_workers.
+    :param executor:        (Optional) Executor to decode with instead of creating one, e.g. to share it across folders
+    :param delete_if_empty: (Optional) Delete the folder if it holds no frames, e.g. the folder of a session that never
+                            connected. Folders given to compile are otherwise left as they are.
+    :return:                Number of frames written
+    """
+
+    # OpenCV is slow to import, so the display doesn't load it unless compiling videos
+    import cv2
 
     if not os.path.exists(image_folder):
         raise FileNotFoundError('Image folder \'' + image_folder + '\' does not exist')
 
-    images = [img for img in sorted(os.listdir(image_folder)) if img.endswith('.jpg')]
+    images = [img for img in sorted(os.listdir(image_folder)) if img.lower().endswith('.jpg')]
     if len(images) < 1:
-        shutil.rmtree(image_folder)
-        return
+        if delete_if_empty:
+            shutil.rmtree(image_folder)
+        else:
+            print('Skipped ' + image_folder + ', which holds no .jpg frames')
+        return 0
+
+    start = time.time()
+    paths = [os.path.join(image_folder, image) for image in images]
 
-    frame = cv2.imread(os.path.join(image_folder, images[0]))
+    frame = cv2.imread(paths[0])
     height, width, layers = frame.shape
 
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     video = cv2.VideoWriter(file_name + '.mp4', fourcc, frame_rate, (width, height))
 
-    for image in images:
-        video.write(cv2.imread(os.path.join(image_folder, image)))
+    num_workers = num_workers or os.cpu_count() or 1
+
+    if num_workers == 1 and executor is None:
+        for path in paths:
+            video.write(cv2.imread(path))
+    else:
+        read_ahead = read_ahead or 2 * num_workers
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='FrameDecoder')
+
+        try:
+            # Keep read_ahead decodes in flight and write their results in order as they complete
+            pending = deque()
+            next_path = 0
+            while next_path < len(paths) or pending:
+                while next_path < len(paths) and len(pending) < read_ahead:
+                    pending.append(executor.submit(cv2.imread, paths[next_path]))
+                    next_path += 1
+
+                video.write(pending.popleft().result())
+        finally:
+            if own_executor:
+                executor.shutdown()
 
     video.release()
 
+    elapsed = time.time() - start
+    print('Compiled ' + str(len(paths)) + ' frames into ' + file_name + '.mp4 in ' + format(elapsed, '.1f') + ' s (' +
+          format(len(paths) / max(elapsed, 1e-9), '.1f') + ' frames/s)')
 
-def main():
-    run = True
+    return len(paths)
 
-    while run:
-        # Get a unique name for the recording of the session
-        session_name = 'animation_' + datetime.datetime.now().strftime('%Y_%m_%d__%H_%M_%S')
 
-        session_success = False
-        gui = ScanGUI(test=TEST, session_name=session_name)
-        
-        try:
-            session_success = gui.run(connect_attempt_limit=10)
-        except ConnectionRefusedError as e:
-            print('Server not found, trying again...')
-            continue
+def makeVideos(image_folders, frame_rate, num_workers=None, read_ahead=None):
+    """
+    Compile many folders of recorded frames into videos named after the folders, sharing one pool of decoding threads.
+
+    :param image_folders:   Folders of .jpg frames
+    :param frame_rate:      Frame rate of the videos
+    :param num_workers:     (Optional) Number of decoding threads
+    :param read_ahead:      (Optional) Number of frames decoded ahead of the encoder
+    :return:                Total number of frames written
+    """
+
+    num_workers = num_workers or os.cpu_count() or 1
+
+    start = time.time()
+    num_frames = 0
+
+    with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='FrameDecoder') as executor:
+        for image_folder in image_folders:
+            num_frames += makeVideo(os.path.normpath(image_folder), image_folder, frame_rate, num_workers, read_ahead,
+                                    executor)
+
+    elapsed = time.time() - start
+    print('Compiled ' + str(num_frames) + ' frames from ' + str(len(image_folders)) + ' folders in ' +
+          format(elapsed, '.1f') + ' s (' + format(num_frames / max(elapsed, 1e-9), '.1f') + ' frames/s)')
+
+    return num_frames
+
+
+def main(cameras=CAMERAS):
+    TRACE.set_level(TRACE_LEVEL)
+    TRACE.install_crash_handler()
 
-        except ConnectionResetError as e:
-            print('Connection reset by server, closing application')
+    # Get a unique name for the recording of the session
+    session_name = 'animation_' + datetime.datetime.now().strftime('%Y_%m_%d__%H_%M_%S')
 
-            gui.shutdown()
+    # The session reconnects to the server by itself, so the window is only created once
+    gui = ScanGUI(test=TEST, session_name=session_name, cameras=cameras)
 
-            run = False
+    session_success = False
+    try:
+        session_success = gui.run(connect_attempt_limit=None)
+    finally:
+        gui.shutdown()
 
-        # # Compile the recorded frames into a video
-        # if session_success:
-        #     print('Compiling video, please wait...')
-        #     makeVideo(file_name=session_name, image_folder=session_name, frame_rate=gui.get_avg_frame_rate())
-        # # If the session failed to connect, delete the frames that were saved and the folder containing them
-        # elif os.path.exists(session_name):
-        #     shutil.rmtree(session_name)
+    # # Compile the recorded frames into a video
+    # if session_success:
+    #     print('Compiling video, please wait...')
+    #     makeVideo(file_name=session_name, image_folder=session_name, frame_rate=gui.get_avg_frame_rate(),
+    #               delete_if_empty=True)
+    # # If the session failed to connect, delete the frames that were saved and the folder containing them
+    # elif os.path.exists(session_name):
+    #     shutil.rmtree(session_name)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Scan & Score sideline display.')
+    parser.add_argument('--make-video', nargs='+', metavar='FOLDER',
+                        help='Compile folders of recorded frames into videos instead of starting the display')
+    parser.add_argument('--fps', type=float, default=4, help='Frame rate of compiled videos')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of decoding threads for compiling videos. 1 decodes serially.')
+    parser.add_argument('--camera', action='append', type=parse_source, metavar='HOST[:PORT[:CONFIDENCE]]',
+                        help='Connect to this camera or camera relay instead of the default camera. Repeat to merge '
+                             'the snapshots of several cameras.')
+    parser.add_argument('--merge', choices=MERGE_RULES, default=ScanGUI.CAMERA_MERGE_RULE,
+                        help='How a robot seen by several cameras is placed')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='Print how long each step of starting up took once the first frame is drawn')
+    args = parser.parse_args()
+
+    STARTUP.verbose = args.startup_profile
+    ScanGUI.CAMERA_MERGE_RULE = args.merge
+
+    if args.make_video:
+        makeVideos(args.make_video, args.fps, args.workers)
+    else:
+        main(args.camera or CAMERAS)
@@ -0,0 +1,368 @@
+"""
+Fan-in of several overhead cameras into a single stream of snapshots.
+
+Each camera is an ordinary camera server with its own CameraClient. MultiCameraClient multiplexes their sockets with
+one selector on whichever thread receives, so several cameras need no more threads than one, and has the same interface
+as CameraClient: ScanGUI and CameraReceiver use it without knowing how many cameras there are.
+
+Snapshots are merged by capture time. Each CameraClient converts its server's capture times to this machine's clock, so
+the cameras' times are comparable. The oldest snapshot not yet merged is grouped with the other cameras' snapshots
+captured within the merge window after it, waiting up to the merge window for cameras that haven't sent theirs yet.
+Robots seen by several cameras in a group are resolved by the merge rule:
+
+    latest      The detection captured last
+    confidence  The detection from the camera with the highest confidence, e.g. the one looking straight down on that
+                part of the field. The protocol doesn't carry a confidence per detection, so it is set per camera.
+    average     The average of the detections, weighted by the cameras' confidence
+"""
+
+import selectors
+import socket
+import time
+from collections import deque, namedtuple
+
+import cameraProtocol
+from cameraClient import CameraClient
+from traceBuffer import TRACE
+
+
+# Rules for resolving a robot seen by several cameras
+MERGE_LATEST = 'latest'
+MERGE_CONFIDENCE = 'confidence'
+MERGE_AVERAGE = 'average'
+MERGE_RULES = (MERGE_LATEST, MERGE_CONFIDENCE, MERGE_AVERAGE)
+
+# A camera server to connect to. port None is the default camera server port.
+CameraSource = namedtuple('CameraSource', ['host', 'port', 'confidence'], defaults=(None, 1.0))
+
+
+def parse_source(text):
+    """
+    Parse a camera given on the command line.
+
+    :param text:    HOST, HOST:PORT or HOST:PORT:CONFIDENCE
+    :return:        A CameraSource
+    """
+
+    host, _, rest = text.partition(':')
+    port, _, confidence = rest.partition(':')
+
+    return CameraSource(host, int(port) if port else None, float(confidence) if confidence else 1.0)
+
+
+class MultiCameraClient:
+    """
+    MultiCameraClient class
+
+    Receives snapshots from several camera servers over one selector and merges them into one stream of snapshots.
+    Cameras that drop out are reconnected in between receiving from the others; receiving only fails once every camera
+    has been lost.
+    """
+
+    # Connection states, the same as CameraClient's. The client is connected while any camera is.
+    STATE_DISCONNECTED = CameraClient.STATE_DISCONNECTED
+    STATE_CONNECTED = CameraClient.STATE_CONNECTED
+
+    # Seconds after the oldest unmerged snapshot within which other cameras' snapshots are merged with it
+    MERGE_WINDOW = 0.05
+
+    # Unmerged snapshots kept per camera before the oldest is dropped
+    MAX_PENDING = 4
+
+    # Longest wait in seconds for a socket to become readable, so cameras that are reconnecting or have gone quiet are
+    # checked on regularly
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, sources, rule=MERGE_LATEST, merge_window=MERGE_WINDOW, **kwargs):
+        """
+        :param sources:         CameraSource of each camera
+        :param rule:            (Optional) One of MERGE_RULES, for robots seen by several cameras
+        :param merge_window:    (Optional) Seconds of capture time merged into one snapshot
+        :param kwargs:          (Optional) Options of each CameraClient, e.g. encodings
+        """
+
+        if rule not in MERGE_RULES:
+            raise ValueError('Unknown merge rule ' + repr(rule) + ', expected one of ' + str(MERGE_RULES))
+        if not sources:
+            raise ValueError('No cameras given')
+
+        self.sources = [CameraSource(*source) for source in sources]
+        self.clients = [CameraClient(False, False, host=source.host, port=source.port, **kwargs)
+                        for source in self.sources]
+        self.rule = rule
+        self.merge_window = merge_window
+
+        self.state = self.STATE_DISCONNECTED
+        self.config = None
+        self.last_error = None
+
+        # Seconds spent decoding the snapshots merged into the most recent one, for profiling
+        self.decode_time = 0.0
+        self._decode_time = 0.0
+
+        # Snapshots dropped because a camera got more than MAX_PENDING ahead of the others
+        self.dropped = 0
+
+        self._selector = selectors.DefaultSelector()
+        self._connected = set()
+        self._closed = False
+
+        # Unmerged (arrival time, snapshot) tuples of each camera, oldest first, and when each camera last sent anything
+        self._pending = [deque() for _ in self.sources]
+        self._last_receive = [0.0] * len(self.sources)
+
+        self._sequence = 0
+
+    @property
+    def failed_attempts(self):
+        """
+        Number of consecutive failed connection attempts of the camera that has failed least, so giving up after a
+        number of attempts means every camera has failed that often.
+        """
+
+        return min(client.failed_attempts for client in self.clients)
+
+    def connect(self):
+        """
+        Connect to the cameras, waiting until one of them is connected or every one has failed.
+
+        :return:        The config dict received from the first camera connected
+        :raises:        The error the last failed attempt failed with
+        """
+
+        while True:
+            if self.poll_connect() == self.STATE_CONNECTED:
+                return self.config
+            if all(client.failed_attempts for client in self.clients):
+                raise self.last_error
+
+            time.sleep(0.001)
+
+    def poll_connect(self, now=None):
+        """
+        Advance the connection to each camera that isn't connected without blocking, see CameraClient.poll_connect().
+
+        :param now:     (Optional) Current time.monotonic()
+        :return:        STATE_CONNECTED once any camera is connected, otherwise STATE_DISCONNECTED
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        self._poll_cameras(now)
+
+        if self._connected:
+            self.state = self.STATE_CONNECTED
+        else:
+            errors = [client.last_error for client in self.clients if client.last_error is not None]
+            self.last_error = errors[-1] if errors else None
+
+        return self.state
+
+    def _poll_cameras(self, now):
+        """
+        Advance the connections of cameras that aren't connected, and drop connected cameras that have gone quiet.
+        """
+
+        for i, client in enumerate(self.clients):
+            if i not in self._connected:
+                if client.poll_connect(now) == CameraClient.STATE_CONNECTED:
+                    self._attach(i, now)
+
+            elif now - self._last_receive[i] > client.RECEIVE_TIMEOUT:
+                self._detach(i, socket.timeout('Nothing received from ' + self.sources[i].host + ' for ' +
+                                               str(client.RECEIVE_TIMEOUT) + ' s'))
+
+    def _attach(self, i, now):
+        client = self.clients[i]
+
+        self._selector.register(client, selectors.EVENT_READ, i)
+        self._connected.add(i)
+        self._last_receive[i] = now
+
+        if self.config is None:
+            self.config = client.config
+
+        TRACE.info('Camera %s connected with config %s', self.sources[i].host, client.config)
+
+    def _detach(self, i, error):
+        # Unregistered before the socket is closed, since a closed socket has no file descriptor to look it up by
+        self._selector.unregister(self.clients[i])
+        self._connected.discard(i)
+
+        self.clients[i].disconnect(error)
+        self.last_error = error
+
+    def disconnect(self, error=None):
+        """
+        Drop every camera connection, e.g. after receiving failed, so poll_connect() reconnects straight away. Must not
+        be called while another thread is receiving.
+
+        :param error:   (Optional) The error that ended the connection, kept in last_error
+        """
+
+        for i in list(self._connected):
+            self._detach(i, error)
+
+        for pending in self._pending:
+            pending.clear()
+
+        self.state = self.STATE_DISCONNECTED
+        self.last_error = error
+
+    def receive_snapshot(self):
+        """
+        Receive the next merged snapshot, reconnecting cameras that dropped out while waiting for it.
+
+        :return:        A cameraProtocol.Snapshot numbered by this client. Its capture_time is the average of the
+                        merged snapshots', on this machine's clock.
+        :raises:        The error the last camera was lost with, once no camera is connected
+        """
+
+        while True:
+            if self._closed:
+                raise ConnectionAbortedError('Camera client closed')
+
+            now = time.monotonic()
+            snapshot = self._merge(now)
+            if snapshot is not None:
+                return snapshot
+
+            self._poll_cameras(now)
+
+            if not self._connected:
+                self.state = self.STATE_DISCONNECTED
+                raise self.last_error or ConnectionError('Every camera was lost')
+
+            # Wait until the oldest snapshot has waited the merge window for the other cameras
+            timeout = self.POLL_INTERVAL
+            heads = [pending[0][0] for pending in self._pending if pending]
+            if heads:
+                timeout = min(timeout, max(0.0, min(heads) + self.merge_window - now))
+
+            # Bytes received along with a previous read don't make the socket readable again
+            buffered = [i for i in self._connected if self.clients[i].buffered()]
+            if buffered:
+                timeout = 0.0
+
+            ready = {key.data for key, _ in self._selector.select(timeout)}
+            for i in ready.union(buffered):
+                self._read(i)
+
+    def _read(self, i):
+        client = self.clients[i]
+
+        try:
+            snapshots = client.receive_ready()
+        except (OSError, ValueError, KeyError) as e:
+            self._detach(i, e)
+            return
+
+        arrival = time.monotonic()
+        self._last_receive[i] = arrival
+
+        pending = self._pending[i]
+        for snapshot in snapshots:
+            self._decode_time += client.decode_time
+
+            if len(pending) >= self.MAX_PENDING:
+                pending.popleft()
+                self.dropped += 1
+            pending.append((arrival, snapshot))
+
+    def _merge(self, now):
+        """
+        Merge the oldest unmerged snapshot with the other cameras' snapshots captured within the merge window after it,
+        once every connected camera has sent one or the merge window has passed since it arrived.
+
+        :param now:     Current time.monotonic()
+        :return:        The merged cameraProtocol.Snapshot, or None if it isn't ready yet
+        """
+
+        waiting = [i for i, pending in enumerate(self._pending) if pending]
+        if not waiting:
+            return None
+
+        first = min(waiting, key=lambda i: self._pending[i][0][1].capture_time)
+        arrival, oldest = self._pending[first][0]
+
+        if not self._connected.issubset(waiting) and now < arrival + self.merge_window:
+            return None
+
+        group = []
+        for i in waiting:
+            snapshot = self._pending[i][0][1]
+            if snapshot.capture_time - oldest.capture_time <= self.merge_window:
+                self._pending[i].popleft()
+                group.append((i, snapshot))
+
+        # Cameras speaking JSON report patterns they don't see as None, which mustn't outvote another camera's detection
+        detections = {}
+        for i, snapshot in group:
+            confidence = self.sources[i].confidence
+            for name, pos in snapshot.points.items():
+                if self._is_position(pos):
+                    detections.setdefault(name, []).append((snapshot.capture_time, confidence, pos))
+
+        points = {name: self._resolve(seen) for name, seen in detections.items()}
+        capture_time = sum(snapshot.capture_time for _, snapshot in group) / len(group)
+
+        sequence = self._sequence
+        self._sequence += 1
+
+        self.decode_time = self._decode_time
+        self._decode_time = 0.0
+
+        return cameraProtocol.Snapshot(sequence, capture_time, points)
+
+    @staticmethod
+    def _is_position(pos):
+        """
+        :return:    True if pos is an [x, y] pair of numbers
+        """
+
+        return (isinstance(pos, (list, tuple)) and len(pos) == 2 and
+                all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in pos))
+
+    def _resolve(self, detections):
+        """
+        :param detections:  (capture time, confidence, [x, y]) of each camera that saw a robot
+        :return:            The robot's [x, y] position according to the merge rule
+        """
+
+        if len(detections) == 1:
+            return detections[0][2]
+
+        if self.rule == MERGE_LATEST:
+            return max(detections, key=lambda detection: detection[0])[2]
+
+        if self.rule == MERGE_CONFIDENCE:
+            return max(detections, key=lambda detection: (detection[1], detection[0]))[2]
+
+        total = sum(confidence for _, confidence, _ in detections)
+        if total <= 0:
+            return [sum(pos[0] for _, _, pos in detections) / len(detections),
+                    sum(pos[1] for _, _, pos in detections) / len(detections)]
+
+        return [sum(confidence * pos[0] for _, confidence, pos in detections) / total,
+                sum(confidence * pos[1] for _, confidence, pos in detections) / total]
+
+    def receive_points(self):
+        """
+        Receive the next merged snapshot's points, see CameraClient.receive_points().
+
+        :return:        A dict of pattern name to [x, y] robot coordinates
+        """
+
+        return self.receive_snapshot().points
+
+    def close(self):
+        """
+        Close every camera connection. A thread receiving from this client stops with an error.
+        """
+
+        self._closed = True
+        for client in self.clients:
+            client.close()
+
+        self.state = self.STATE_DISCONNECTED
@@ -0,0 +1,208 @@
+"""
+Render a recorded session's telemetry log to video without a display.
+
+The session's timeline is split into chunks that are rendered in parallel by a pool of processes, each using SDL's dummy
+video driver and the same field and robot drawing code as ScanGUI. The chunk videos are then concatenated.
+
+    python replay.py animation_2024_01_01__12_00_00.sstl [-o game.mp4] [--fps 30] [--size 1000x500] [--workers 8]
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+# Must be set before pygame is imported, including in the worker processes
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+import telemetryLog
+from scanGUI import ScanGUI
+from telemetryLog import TelemetryReader
+
+
+DEFAULT_FRAME_RATE = 30
+DEFAULT_CHUNK_SECONDS = 60
+FOURCC = 'mp4v'
+
+
+def render_chunk(log_path, chunk_path, start_time, first_frame, num_frames, frame_rate, size):
+    """
+    Render part of a session to a video file. Runs in a worker process.
+
+    :param log_path:        Path of the telemetry log
+    :param chunk_path:      Path of the video file to write
+    :param start_time:      Timestamp of frame 0 of the session
+    :param first_frame:     Index of the first frame of the chunk
+    :param num_frames:      Number of frames in the chunk
+    :param frame_rate:      Frame rate of the video
+    :param size:            (width, height) of the video
+    :return:                chunk_path
+    """
+
+    import cv2
+    import numpy
+
+    reader = TelemetryReader(log_path)
+
+    gui = ScanGUI(test=True, session_name=os.path.splitext(log_path)[0])
+    gui.screen = pygame.display.set_mode(size)
+    # Replayed frames show the field as it was recorded, without the live connection status
+    gui.status_text = None
+    gui.render_field()
+
+    video = cv2.VideoWriter(chunk_path, cv2.VideoWriter_fourcc(*FOURCC), frame_rate, size)
+
+    # Start from the seek point before the last time a robot still on screen when the chunk starts could have been
+    # reported, so the robots, including fading ones, and the cursor are where they were when the chunk starts
+    chunk_start = start_time + first_frame / frame_rate
+    lookback = (ScanGUI.ROBOT_STALE_MS + ScanGUI.ROBOT_FADE_MS) / 1000
+    records = reader.records(seek_time=chunk_start - lookback)
+    pending = next(records, None)
+
+    for frame in range(first_frame, first_frame + num_frames):
+        frame_time = start_time + frame / frame_rate
+
+        # Apply every record up to this frame
+        while pending is not None and pending[1] <= frame_time:
+            record_type, timestamp, value = pending
+
+            if record_type == telemetryLog.RECORD_SNAPSHOT:
+                gui.update_robots(value[1], timestamp * 1000)
+            elif record_type == telemetryLog.RECORD_CURSOR:
+                gui.cursor.x, gui.cursor.y = value
+
+            pending = next(records, None)
+
+        gui.update_robots({}, frame_time * 1000)
+
+        gui.screen.blit(gui.field, (0, 0))
+        gui.draw_dynamic(gui.screen)
+
+        view = pygame.surfarray.pixels3d(gui.screen)
+        video.write(numpy.ascontiguousarray(view.transpose(1, 0, 2)[:, :, ::-1]))
+        del view
+
+    video.release()
+    pygame.quit()
+
+    return chunk_path
+
+
+def _render_chunk(args):
+    return render_chunk(*args)
+
+
+def concatenate(chunk_paths, file_name):
+    """
+    Join chunk videos into one video, without re-encoding if ffmpeg is available.
+
+    :param chunk_paths:     Paths of the chunk videos, in order
+    :param file_name:       Path of the video to write
+    """
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is not None:
+        list_path = os.path.join(os.path.dirname(chunk_paths[0]), 'chunks.txt')
+        with open(list_path, 'w') as list_file:
+            for chunk_path in chunk_paths:
+                list_file.write("file '" + os.path.abspath(chunk_path) + "'\n")
+
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy',
+                        file_name], check=True)
+        return
+
+    import cv2
+
+    video = None
+    for chunk_path in chunk_paths:
+        capture = cv2.VideoCapture(chunk_path)
+
+        if video is None:
+            size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            video = cv2.VideoWriter(file_name, cv2.VideoWriter_fourcc(*FOURCC), capture.get(cv2.CAP_PROP_FPS), size)
+
+        success, frame = capture.read()
+        while success:
+            video.write(frame)
+            success, frame = capture.read()
+
+        capture.release()
+
+    if video is not None:
+        video.release()
+
+
+def replay(log_path, file_name, frame_rate=DEFAULT_FRAME_RATE, size=(ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT),
+           num_workers=None, chunk_seconds=DEFAULT_CHUNK_SECONDS):
+    """
+    Render a session's telemetry log to a video.
+
+    :param log_path:        Path of the telemetry log
+    :param file_name:       Path of the video to write
+    :param frame_rate:      (Optional) Frame rate of the video
+    :param size:            (Optional) (width, height) of the video
+    :param num_workers:     (Optional) Number of worker processes. Defaults to the number of CPUs.
+    :param chunk_seconds:   (Optional) Longest stretch of the session rendered by a single task
+    :return:                Number of frames rendered
+    """
+
+    time_range = TelemetryReader(log_path).get_time_range()
+    if time_range is None:
+        raise ValueError(log_path + ' contains no records')
+
+    start_time, end_time = time_range
+    num_frames = math.floor((end_time - start_time) * frame_rate) + 1
+
+    num_workers = num_workers or os.cpu_count() or 1
+
+    # At least one chunk per worker, and no chunk longer than chunk_seconds
+    num_chunks = max(num_workers, math.ceil(num_frames / (chunk_seconds * frame_rate)))
+    chunk_frames = math.ceil(num_frames / num_chunks)
+
+    with tempfile.TemporaryDirectory(prefix='replay_') as chunk_dir:
+        tasks = []
+        for first_frame in range(0, num_frames, chunk_frames):
+            chunk_path = os.path.join(chunk_dir, 'chunk_' + str(len(tasks)).zfill(5) + '.mp4')
+            tasks.append((log_path, chunk_path, start_time, first_frame, min(chunk_frames, num_frames - first_frame),
+                          frame_rate, tuple(size)))
+
+        with multiprocessing.Pool(min(num_workers, len(tasks))) as pool:
+            chunk_paths = list(pool.imap(_render_chunk, tasks))
+
+        concatenate(chunk_paths, file_name)
+
+    return num_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a recorded session to video without a display.')
+    parser.add_argument('log', help='Telemetry log (.sstl) of the session')
+    parser.add_argument('-o', '--output', help='Video file to write. Defaults to the log name with .mp4.')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FRAME_RATE, help='Frame rate of the video')
+    parser.add_argument('--size', default=str(ScanGUI.SCREEN_WIDTH) + 'x' + str(ScanGUI.SCREEN_HEIGHT),
+                        help='WIDTHxHEIGHT of the video')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--chunk-seconds', type=float, default=DEFAULT_CHUNK_SECONDS,
+                        help='Longest stretch of the session rendered by a single task')
+    args = parser.parse_args()
+
+    file_name = args.output or os.path.splitext(args.log)[0] + '.mp4'
+    size = tuple(int(n) for n in args.size.lower().split('x'))
+
+    start = time.time()
+    num_frames = replay(args.log, file_name, args.fps, size, args.workers, args.chunk_seconds)
+    elapsed = time.time() - start
+
+    print('Rendered ' + str(num_frames) + ' frames to ' + file_name + ' in ' + format(elapsed, '.1f') + ' s (' +
+          format(num_frames / elapsed, '.1f') + ' frames/s)')
+
+
+if __name__ == '__main__':
+    main()
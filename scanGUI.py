@@ -1,14 +1,30 @@
 import math
 import os
 import shutil
+import struct
 import sys
 import time
 
+import numpy
 import pygame
 
 from PycharmUI.UIElement import *
+from PycharmUI.hitTest import SpatialGrid
+from PycharmUI.motionHistory import MotionHistory
 from PycharmUI.robot import Robot
+from PycharmUI.robotRegistry import RobotRegistry
+from PycharmUI.spriteCache import SPRITES
+from PycharmUI.textCache import FONTS, TEXT
 from cameraClient import CameraClient
+from cameraReceiver import CameraReceiver
+from fieldRenderer import DirtyRectRenderer
+from fieldTransform import FieldTransform
+from frameProfiler import FrameProfiler
+from frameRecorder import FrameRecorder, VideoRecorder
+from multiCameraClient import MERGE_LATEST, MultiCameraClient
+from startupProfile import STARTUP
+from telemetryLog import TelemetryWriter
+from traceBuffer import TRACE
 
 
 class ScanGUI:
@@ -34,13 +50,73 @@ class ScanGUI:
 
     TEXT_FONT = None
 
+    # How a robot seen by several cameras is placed when more than one camera is given, one of
+    # multiCameraClient.MERGE_RULES
+    CAMERA_MERGE_RULE = MERGE_LATEST
+
+    # Robots not reported by the server for this long are faded out over ROBOT_FADE_MS and removed
+    ROBOT_STALE_MS = 2000
+    ROBOT_FADE_MS = 1000
+
+    # Robots are drawn where they were ROBOT_DELAY_MS ago, interpolated between the snapshots around that time or
+    # extrapolated up to ROBOT_EXTRAPOLATION_MS past the newest one, so they move smoothly between camera frames. A delay
+    # of about one camera frame interval gives interpolated motion that never overshoots, at the cost of that latency.
+    ROBOT_DELAY_MS = 0
+    ROBOT_EXTRAPOLATION_MS = 100
+
+    # Recording modes. Video mode encodes straight to <session_name>.mp4, frames mode saves one JPEG per frame in the
+    # <session_name> folder for makeVideo() to compile later.
+    RECORD_MODE_VIDEO = 'video'
+    RECORD_MODE_FRAMES = 'frames'
+    RECORD_MODE = RECORD_MODE_VIDEO
+
+    # Log the received points, cursor and UI state of every session to <session_name>.sstl. Much smaller than a recording
+    # and enough to re-render the session later.
+    RECORD_TELEMETRY = True
+
+    # Recorded frames waiting to be written before the recorder starts dropping them
+    RECORD_QUEUE_SIZE = 16
+    RECORD_QUEUE_POLICY = FrameRecorder.DROP_OLDEST
+
+    # Phases of each frame of the render loop timed by the profiler, plus the age of the newest snapshot when it was
+    # drawn. There is no scaling phase, since the field is rendered at the window's resolution; restoring the regions
+    # drawn over last frame takes its place.
+    PHASE_NETWORK = 'network'       # Reading the newest snapshot from the receiver
+    PHASE_DECODE = 'decode'         # Decoding the newest snapshot, done on the receiver thread
+    PHASE_RESTORE = 'restore'
+    PHASE_EVENTS = 'events'
+    PHASE_TELEMETRY = 'telemetry'
+    PHASE_ROBOTS = 'robots'
+    PHASE_DRAW = 'draw'
+    PHASE_IDLE = 'idle'             # Waiting in Clock.tick() to hold the frame rate
+    PHASE_FLIP = 'flip'
+    PHASE_RECORD = 'record'
+    SNAPSHOT_AGE = 'snapshot age'
+    PROFILE_COLUMNS = (PHASE_NETWORK, PHASE_DECODE, PHASE_RESTORE, PHASE_EVENTS, PHASE_TELEMETRY, PHASE_ROBOTS,
+                       PHASE_DRAW, PHASE_IDLE, PHASE_FLIP, PHASE_RECORD, SNAPSHOT_AGE)
+
+    # Frames kept by the profiler, and frames summarized by the overlay toggled with PROFILE_OVERLAY_KEY
+    PROFILE_FRAMES = 3600
+    PROFILE_OVERLAY_FRAMES = 120
+    PROFILE_OVERLAY_KEY = pygame.K_F3
+
+    # Export the profiled frames to <session_name>_timing.csv and <session_name>_timing.json when the session ends
+    PROFILE_EXPORT = True
+
+    # Dump the trace kept in memory to <session_name>_trace.log
+    TRACE_DUMP_KEY = pygame.K_F4
+
+    # Hit-testing layers. UI elements are drawn above robots, so they are hit first.
+    _LAYER_ROBOTS = 0
+    _LAYER_UI_ELEMENTS = 1
+
     pattern_assigments = {
         'X': '322',
         'Y': '98',
         'STAIR': 'INFINITY'
     }
 
-    def __init__(self, test, session_name, use_ip=True):
+    def __init__(self, test, session_name, use_ip=True, cameras=None):
         """
         Initialize a session of the GUI client. Set test to True to connect to a server at localhost or False to connect
         to the server running on a separately connected camera device.
@@ -48,57 +124,183 @@ class ScanGUI:
         :param test:                Boolean indicator of whether this GUI session is a test
         :param session_name:        The name of the GUI session, to be used as a filename for recorded game footage
         :param use_ip:              (Optional) Use the IP address of the server instead of its hostname
+        :param cameras:             (Optional) multiCameraClient.CameraSource of each camera to merge the snapshots of,
+                                    or of a single camera or cameraRelay to connect to, instead of the default camera
         """
 
-        self.cam_client = CameraClient(test, use_ip)
+        if cameras and len(cameras) > 1:
+            self.cam_client = MultiCameraClient(cameras, ScanGUI.CAMERA_MERGE_RULE)
+        elif cameras:
+            self.cam_client = CameraClient(test, use_ip, host=cameras[0].host, port=cameras[0].port)
+        else:
+            self.cam_client = CameraClient(test, use_ip)
         self.config = None
 
+        # Background thread that receives snapshots from the camera server once connected
+        self.receiver = None
+
         # Set the screen size and name for the application
         pygame.init()
+        STARTUP.mark('pygame init')
+
         self.screen = pygame.display.set_mode((ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT), pygame.RESIZABLE)
-        self.field = pygame.Surface((ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT))
         pygame.display.set_caption('Scan & Score')
+        STARTUP.mark('display')
+
+        # Load the robot sprites in the background while waiting for the server
+        SPRITES.preload()
 
-        ScanGUI.TEXT_FONT = pygame.font.SysFont('Arial', 20)  # AAAAAAAAAAAAAAAAAAAAAAHHHHHHHHHHHHH
+        # The static field is rendered at the window's resolution and only re-rendered when the window is resized.
+        # Dynamic elements are laid out in logical coordinates and drawn through the cached transform.
+        self.transform = None
+        self.field = None
+
+        # The field without the status message, kept so changing the message doesn't draw the field again
+        self._field_background = None
+
+        # Only the regions of the field that change each frame are redrawn and pushed to the display
+        self.renderer = DirtyRectRenderer(self.screen)
+
+        ScanGUI.TEXT_FONT = FONTS.get_sys('Arial', 20)  # AAAAAAAAAAAAAAAAAAAAAAHHHHHHHHHHHHH
         self.clock = pygame.time.Clock()
+        STARTUP.mark('fonts')
 
         # Keep track of UI elements that may be interacted with in certain ways
         self.ui_elements = []
         self.active_ui_element = None
 
+        # Tab moves focus through the focusable UI elements in the order they were added, regardless of clicks
+        self.focus_order = []
+
+        # Robots reported by the camera server, keyed by name and drawn separately from the UI elements
+        self.robots = RobotRegistry(stale_ms=ScanGUI.ROBOT_STALE_MS, fade_ms=ScanGUI.ROBOT_FADE_MS)
+
+        # Recent reported positions of each robot and when they were captured, used to draw robots between snapshots
+        self.motion = MotionHistory(delay_ms=ScanGUI.ROBOT_DELAY_MS,
+                                    max_extrapolation_ms=ScanGUI.ROBOT_EXTRAPOLATION_MS)
+
+        # Spatial index of UI elements and robots in logical coordinates, used to find the element under the mouse
+        self.hit_grid = SpatialGrid()
+
         # Recording parameters
+        self.recorder = None
+        self.telemetry = None
         self.save_frame_rate = 0
         self.avg_frame_interval = math.inf
         self.session_name = session_name
 
+        # Time spent in each phase of the most recent frames, shown by the overlay
+        self.profiler = FrameProfiler(ScanGUI.PROFILE_COLUMNS, ScanGUI.PROFILE_FRAMES)
+        self.profile_overlay = False
+        self._profile_overlay_image = None
+
+        # Whether the cursor is being dragged, and its offset from the mouse while it is
+        self.cursor_dragging = False
+        self.cursor_offset = (0, 0)
+
+        # Message shown in the middle of the field, e.g. while waiting for the server
+        self.status_text = 'Waiting for server...'
+
         self.reset_field()
 
-        self.draw_text_center(self.field, 'Waiting for server...', 'black', self.screen.get_width() / 2, self.screen.get_height() / 2)
-        pygame.transform.scale(self.field, self.screen.get_size(), self.screen)
+        self.screen.blit(self.field, (0, 0))
         pygame.display.flip()
+        STARTUP.mark('field')
 
     def reset_field(self):
         # Setting size and initial position of drawn rects to represent bots
         self.cursor = pygame.rect.Rect(ScanGUI.SCREEN_WIDTH / 2, ScanGUI.SCREEN_HEIGHT / 2, ScanGUI.SCREEN_HEIGHT / 20, ScanGUI.SCREEN_HEIGHT/ 20)
-        self.field = pygame.Surface((ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT))
+
+        self.render_field()
+        return
+
+    def render_field(self):
+        """
+        Render the static field (grass, yard lines, labels and borders) and the status message at the window's current
+        resolution, and rebuild the transform used to draw dynamic elements onto it. Only needs to be called again when
+        the window is resized or the status message changes; the field itself is only drawn again on resize.
+        """
+
+        size = self.screen.get_size()
+        if self._field_background is None or self._field_background.get_size() != size:
+            self.transform = FieldTransform((ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT), size,
+                                            (ScanGUI.FIELD_LENGTH, ScanGUI.FIELD_WIDTH))
+            self._field_background = self.draw_field_background()
+
+        self.field = self._field_background.copy()
+
+        if self.status_text:
+            self.draw_text_center(self.field, self.status_text, 'black', self.screen.get_width() / 2,
+                                  self.screen.get_height() / 2)
+
+    def draw_field_background(self):
+        """
+        :return:    A Surface of the field at the window's current resolution, drawn through the current transform
+        """
+
+        background = pygame.Surface(self.screen.get_size())
+
+        transform = self.transform
+        border = transform.rect((0, 0, ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT))
 
         # Fill the screen with a green box and outline it with black and white lines
-        self.field.fill((55, 155, 90))
+        background.fill((55, 155, 90))
 
         # Create vertical lines every 15 feet
         line_spacing = 15
         line_location = 0
         for i in range(int(ScanGUI.FIELD_LENGTH / line_spacing) - 1):
             line_location += line_spacing * ScanGUI.SCALE_X
-            pygame.draw.line(self.field, 'white', (line_location, 0), (line_location, ScanGUI.SCREEN_HEIGHT),
-                             width=20)
-            self.draw_text(self.field, str(line_spacing * (i + 1)) + "'", 'black', line_location - ScanGUI.SCREEN_WIDTH / 50, 0.1 * ScanGUI.SCREEN_HEIGHT)
-            self.draw_text(self.field, str(line_spacing * (i + 1)) + "'", 'black', ScanGUI.SCREEN_WIDTH * 49 / 50 - line_location, 0.9 * ScanGUI.SCREEN_HEIGHT)
+            pygame.draw.line(background, 'white', transform.point((line_location, 0)),
+                             transform.point((line_location, ScanGUI.SCREEN_HEIGHT)), width=transform.length(20))
+            self.draw_text(background, str(line_spacing * (i + 1)) + "'", 'black',
+                           *transform.point((line_location - ScanGUI.SCREEN_WIDTH / 50, 0.1 * ScanGUI.SCREEN_HEIGHT)))
+            self.draw_text(background, str(line_spacing * (i + 1)) + "'", 'black',
+                           *transform.point((ScanGUI.SCREEN_WIDTH * 49 / 50 - line_location, 0.9 * ScanGUI.SCREEN_HEIGHT)))
 
         # Outline the field with white and black lines
-        pygame.draw.rect(self.field, 'white', (0, 0, ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT), width=20)
-        pygame.draw.rect(self.field, 'black', (0, 0, ScanGUI.SCREEN_WIDTH, ScanGUI.SCREEN_HEIGHT), width=5)
-        return
+        pygame.draw.rect(background, 'white', border, width=transform.length(20))
+        pygame.draw.rect(background, 'black', border, width=transform.length(5))
+
+        return background
+
+    def set_status(self, text):
+        """
+        Show a message in the middle of the field, or clear it.
+
+        :param text:    The message, or None to clear it
+        """
+
+        if text != self.status_text:
+            self.status_text = text
+            self.render_field()
+
+    def add_ui_element(self, ui_element):
+        """
+        Add an interactive UI element on top of the others.
+
+        :param ui_element:  A UIElement
+        """
+
+        self.ui_elements.append(ui_element)
+        self.hit_grid.insert(ui_element, ScanGUI._LAYER_UI_ELEMENTS)
+
+        if ui_element.focusable:
+            self.focus_order.append(ui_element)
+
+    def focus_next(self):
+        """
+        Move focus to the next element in the tab order, wrapping around at the end.
+        """
+
+        if not self.focus_order:
+            return
+
+        index = -1
+        if self.active_ui_element in self.focus_order:
+            index = self.focus_order.index(self.active_ui_element)
+
+        self.focus(self.focus_order[(index + 1) % len(self.focus_order)])
 
     def focus(self, ui_element):
         if ui_element is None:
@@ -133,29 +335,19 @@ class ScanGUI:
 
         if event.type == pygame.MOUSEBUTTONDOWN:
 
-            # Let's just treat the list of clickable UI elements like a queue. I'm sure this'll run faster than O(n^2)
-            # (He doesn't know)
-            for i in range(len(self.ui_elements)):
-
-                # Get the head of the queue and immediately re-enqueue it at the tail
-                ui_element = self.ui_elements.pop(0)
-                self.ui_elements.append(ui_element)
-                print(self.ui_elements)
-
-                # If this is the element that was clicked, select it
-                if ui_element.rect.collidepoint(event.pos):
+            # Only the topmost element under the mouse gets the click
+            hits = self.hit_grid.hit(self.transform.to_logical(event.pos))
+            if hits:
+                ui_element = hits[0]
 
-                    # If the element can be focused, switch focus to it
-                    if ui_element.focusable:
+                # If the element can be focused, switch focus to it
+                if ui_element.focusable:
 
-                        self.focus(ui_element)
+                    self.focus(ui_element)
 
-                    # Register the click
-                    self.active_ui_element.handle_click()
-                    event_handled = True
-
-                    # No need to keep checking elements after the clicked element has been found
-                    break
+                # Register the click
+                ui_element.handle_click()
+                event_handled = True
 
             if not event_handled:
                 self.focus(None)
@@ -171,8 +363,7 @@ class ScanGUI:
             if return_code == UIElement.ReturnCode.FOCUS_NEXT_ELEMENT:
 
                 # Select the next UI element
-                self.focus(self.ui_elements.pop(0))
-                self.ui_elements.append(self.active_ui_element)
+                self.focus_next()
 
             elif return_code == UIElement.ReturnCode.DEFOCUS_ME:
 
@@ -195,8 +386,9 @@ class ScanGUI:
         #input2.placeholder = ''
         robot = Robot((200, 200), (50, 50), 'receiver', '322')
 
-        self.ui_elements.extend([input1, input2, robot])
-        print(self.ui_elements)
+        for ui_element in [input1, input2, robot]:
+            self.add_ui_element(ui_element)
+        TRACE.debug('UI elements: %s', self.ui_elements)
 
         while True:
 
@@ -206,12 +398,13 @@ class ScanGUI:
                 self.handle_event(event)
 
             # Rendering
-            mat = self.field.copy()
+            self.screen.blit(self.field, (0, 0))
 
             for element in self.ui_elements:
-                element.draw_self(mat)
+                element.draw_self(self.screen, self.transform)
 
-            pygame.transform.scale(mat, self.screen.get_size(), self.screen)
+                # Drawing may resize an element, e.g. an InputBox growing to fit its text
+                self.hit_grid.update(element)
 
             self.clock.tick(ScanGUI.SIM_FPS)
             pygame.display.flip()
@@ -222,26 +415,274 @@ class ScanGUI:
         return 1 / self.avg_frame_interval
 
     def shutdown(self):
+        if ScanGUI.PROFILE_EXPORT and len(self.profiler):
+            self.profiler.export_csv(self.session_name + '_timing.csv')
+            self.profiler.export_json(self.session_name + '_timing.json')
+
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+        # Finish writing the recorded frames that are still queued
+        if self.recorder is not None:
+            self.recorder.close()
+            print('Recorded frames: ' + str(self.recorder.get_stats()))
+            self.recorder = None
+
         pygame.quit()
+
+        # Stop the receiver before closing the socket it is blocked on
+        if self.receiver is not None:
+            self.receiver.stop()
         self.cam_client.close()
 
     @staticmethod
     def draw_text(surf, text, text_col, x, y):
         # Function for text to be added on screen as an image
-        img = ScanGUI.TEXT_FONT.render(text, True, text_col)
+        img = TEXT.render(ScanGUI.TEXT_FONT, text, text_col)
         surf.blit(img, (x, y))
 
     @staticmethod
     def draw_text_center(surf, text, text_col, x, y):
 
-        img = ScanGUI.TEXT_FONT.render(text, True, text_col)
+        img = TEXT.render(ScanGUI.TEXT_FONT, text, text_col)
 
         new_x = x - img.get_width() / 2
         new_y = y - img.get_height() / 2
         surf.blit(img, (new_x, new_y))
 
+    def update_robots(self, bot_positions, ticks, capture_ticks=None):
+        """
+        Record the positions of a snapshot received from the camera server, move every robot to where it is estimated
+        to be now, and fade out and remove robots that haven't been reported recently.
+
+        :param bot_positions:   A dict of pattern name to [x, y] field coordinates. Empty if no new snapshot arrived.
+        :param ticks:           Current time in milliseconds
+        :param capture_ticks:   (Optional) Time in milliseconds, on the same clock as ticks, that the snapshot was
+                                captured. Defaults to ticks.
+        """
+
+        if capture_ticks is None:
+            capture_ticks = ticks
+
+        bot_names = []
+        points = []
+        for bot_pattern in bot_positions:
+            bot_name = bot_pattern
+            if bot_pattern in self.pattern_assigments.keys():
+                bot_name = self.pattern_assigments[bot_pattern]
+
+            point = bot_positions[bot_pattern]
+            if point is None:
+                continue
+
+            if len(point) != 2:
+                continue
+
+            bot_names.append(bot_name)
+            points.append(point)
+
+        # Transform the whole snapshot from field coordinates at once
+        if points:
+            transformed_points = self.transform.field_to_logical(numpy.array(points, dtype=numpy.float64)).tolist()
+        else:
+            transformed_points = []
+
+        for bot_name, point, transformed_point in zip(bot_names, points, transformed_points):
+            TRACE.debug('Point %s transformed to %s', point, transformed_point)
+
+            # Register the bot, instantiating it if this is the first time it was seen
+            self.robots.update(bot_name, transformed_point, ticks)
+            self.motion.add(bot_name, capture_ticks, transformed_point)
+
+            #pygame.draw.circle(mat, 'orange', transformed_point, 10)
+            #self.draw_text(mat, 'WR', 'black', transformed_point[0], transformed_point[1])
+            #pygame.draw.circle(mat, 'black', transformed_point, 10, width=1)
+
+        # Move every bot to where it is estimated to be now, even when no new snapshot arrived
+        for bot in self.robots:
+            pos = self.motion.position(bot.name, ticks)
+            if pos is not None:
+                bot.rect.x, bot.rect.y = pos
+            self.hit_grid.update(bot, ScanGUI._LAYER_ROBOTS)
+
+        # Fade out and remove bots the server has stopped reporting
+        for bot in self.robots.expire(ticks):
+            self.hit_grid.remove(bot)
+            self.motion.remove(bot.name)
+
+    def draw_dynamic(self, surf):
+        """
+        Draw everything on top of the static field: the cursor, the lines from the cursor to each robot, the robots and
+        the UI elements.
+
+        :param surf:    The Surface the static field was drawn on
+        :return:        A list of the Rects of the Surface that were drawn over
+        """
+
+        drawn_rects = []
+
+        # Draw the cursor on the screen as a rectangle
+        drawn_rects.append(pygame.draw.rect(surf, 'blue', self.transform.rect(self.cursor)))
+
+        cursor_x = self.cursor.x - self.cursor.width / 2
+        cursor_y = self.cursor.y + self.cursor.height / 2
+
+        for bot in self.robots:
+            # draw line from center of rectangle to center of QB
+            drawn_rects.append(pygame.draw.line(surf, 'black', self.transform.point(bot.rect.topleft),
+                                                self.transform.point((cursor_x, cursor_y)), 3))
+
+        # Write magnitude and angle from the cursor to each of the bots
+        '''if len(points) > 0:
+            self.draw_text(mat, '(' + str(points[0][0]) + ", " + str(points[0][1]) + ')', 'black', 720, 400)'''
+
+        for bot in self.robots:
+            drawn_rects.append(bot.draw_self(surf, self.transform))
+
+        # Interactive UI elements are drawn on top of the robots
+        for ui_element in self.ui_elements:
+            drawn_rects.append(ui_element.draw_self(surf, self.transform))
+            self.hit_grid.update(ui_element)
+
+        return drawn_rects
+
+    def render_frame(self, events, snapshot, now):
+        """
+        Run one frame of the render loop up to pushing it to the display: handle input events, move the robots and draw
+        everything that changed onto the screen.
+
+        :param events:      The pygame events received since the last frame
+        :param snapshot:    The cameraProtocol.Snapshot received since the last frame, or None if none arrived
+        :param now:         Current time in seconds on the clock snapshots are stamped with
+        :return:            The screen Surface that was drawn on. Call self.renderer.end_frame() to display it.
+        """
+
+        profiler = self.profiler
+
+        # Restore the regions drawn over last frame instead of copying the whole field
+        mat = self.renderer.begin_frame(self.field)
+        profiler.mark(ScanGUI.PHASE_RESTORE)
+
+        # Handle input events
+        for event in events:
+
+            # Exit the application upon clicking the OS's default app close button
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+
+            # Handle the clicking and dragging of the cursor
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:
+                    if self.cursor.collidepoint(self.transform.to_logical(event.pos)):
+                        self.cursor_dragging = True
+                        mouse_x, mouse_y = self.transform.to_logical(event.pos)
+                        self.cursor_offset = (self.cursor.x - mouse_x, self.cursor.y - mouse_y)
+
+            # Handle the release of the left mouse button, stopping the dragging of the cursor
+            elif event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1:
+                    self.cursor_dragging = False
+
+            elif event.type == pygame.MOUSEMOTION:
+                if self.cursor_dragging:
+                    mouse_x, mouse_y = self.transform.to_logical(event.pos)
+                    self.cursor.x = mouse_x + self.cursor_offset[0]
+                    self.cursor.y = mouse_y + self.cursor_offset[1]
+
+            # Re-render the static field at the new resolution. The renderer redraws in full for the new field.
+            elif event.type == pygame.VIDEORESIZE:
+                self.render_field()
+
+                if self.telemetry is not None:
+                    self.telemetry.ui_state(now, {'screen_size': self.screen.get_size()})
+
+            # The display contents may have been lost, so the next frame must be pushed in full
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.renderer.invalidate()
+
+            elif event.type == pygame.KEYDOWN and event.key == ScanGUI.PROFILE_OVERLAY_KEY:
+                self.profile_overlay = not self.profile_overlay
+
+            elif event.type == pygame.KEYDOWN and event.key == ScanGUI.TRACE_DUMP_KEY:
+                TRACE.dump(self.session_name + '_trace.log')
+
+        profiler.mark(ScanGUI.PHASE_EVENTS)
+
+        if self.telemetry is not None:
+            if snapshot is not None and snapshot.points:
+                self.telemetry.snapshot(now, snapshot.sequence, snapshot.points)
+            self.telemetry.cursor(now, self.cursor.x, self.cursor.y)
+
+        profiler.mark(ScanGUI.PHASE_TELEMETRY)
+
+        # Snapshots are stamped on the wall clock, so robots are timed on it too
+        if snapshot is not None:
+            self.update_robots(snapshot.points, now * 1000, snapshot.capture_time * 1000)
+        else:
+            self.update_robots({}, now * 1000)
+
+        profiler.mark(ScanGUI.PHASE_ROBOTS)
+
+        for rect in self.draw_dynamic(mat):
+            self.renderer.add(rect)
+
+        if self.profile_overlay:
+            self.renderer.add(self.draw_profile_overlay(mat))
+
+        profiler.mark(ScanGUI.PHASE_DRAW)
+
+        return mat
+
+    def draw_profile_overlay(self, surf):
+        """
+        Draw the average and worst time of each phase over the most recent frames in the top left corner. The text is
+        only re-rendered every PROFILE_OVERLAY_FRAMES frames, so showing the overlay barely adds to the draw phase.
+
+        :param surf:    The Surface to draw on
+        :return:        The Rect of the Surface that was drawn over
+        """
+
+        if self._profile_overlay_image is None or self.profiler.frames_profiled % ScanGUI.PROFILE_OVERLAY_FRAMES == 0:
+            summary = self.profiler.summary(ScanGUI.PROFILE_OVERLAY_FRAMES)
+
+            lines = ['{:<12}{:>8}{:>8}'.format('ms', 'avg', 'max')]
+            total_mean = total_max = 0
+            for phase in ScanGUI.PROFILE_COLUMNS:
+                mean, worst = summary[phase]['mean'], summary[phase]['max']
+                lines.append('{:<12}{:>8.2f}{:>8.2f}'.format(phase, mean, worst))
+                if phase not in (ScanGUI.PHASE_DECODE, ScanGUI.PHASE_IDLE, ScanGUI.SNAPSHOT_AGE):
+                    total_mean += mean
+                    total_max = max(total_max, worst)
+            lines.append('{:<12}{:>8.2f}{:>8.2f}'.format('busy', total_mean, total_max))
+
+            font = FONTS.get(None, 20)
+            images = [font.render(line, True, 'white') for line in lines]
+
+            image = pygame.Surface((max(image.get_width() for image in images) + 10,
+                                    sum(image.get_height() for image in images) + 10))
+            image.set_alpha(200)
+            y = 5
+            for line_image in images:
+                image.blit(line_image, (5, y))
+                y += line_image.get_height()
+
+            self._profile_overlay_image = image
+
+        return surf.blit(self._profile_overlay_image, (10, 10))
+
     def run(self, connect_attempt_limit=1):
+        """
+        Run a session: connect to the camera server and draw the robots it reports until the window is closed.
 
+        Connecting never blocks the render loop. Failed attempts are retried with backoff, and a lost connection is
+        reconnected straight away, keeping the window, robots and recording of the session.
+
+        :param connect_attempt_limit:   (Optional) Number of consecutive failed connection attempts after which to give
+                                        up. None never gives up.
+        :return:                        True if the server was connected when the session ended
+        """
 
         # Render the startup screen
         #self.startup()
@@ -251,13 +692,31 @@ class ScanGUI:
         num_frames_saved = 0
         cumulative_frame_overshoot = 0
 
+        if ScanGUI.RECORD_TELEMETRY:
+            self.telemetry = TelemetryWriter(self.session_name + '.sstl', metadata={
+                'SCREEN_WIDTH': ScanGUI.SCREEN_WIDTH,
+                'SCREEN_HEIGHT': ScanGUI.SCREEN_HEIGHT,
+                'FIELD_LENGTH': ScanGUI.FIELD_LENGTH,
+                'FIELD_WIDTH': ScanGUI.FIELD_WIDTH,
+                'pattern_assigments': ScanGUI.pattern_assigments,
+            })
+            self.telemetry.ui_state(time.time(), {'screen_size': self.screen.get_size()})
+
         # Determine whether to record the session based on the given frame rate
         record = False
         frame_interval = math.inf
 
         frame_rate = 4#self.config['FPS']
 
-        if frame_rate > 0:
+        if frame_rate > 0 and ScanGUI.RECORD_MODE == ScanGUI.RECORD_MODE_VIDEO:
+            frame_interval = 1 / frame_rate
+            record = True
+
+            # Frames are encoded into the video on a writer thread as they are recorded
+            self.recorder = VideoRecorder(self.session_name + '.mp4', frame_rate,
+                                          queue_size=ScanGUI.RECORD_QUEUE_SIZE, policy=ScanGUI.RECORD_QUEUE_POLICY)
+
+        elif frame_rate > 0:
             frame_interval = 1 / frame_rate
             record = True
 
@@ -271,129 +730,91 @@ class ScanGUI:
             # Make the folder using the provided session name
             os.makedirs(self.session_name)
 
+            # Frames are encoded and written to the folder on a writer thread, off the render path
+            self.recorder = FrameRecorder(self.session_name, queue_size=ScanGUI.RECORD_QUEUE_SIZE,
+                                          policy=ScanGUI.RECORD_QUEUE_POLICY)
+
         # Get the start time of the session
         start = time.time()
         mark = start
 
-        cursor_dragging = False
-        offset_x = offset_y = 0
-
         run = True
         connected = False
+        last_sequence = None
+        newest_snapshot = None
         while run:
 
-            # Attempt to connect to the camera server
+            # Advance the connection to the camera server without waiting for it
             if not connected:
-                try:
-                    self.config = self.cam_client.connect()
+                failed_attempts = self.cam_client.failed_attempts
+
+                if self.cam_client.poll_connect() == CameraClient.STATE_CONNECTED:
                     connected = True
-                    self.reset_field()
-                # Handle the error that is raised when the server doesn't accept the connection
-                except ConnectionRefusedError as e:
+                    self.config = self.cam_client.config
+                    TRACE.info('Connected to camera server with config %s', self.config)
+                    self.set_status(None)
 
-                    # Update the number of attempts left until the client gives up on making the connection
-                    connect_attempt_limit -= 1
+                    # Hand the socket to a background receiver so the render loop never waits on the network
+                    self.receiver = CameraReceiver(self.cam_client)
+                    self.receiver.start()
 
-                    self.reset_field()
-                    self.draw_text_center(self.field, 'Waiting for server. Number of attempts left: ' +
-                                          str(connect_attempt_limit), 'black', self.screen.get_width() / 2,
-                                          self.screen.get_height() / 2)
+                elif self.cam_client.failed_attempts > failed_attempts:
+                    failed_attempts = self.cam_client.failed_attempts
 
-                    if connect_attempt_limit < 1:
+                    if connect_attempt_limit is None:
+                        self.set_status('Waiting for server. Failed attempts: ' + str(failed_attempts))
+                    elif failed_attempts >= connect_attempt_limit:
                         break
+                    else:
+                        self.set_status('Waiting for server. Number of attempts left: ' +
+                                        str(connect_attempt_limit - failed_attempts))
 
-            mat = self.field.copy()
+            self.profiler.begin_frame()
 
-            # Receive the points representing detected bots from the camera server
-            bot_positions = []
+            # Get the newest points representing detected bots from the camera server without waiting for the network
+            sequence = last_sequence
 
             if connected:
-                bot_positions = self.cam_client.receive_points()
-
-            # Draw the cursor on the screen as a rectangle
-            pygame.draw.rect(mat, 'blue', self.cursor)
-
-            # Handle input events
-            for event in pygame.event.get():
-
-                # Exit the application upon clicking the OS's default app close button
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-                # Handle the clicking and dragging of the cursor
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        if self.cursor.collidepoint(event.pos):
-                            cursor_dragging = True
-                            mouse_x, mouse_y = event.pos
-                            offset_x = self.cursor.x - mouse_x
-                            offset_y = self.cursor.y - mouse_y
-
-                # Handle the release of the left mouse button, stopping the dragging of the cursor
-                elif event.type == pygame.MOUSEBUTTONUP:
-                    if event.button == 1:
-                        cursor_dragging = False
-
-                elif event.type == pygame.MOUSEMOTION:
-                    if cursor_dragging:
-                        mouse_x, mouse_y = event.pos
-                        self.cursor.x = mouse_x + offset_x
-                        self.cursor.y = mouse_y + offset_y
-
-            for bot_pattern in bot_positions:
-                bot_name = bot_pattern
-                if bot_pattern in self.pattern_assigments.keys():
-                    bot_name = self.pattern_assigments[bot_pattern]
-
-                bot_exists = False
-
-                point = bot_positions[bot_pattern]
-                if point is None:
-                    continue
-
-                if len(point) != 2:
-                    continue
-
-                print('Point before transformation: ' + str(point))
-                transformed_point = (point[0] * ScanGUI.SCALE_X, ScanGUI.SCREEN_HEIGHT - point[1] * ScanGUI.SCALE_Y)
-                print('Point after transformation: ' + str(transformed_point))
-
-                # Check to see if the bot has already been instantiated in the simulation
-                for ui_element in self.ui_elements:
-                    if isinstance(ui_element, Robot):
-                        if ui_element.name == bot_name:
-                            bot = ui_element
-                            bot.rect.x, bot.rect.y = transformed_point
-
-                            bot_exists = True
-
-                # If the bot hasn't been instantiated, get on that
-                if not bot_exists:
-                    bot = Robot(transformed_point, (50, 50), 'receiver', bot_name)
-                    self.ui_elements.append(bot)
-
-                #pygame.draw.circle(mat, 'orange', transformed_point, 10)
-                #self.draw_text(mat, 'WR', 'black', transformed_point[0], transformed_point[1])
-                #pygame.draw.circle(mat, 'black', transformed_point, 10, width=1)
-
-                cursor_x = self.cursor.x - self.cursor.width / 2
-                cursor_y = self.cursor.y + self.cursor.height / 2
-
-                # draw line from center of rectangle to center of QB
-                pygame.draw.line(mat, 'black', transformed_point, (cursor_x, cursor_y), 3)
-
-            # Write magnitude and angle from the cursor to each of the bots
-            '''if len(points) > 0:
-                self.draw_text(mat, '(' + str(points[0][0]) + ", " + str(points[0][1]) + ')', 'black', 720, 400)'''
+                try:
+                    self.receiver.raise_error()
+                    sequence, newest_snapshot = self.receiver.latest()
+
+                # The receiver has stopped on a dead or closed connection. Reconnect without tearing anything down;
+                # the robots fade out as usual until snapshots arrive again. Malformed snapshots end the connection
+                # the same way.
+                except (OSError, ValueError, KeyError, TypeError, struct.error) as e:
+                    self.cam_client.disconnect(e)
+                    self.receiver = None
+                    connected = False
+                    sequence = last_sequence = None
+                    newest_snapshot = None
+                    self.set_status('Connection lost, reconnecting...')
+
+            # New positions only need to be recorded when a new snapshot has arrived
+            snapshot = None
+            if sequence != last_sequence:
+                snapshot = newest_snapshot
+            last_sequence = sequence
+
+            now = time.time()
+            self.profiler.mark(ScanGUI.PHASE_NETWORK)
+
+            if snapshot is not None:
+                self.profiler.record(ScanGUI.PHASE_DECODE, self.cam_client.decode_time)
+            if newest_snapshot is not None:
+                self.profiler.record(ScanGUI.SNAPSHOT_AGE, now - newest_snapshot.capture_time)
+
+            mat = self.render_frame(pygame.event.get(), snapshot, now)
 
-            for ui_element in self.ui_elements:
-                ui_element.draw_self(mat)
+            self.clock.tick(ScanGUI.SIM_FPS)
+            self.profiler.mark(ScanGUI.PHASE_IDLE)
 
-            pygame.transform.scale(mat, self.screen.get_size(), self.screen)
+            self.renderer.end_frame()
+            self.profiler.mark(ScanGUI.PHASE_FLIP)
 
-            self.clock.tick(ScanGUI.SIM_FPS)
-            pygame.display.flip()
+            if not STARTUP.reported:
+                STARTUP.mark('first frame')
+                STARTUP.report()
 
 
             # Recording things
@@ -408,8 +829,10 @@ class ScanGUI:
                     cumulative_frame_overshoot += now - mark
                     mark = now + frame_interval
 
-                    pygame.image.save(mat, self.session_name + '/' + str(now) + '.jpg')
-                    num_frames_saved += 1
+                    if self.recorder.submit(mat, now):
+                        num_frames_saved += 1
+
+                self.profiler.mark(ScanGUI.PHASE_RECORD)
 
                 avg_frame_rate = self.save_frame_rate
 
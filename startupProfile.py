@@ -0,0 +1,79 @@
+"""
+Timings of the steps between starting the application and drawing its first frame.
+
+Import this module before anything else so its clock starts as early as possible, mark each step as it finishes and
+report once the first frame is on screen:
+
+    from startupProfile import STARTUP
+
+    STARTUP.mark('imports')
+    ...
+    STARTUP.report()
+"""
+
+import time
+
+from traceBuffer import TRACE
+
+
+class StartupProfile:
+    """
+    StartupProfile class
+
+    Records how long after the profile was created each named startup step finished, and how long each step took.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []
+        self.reported = False
+
+        # Print the report as well as tracing it
+        self.verbose = False
+
+    def mark(self, step):
+        """
+        Record that a startup step has finished. Steps marked after the report are ignored, so code that also runs
+        after startup may mark freely.
+
+        :param step:    Name of the step
+        """
+
+        if not self.reported:
+            self.steps.append((step, time.perf_counter()))
+
+    def timings(self):
+        """
+        :return:    A list of (step, seconds since start, seconds since the previous step) tuples, in order
+        """
+
+        timings = []
+        previous = self.start
+        for step, finished in self.steps:
+            timings.append((step, finished - self.start, finished - previous))
+            previous = finished
+
+        return timings
+
+    def report(self):
+        """
+        Trace the timings, and print them if verbose is set. Only the first call reports anything.
+        """
+
+        if self.reported:
+            return
+        self.reported = True
+
+        lines = ['{:<20}{:>10}{:>10}'.format('startup step', 'at ms', 'took ms')]
+        for step, since_start, took in self.timings():
+            lines.append('{:<20}{:>10.1f}{:>10.1f}'.format(step, since_start * 1000, took * 1000))
+
+        for line in lines:
+            TRACE.info('%s', line)
+
+        if self.verbose:
+            print('\n'.join(lines))
+
+
+# Process-wide startup profile, started when this module is first imported
+STARTUP = StartupProfile()
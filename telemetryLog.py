@@ -0,0 +1,377 @@
+"""
+Compact, append-only telemetry log of a GUI session.
+
+Instead of rendered frames, a session is recorded as the snapshots received from the camera server plus the cursor
+position and UI state, which is enough to re-render any frame. The log starts with a header followed by records:
+
+    header      magic (4 bytes, b'SSTL') | version (uint16) | metadata length (uint32) | metadata (JSON)
+    record      type (uint8) | timestamp (float64) | body
+
+    SNAPSHOT    sequence (uint32) | count (uint16) | count x [pattern id (uint16) | x (float32) | y (float32)]
+    CURSOR      x (float32) | y (float32)
+    UI          length (uint16) | state (JSON)
+    NAME        pattern id (uint16) | length (uint16) | name (UTF-8)
+
+Pattern names are written once as NAME records, before the first snapshot that uses them. Timestamps are in seconds.
+
+A sidecar <log>.idx file holds a seek index: an entry with the timestamp and log offset of a snapshot is appended
+periodically, along with a copy of each NAME record, so a reader can jump to any point of the session without scanning
+the log. The next cursor record after an indexed snapshot is always written, even if the cursor didn't move, so the full
+state is known from every seek point. The log is flushed whenever an index entry is written.
+"""
+
+import bisect
+import json
+import struct
+
+
+MAGIC = b'SSTL'
+VERSION = 1
+
+FILE_HEADER = struct.Struct('<4sHI')
+RECORD_HEADER = struct.Struct('<Bd')
+
+# Record types and bodies
+RECORD_SNAPSHOT = 1
+RECORD_CURSOR = 2
+RECORD_UI = 3
+RECORD_NAME = 4
+
+SNAPSHOT_HEADER = struct.Struct('<IH')
+POINT = struct.Struct('<Hff')
+CURSOR = struct.Struct('<ff')
+LENGTH = struct.Struct('<H')
+NAME_HEADER = struct.Struct('<HH')
+
+# Index entries
+INDEX_SEEK = 1
+INDEX_NAME = 2
+
+INDEX_ENTRY = struct.Struct('<BdQ')
+
+
+class TelemetryWriter:
+    """
+    TelemetryWriter class
+
+    Appends records to a telemetry log. Writes are buffered, so recording costs a few struct packs per frame.
+    """
+
+    DEFAULT_INDEX_INTERVAL = 1.0
+
+    def __init__(self, path, metadata=None, index_interval=DEFAULT_INDEX_INTERVAL):
+        """
+        :param path:            Path of the log file to create. The index is written to <path>.idx.
+        :param metadata:        (Optional) JSON serializable dict stored in the header, e.g. the field dimensions
+        :param index_interval:  (Optional) Seconds between seek index entries
+        """
+
+        self.path = path
+        self.index_interval = index_interval
+
+        self._log = open(path, 'wb')
+        self._index = open(path + '.idx', 'wb')
+
+        metadata_bytes = json.dumps(metadata or {}).encode()
+        self._log.write(FILE_HEADER.pack(MAGIC, VERSION, len(metadata_bytes)) + metadata_bytes)
+
+        self._pattern_ids = {}
+        self._next_index_time = None
+        self._last_cursor = None
+
+    def _pattern_id(self, name, timestamp):
+        """
+        :param name:        Name of a pattern
+        :param timestamp:   Time of the record that uses the pattern
+        :return:            The pattern's id, writing a NAME record first if it is new
+        """
+
+        pattern_id = self._pattern_ids.get(name)
+        if pattern_id is None:
+            pattern_id = self._pattern_ids[name] = len(self._pattern_ids)
+
+            encoded = str(name).encode()
+            record = RECORD_HEADER.pack(RECORD_NAME, timestamp) + NAME_HEADER.pack(pattern_id, len(encoded)) + encoded
+            self._log.write(record)
+            self._index.write(INDEX_ENTRY.pack(INDEX_NAME, timestamp, pattern_id) + LENGTH.pack(len(encoded)) + encoded)
+
+        return pattern_id
+
+    def snapshot(self, timestamp, sequence, points):
+        """
+        Append a snapshot received from the camera server.
+
+        :param timestamp:   Time the snapshot was received
+        :param sequence:    Sequence number of the snapshot
+        :param points:      A dict of pattern name to [x, y] field coordinates. Invalid points are skipped.
+        """
+
+        body = bytearray()
+        count = 0
+        for name, point in points.items():
+            if point is None or len(point) != 2:
+                continue
+            body += POINT.pack(self._pattern_id(name, timestamp), point[0], point[1])
+            count += 1
+
+        # Index snapshots periodically, so a reader can start at one
+        if self._next_index_time is None or timestamp >= self._next_index_time:
+            self._log.flush()
+            self._index.write(INDEX_ENTRY.pack(INDEX_SEEK, timestamp, self._log.tell()))
+            self._index.flush()
+            self._next_index_time = timestamp + self.index_interval
+
+            # Repeat the cursor position after the seek point
+            self._last_cursor = None
+
+        self._log.write(RECORD_HEADER.pack(RECORD_SNAPSHOT, timestamp) +
+                        SNAPSHOT_HEADER.pack(sequence & 0xFFFFFFFF, count) + body)
+
+    def cursor(self, timestamp, x, y):
+        """
+        Append the cursor position if it changed since it was last recorded.
+
+        :param timestamp:   Time of the frame
+        :param x:           x position of the cursor
+        :param y:           y position of the cursor
+        """
+
+        if (x, y) == self._last_cursor:
+            return
+
+        self._last_cursor = (x, y)
+        self._log.write(RECORD_HEADER.pack(RECORD_CURSOR, timestamp) + CURSOR.pack(x, y))
+
+    def ui_state(self, timestamp, state):
+        """
+        Append a change of UI state.
+
+        :param timestamp:   Time of the change
+        :param state:       JSON serializable dict describing the change
+        """
+
+        encoded = json.dumps(state).encode()
+        self._log.write(RECORD_HEADER.pack(RECORD_UI, timestamp) + LENGTH.pack(len(encoded)) + encoded)
+
+    def close(self):
+        self._log.close()
+        self._index.close()
+
+
+class TelemetryReader:
+    """
+    TelemetryReader class
+
+    Reads a telemetry log, optionally starting from a point in time found through the seek index.
+    """
+
+    def __init__(self, path):
+        """
+        :param path:    Path of the log file
+        """
+
+        self.path = path
+
+        with open(path, 'rb') as log:
+            magic, version, metadata_length = FILE_HEADER.unpack(log.read(FILE_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(path + ' is not a telemetry log')
+            if version != VERSION:
+                raise ValueError('Unsupported telemetry log version ' + str(version))
+
+            self.metadata = json.loads(log.read(metadata_length))
+            self._data_offset = FILE_HEADER.size + metadata_length
+
+        self.names = {}
+        self._seek_times = []
+        self._seek_offsets = []
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.path + '.idx', 'rb') as index:
+                data = index.read()
+        except FileNotFoundError:
+            return
+
+        offset = 0
+        while offset + INDEX_ENTRY.size <= len(data):
+            kind, timestamp, value = INDEX_ENTRY.unpack_from(data, offset)
+            offset += INDEX_ENTRY.size
+
+            if kind == INDEX_SEEK:
+                self._seek_times.append(timestamp)
+                self._seek_offsets.append(value)
+            elif kind == INDEX_NAME:
+                if offset + LENGTH.size > len(data):
+                    break
+                length, = LENGTH.unpack_from(data, offset)
+                self.names[value] = data[offset + LENGTH.size:offset + LENGTH.size + length].decode()
+                offset += LENGTH.size + length
+
+    def get_time_range(self):
+        """
+        :return:    (first, last) timestamps of the records in the log, or None if it has no records
+        """
+
+        first = last = None
+        for _, timestamp, _ in self._raw_records(seek_time=self._seek_times[-1] if self._seek_times else None):
+            last = timestamp
+
+        for _, timestamp, _ in self._raw_records():
+            first = timestamp
+            break
+
+        if first is None:
+            return None
+
+        return first, last
+
+    def _start_offset(self, start_time):
+        """
+        :param start_time:  Time to start reading from, or None to read from the beginning
+        :return:            Offset of the last indexed snapshot at or before start_time
+        """
+
+        if start_time is None:
+            return self._data_offset
+
+        i = bisect.bisect_right(self._seek_times, start_time) - 1
+        if i < 0:
+            return self._data_offset
+
+        return self._seek_offsets[i]
+
+    def _raw_records(self, start_time=None, end_time=None, seek_time=None):
+        """
+        Iterate over the records of the log in order, leaving snapshot points packed. A truncated record at the end of
+        the log, e.g. after a crash, ends the iteration.
+
+        :param start_time:  (Optional) Skip records before this time
+        :param end_time:    (Optional) Stop at the first record after this time
+        :param seek_time:   (Optional) Start at the last seek point at or before this time, without skipping records
+        :return:            A generator of (record type, timestamp, value) tuples. Snapshots are (sequence, packed
+                            points), cursors are (x, y) and UI states are dicts. NAME records are not yielded.
+        """
+
+        with open(self.path, 'rb') as log:
+            log.seek(self._start_offset(start_time if seek_time is None else seek_time))
+            data = log.read()
+
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            record_type, timestamp = RECORD_HEADER.unpack_from(data, offset)
+            body = offset + RECORD_HEADER.size
+
+            try:
+                if record_type == RECORD_SNAPSHOT:
+                    sequence, count = SNAPSHOT_HEADER.unpack_from(data, body)
+                    points_start = body + SNAPSHOT_HEADER.size
+                    offset = points_start + count * POINT.size
+                    value = (sequence, data[points_start:offset])
+
+                elif record_type == RECORD_CURSOR:
+                    value = CURSOR.unpack_from(data, body)
+                    offset = body + CURSOR.size
+
+                elif record_type == RECORD_UI:
+                    length, = LENGTH.unpack_from(data, body)
+                    offset = body + LENGTH.size + length
+                    value = data[body + LENGTH.size:offset]
+
+                elif record_type == RECORD_NAME:
+                    pattern_id, length = NAME_HEADER.unpack_from(data, body)
+                    offset = body + NAME_HEADER.size + length
+                    value = data[body + NAME_HEADER.size:offset]
+
+                else:
+                    raise ValueError('Unknown telemetry record type ' + str(record_type))
+
+            except struct.error:
+                return
+
+            if offset > len(data):
+                return
+
+            if record_type == RECORD_NAME:
+                self.names[pattern_id] = value.decode()
+                continue
+            if record_type == RECORD_UI:
+                value = json.loads(value)
+
+            if start_time is not None and timestamp < start_time:
+                continue
+            if end_time is not None and timestamp > end_time:
+                return
+
+            yield record_type, timestamp, value
+
+    def records(self, start_time=None, end_time=None, seek_time=None):
+        """
+        Iterate over the records of the log in order.
+
+        :param start_time:  (Optional) Skip records before this time
+        :param end_time:    (Optional) Stop at the first record after this time
+        :param seek_time:   (Optional) Start at the last seek point at or before this time, without skipping records.
+                            The records up to seek_time describe the full state at that time.
+        :return:            A generator of (record type, timestamp, value) tuples. Snapshots are (sequence, dict of
+                            name to (x, y)), cursors are (x, y) and UI states are dicts.
+        """
+
+        for record_type, timestamp, value in self._raw_records(start_time, end_time, seek_time):
+            if record_type == RECORD_SNAPSHOT:
+                sequence, packed = value
+                value = (sequence, {self.names.get(pattern_id, str(pattern_id)): (x, y)
+                                    for pattern_id, x, y in POINT.iter_unpack(packed)})
+
+            yield record_type, timestamp, value
+
+    def to_arrays(self, start_time=None, end_time=None):
+        """
+        Read the log into NumPy arrays for analysis.
+
+        :param start_time:  (Optional) Skip records before this time
+        :param end_time:    (Optional) Skip records after this time
+        :return:            A dict with:
+                            'points'    structured array with one row per detected pattern per snapshot, with fields
+                                        timestamp, sequence, pattern_id, x and y
+                            'cursor'    structured array of cursor positions with fields timestamp, x and y
+                            'ui'        list of (timestamp, state dict) tuples
+                            'names'     dict of pattern id to pattern name
+        """
+
+        import numpy
+
+        packed_point_type = numpy.dtype([('pattern_id', '<u2'), ('x', '<f4'), ('y', '<f4')])
+        point_type = numpy.dtype([('timestamp', '<f8'), ('sequence', '<u4'), ('pattern_id', '<u2'), ('x', '<f4'),
+                                  ('y', '<f4')])
+        cursor_type = numpy.dtype([('timestamp', '<f8'), ('x', '<f4'), ('y', '<f4')])
+
+        snapshots = []
+        cursor = []
+        ui = []
+
+        for record_type, timestamp, value in self._raw_records(start_time, end_time):
+            if record_type == RECORD_SNAPSHOT:
+                snapshots.append((timestamp, value[0], numpy.frombuffer(value[1], dtype=packed_point_type)))
+            elif record_type == RECORD_CURSOR:
+                cursor.append((timestamp,) + tuple(value))
+            elif record_type == RECORD_UI:
+                ui.append((timestamp, value))
+
+        points = numpy.empty(sum(len(packed) for _, _, packed in snapshots), dtype=point_type)
+        row = 0
+        for timestamp, sequence, packed in snapshots:
+            rows = slice(row, row + len(packed))
+            points['timestamp'][rows] = timestamp
+            points['sequence'][rows] = sequence
+            for field in packed_point_type.names:
+                points[field][rows] = packed[field]
+            row += len(packed)
+
+        return {
+            'points': points,
+            'cursor': numpy.array(cursor, dtype=cursor_type),
+            'ui': ui,
+            'names': dict(self.names),
+        }
@@ -0,0 +1,158 @@
+"""
+Levelled trace of what the application is doing, kept in memory instead of written to the terminal.
+
+Enabled events are appended to a fixed-size ring buffer along with their unformatted arguments; they are only formatted
+when the buffer is dumped, on demand or when the application crashes. Calls at disabled levels are bound to a function
+that does nothing, so tracing every point of every frame costs little more than the call when it is turned off.
+
+    from traceBuffer import TRACE
+
+    TRACE.debug('Point %s transformed to %s', point, transformed_point)
+    TRACE.dump()
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+
+
+# The same values as the logging module's levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+
+def _discard(*args):
+    pass
+
+
+class TraceBuffer:
+    """
+    TraceBuffer class
+
+    Ring buffer of the most recent trace events. Appending is thread-safe, so the receiver and writer threads may trace
+    alongside the render loop.
+    """
+
+    def __init__(self, capacity=4096, level=INFO):
+        """
+        :param capacity:    (Optional) Number of most recent events kept
+        :param level:       (Optional) Lowest level of events kept. OFF keeps nothing.
+        """
+
+        self._events = deque(maxlen=capacity)
+        self.level = None
+        self.set_level(level)
+
+    def set_level(self, level):
+        """
+        :param level:   Lowest level of events kept. OFF keeps nothing.
+        """
+
+        self.level = level
+
+        # Disabled levels skip even the call into _add
+        self.debug = self._logger(DEBUG) if level <= DEBUG else _discard
+        self.info = self._logger(INFO) if level <= INFO else _discard
+        self.warning = self._logger(WARNING) if level <= WARNING else _discard
+        self.error = self._logger(ERROR) if level <= ERROR else _discard
+
+    def enabled(self, level):
+        """
+        Check whether events at a level are kept, to skip preparing arguments that are expensive to compute.
+
+        :param level:   A level
+        :return:        True if events at the level are kept
+        """
+
+        return level >= self.level
+
+    def _logger(self, level):
+        events = self._events
+
+        def log(message, *args):
+            """
+            Keep an event. The message is %-formatted with the args when the buffer is dumped.
+
+            :param message: Message, optionally with % placeholders
+            :param args:    Values for the placeholders
+            """
+
+            events.append((time.time(), level, threading.current_thread().name, message, args))
+
+        return log
+
+    def __len__(self):
+        return len(self._events)
+
+    def clear(self):
+        self._events.clear()
+
+    def lines(self):
+        """
+        :return:    The kept events as formatted lines, oldest first
+        """
+
+        lines = []
+        for timestamp, level, thread_name, message, args in list(self._events):
+            if args:
+                try:
+                    message = message % args
+                except (TypeError, ValueError):
+                    message = message + ' ' + repr(args)
+
+            lines.append(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) +
+                         '.{:03d}'.format(int(timestamp % 1 * 1000)) + ' ' + LEVEL_NAMES.get(level, str(level)) +
+                         ' [' + thread_name + '] ' + str(message))
+
+        return lines
+
+    def dump(self, file=None):
+        """
+        Write the kept events, oldest first.
+
+        :param file:    (Optional) A path or file object to write to. Defaults to stderr.
+        """
+
+        text = ''.join(line + '\n' for line in self.lines())
+
+        if file is None:
+            sys.stderr.write(text)
+        elif isinstance(file, str):
+            with open(file, 'w') as trace_file:
+                trace_file.write(text)
+        else:
+            file.write(text)
+
+    def install_crash_handler(self, file=None):
+        """
+        Dump the kept events when an exception goes unhandled in any thread, before it is reported as usual.
+
+        :param file:    (Optional) A path or file object to dump to. Defaults to stderr.
+        """
+
+        previous_excepthook = sys.excepthook
+        previous_thread_excepthook = threading.excepthook
+
+        def excepthook(exc_type, exc_value, exc_traceback):
+            self.error('Unhandled %s: %s', exc_type.__name__, exc_value)
+            self.dump(file)
+            previous_excepthook(exc_type, exc_value, exc_traceback)
+
+        def thread_excepthook(args):
+            self.error('Unhandled %s in thread %s: %s', args.exc_type.__name__,
+                       args.thread.name if args.thread is not None else '?', args.exc_value)
+            self.dump(file)
+            previous_thread_excepthook(args)
+
+        sys.excepthook = excepthook
+        threading.excepthook = thread_excepthook
+
+
+# Process-wide trace
+TRACE = TraceBuffer()